@@ -12,6 +12,7 @@ import type {
 interface BlockchainAuthData {
   address: string;
   signature: string;
+  nonce: string;
 }
 
 type AuthService = {
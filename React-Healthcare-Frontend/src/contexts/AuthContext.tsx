@@ -120,7 +120,8 @@ export function AuthProvider({ children }: { children: ReactNode }) {
       const signature = await signer.signMessage(message);
       
       if (signature) {
-        const response = await authService.authenticate({ address, signature });
+        // Send back the nonce that was signed; the server keeps no per-wallet login state
+        const response = await authService.authenticate({ address, signature, nonce: nonceResponse.nonce });
         setUser(response.user);
         setIsAuthenticated(true);
         localStorage.setItem('token', response.token);
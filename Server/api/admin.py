@@ -1,9 +1,10 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Appointment, Doctor, Patient, BlockchainUser
+from .models import Appointment, Doctor, Patient, BlockchainUser, ChainCheckpoint
 
 admin.site.register(Doctor)
 admin.site.register(Patient)
 admin.site.register(Appointment)
-admin.site.register(BlockchainUser)
\ No newline at end of file
+admin.site.register(BlockchainUser)
+admin.site.register(ChainCheckpoint)
\ No newline at end of file
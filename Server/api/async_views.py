@@ -0,0 +1,251 @@
+import json
+import logging
+from datetime import datetime
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from api.models import Appointment, Doctor, Patient
+from .authentication import CachedJWTAuthentication
+from .permissions import IsDoctorRole, IsPatientRole, PatientOwnsAppointment
+from .serializers import AppointmentSerializer
+from .services.async_blockchain import get_async_blockchain_service
+from .services.availability import SlotUnavailable, get_availability_index
+from .services.receipts import get_receipt_tracker
+from .views import save_booking, wait_for_receipts, with_trace
+
+logger = logging.getLogger(__name__)
+
+# Async variants of the AppointmentView writes. DRF 3.13 views are synchronous, so these are
+# plain Django async views: the chain calls are awaited on the event loop and only the short
+# ORM steps run in a thread through sync_to_async.
+
+
+def forbidden(permission):
+    return JsonResponse({"detail": permission.message}, status=status.HTTP_403_FORBIDDEN)
+
+
+def async_api_view(methods, permissions=()):
+    """Async stand-in for DRF's @api_view: method check, JWT authentication and token role permissions"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse({"detail": f'Method "{request.method}" not allowed.'},
+                                    status=status.HTTP_405_METHOD_NOT_ALLOWED)
+            try:
+                user_auth = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+            except APIException as e:
+                detail = e.detail if isinstance(e.detail, dict) else {"detail": e.detail}
+                return JsonResponse(detail, status=e.status_code)
+            if user_auth is None:
+                return JsonResponse({"detail": "Authentication credentials were not provided."},
+                                    status=status.HTTP_401_UNAUTHORIZED)
+            request.user, request.auth = user_auth
+            for permission_class in permissions:
+                permission = permission_class()
+                if not permission.has_permission(request, view):
+                    return forbidden(permission)
+            return await view(request, *args, **kwargs)
+
+        # Token auth like the DRF views; Django 4.0's csrf_exempt would hide the coroutine
+        wrapped.csrf_exempt = True
+        return wrapped
+    return decorator
+
+
+def request_data(request):
+    if request.content_type == 'application/json':
+        return json.loads(request.body or b'{}')
+    return request.POST.dict()
+
+
+def save_created_appointment(data, doctor, patient, blockchain_result):
+    appointment_data = {key: value for key, value in data.items() if key not in ('docID', 'patID')}
+    appointment_data['blockchain_id'] = blockchain_result.get('appointment_id')
+    appointment_data['blockchain_tx'] = blockchain_result['transaction_hash']
+    blockchain_status = blockchain_result.get('status', 'confirmed')
+
+    serializer = AppointmentSerializer(data=appointment_data)
+    if not serializer.is_valid():
+        logger.error(f"Serializer errors: {serializer.errors}")
+        return {"status": "error", "data": serializer.errors}, status.HTTP_400_BAD_REQUEST
+
+    save_booking(
+        lambda booking_status: serializer.save(
+            doctor=doctor, patient=patient, blockchain_status=booking_status, blockchain_action='create'
+        ),
+        blockchain_status, doctor, serializer.validated_data['date'], serializer.validated_data['time'],
+        blockchain_result['transaction_hash']
+    )
+    if blockchain_status == 'pending':
+        get_receipt_tracker().track()
+    return {
+        "status": "success",
+        "data": serializer.data,
+        "blockchain": with_trace({
+            "id": blockchain_result.get('appointment_id'),
+            "transaction": blockchain_result['transaction_hash'],
+            "status": blockchain_status
+        }, blockchain_result)
+    }, status.HTTP_200_OK
+
+
+def save_completed_appointment(appointment, blockchain_result):
+    appointment.blockchain_tx = blockchain_result['transaction_hash']
+    appointment.blockchain_action = 'complete'
+    if blockchain_result.get('status') == 'pending':
+        # The receipt tracker marks the appointment completed once mined
+        appointment.action_status = 'pending'
+        appointment.save()
+        get_receipt_tracker().track()
+    else:
+        appointment.status = True
+        appointment.action_status = 'confirmed'
+        appointment.save()
+
+
+def save_cancelled_appointment(appointment, blockchain_result):
+    if blockchain_result.get('status') == 'pending':
+        # The receipt tracker deletes the appointment once the cancellation is mined
+        appointment.blockchain_tx = blockchain_result['transaction_hash']
+        appointment.action_status = 'pending'
+        appointment.blockchain_action = 'cancel'
+        appointment.save()
+        get_receipt_tracker().track()
+    else:
+        appointment.delete()
+
+
+@async_api_view(['POST'], permissions=[IsPatientRole])
+async def appointmentAsync(request):
+    hold = None
+    try:
+        data = request_data(request)
+        doctor = await sync_to_async(Doctor.objects.get)(docID=data.get('docID'))
+        patient = await sync_to_async(Patient.objects.get)(patID=data.get('patID'))
+
+        patient_address = data.get('patient_address')
+        if not patient_address:
+            return JsonResponse({"error": "Patient blockchain address is required"},
+                                status=status.HTTP_400_BAD_REQUEST)
+        if not doctor.address:
+            return JsonResponse(
+                {"error": "Doctor blockchain address is not set. Please update the doctor's blockchain address."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        appointment_date = data.get('date')
+        appointment_time = data.get('time')
+        appointment_datetime = datetime.combine(
+            datetime.strptime(appointment_date, '%Y-%m-%d').date(),
+            datetime.strptime(appointment_time, '%H:%M').time()
+        )
+        timestamp = int(appointment_datetime.timestamp())
+
+        # Claim the slot before paying for a transaction that would double-book it
+        hold = await sync_to_async(get_availability_index().hold)(
+            doctor.id, appointment_datetime.date(), appointment_datetime.time()
+        )
+
+        blockchain_result = await get_async_blockchain_service().create_appointment(
+            patient_address=patient_address,
+            doctor_address=doctor.address,
+            timestamp=timestamp,
+            wait=wait_for_receipts()
+        )
+        if not blockchain_result['success']:
+            logger.error(f"Blockchain error: {blockchain_result['error']}")
+            return JsonResponse({"error": f"Blockchain error: {blockchain_result['error']}"},
+                                status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        body, status_code = await sync_to_async(save_created_appointment)(data, doctor, patient, blockchain_result)
+        return JsonResponse(body, status=status_code)
+
+    except Doctor.DoesNotExist:
+        return JsonResponse({"error": "Doctor not found"}, status=status.HTTP_404_NOT_FOUND)
+    except Patient.DoesNotExist:
+        return JsonResponse({"error": "Patient not found"}, status=status.HTTP_404_NOT_FOUND)
+    except SlotUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    finally:
+        if hold:
+            # release() takes the index lock, so keep it off the event loop too
+            await sync_to_async(get_availability_index().release)(hold)
+
+
+@async_api_view(['PUT', 'DELETE'])
+async def appointmentDetailAsync(request, id):
+    """PUT completes the appointment on chain (doctors), DELETE cancels it (its patient or doctors)"""
+    complete = request.method == 'PUT'
+    if complete and not IsDoctorRole().has_permission(request, None):
+        return forbidden(IsDoctorRole)
+    try:
+        appointment = await sync_to_async(
+            Appointment.objects.select_related('doctor', 'patient').get
+        )(id=id)
+        if not PatientOwnsAppointment().has_object_permission(request, None, appointment):
+            return forbidden(PatientOwnsAppointment)
+        if complete:
+            if appointment.doctor is None:
+                return JsonResponse({"error": "Doctor not found"}, status=status.HTTP_404_NOT_FOUND)
+            if not appointment.doctor.address:
+                return JsonResponse(
+                    {"error": "Doctor blockchain address is not set. Please update the doctor's blockchain address."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            blockchain_result = await get_async_blockchain_service().complete_appointment(
+                doctor_address=appointment.doctor.address,
+                appointment_id=appointment.blockchain_id,
+                wait=wait_for_receipts()
+            )
+        else:
+            if appointment.patient is None:
+                return JsonResponse({"error": "Patient not found"}, status=status.HTTP_404_NOT_FOUND)
+            if not appointment.patient.address:
+                return JsonResponse(
+                    {"error": "Patient blockchain address is not set. Please update the patient's blockchain address."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            blockchain_result = await get_async_blockchain_service().cancel_appointment(
+                user_address=appointment.patient.address,
+                appointment_id=appointment.blockchain_id,
+                wait=wait_for_receipts()
+            )
+
+        if not blockchain_result['success']:
+            return JsonResponse({"error": f"Blockchain error: {blockchain_result['error']}"},
+                                status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if complete:
+            await sync_to_async(save_completed_appointment)(appointment, blockchain_result)
+            return JsonResponse({
+                "status": "success",
+                "data": {
+                    "status": appointment.status,
+                    "blockchain": with_trace({
+                        "transaction": blockchain_result['transaction_hash'],
+                        "status": appointment.action_status
+                    }, blockchain_result)
+                }
+            }, status=status.HTTP_200_OK)
+
+        await sync_to_async(save_cancelled_appointment)(appointment, blockchain_result)
+        return JsonResponse({
+            "status": "success",
+            "data": True,
+            "blockchain": {
+                "transaction": blockchain_result['transaction_hash'],
+                "status": blockchain_result.get('status', 'confirmed')
+            }
+        }, status=status.HTTP_200_OK)
+
+    except Appointment.DoesNotExist:
+        return JsonResponse({"error": "Appointment not found"}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .cache import bump_version, get_version
+
+
+def user_namespace(user_id):
+    return f"user:{user_id}"
+
+
+def invalidate_user(user_id):
+    """Drop the cached request.user for a user, e.g. after their row changed"""
+    bump_version(user_namespace(user_id))
+
+
+def tokens_for_user(user):
+    """Refresh token (and its access token) carrying the address and role claims used by api.permissions"""
+    refresh = RefreshToken.for_user(user)
+    refresh['address'] = user.address
+    refresh['role'] = user.role
+    return refresh
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that keeps the resolved user in the cache for a short TTL
+
+    Entries are versioned per user and invalidated by the BlockchainUser signals, so a
+    deactivated or edited user is picked up on their next request.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        key = f"auth:user:{user_id}:{get_version(user_namespace(user_id))}"
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        elif not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
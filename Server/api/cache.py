@@ -0,0 +1,84 @@
+import hashlib
+import json
+import logging
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.http import quote_etag
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+logger = logging.getLogger('api')
+
+VERSION_KEY = 'api:version:{namespace}'
+
+# Versions live apart from the entries so that culling cached responses never resets one
+versions = caches['state']
+
+
+def get_version(namespace):
+    """Current version of a cache namespace; bumping it orphans every entry built on the old one"""
+    return versions.get_or_set(VERSION_KEY.format(namespace=namespace), 1, timeout=None)
+
+
+def bump_version(*namespaces):
+    for namespace in namespaces:
+        key = VERSION_KEY.format(namespace=namespace)
+        versions.add(key, 1, timeout=None)
+        try:
+            versions.incr(key)
+        except ValueError:
+            # Evicted between add and incr; any fresh value invalidates the old entries
+            versions.set(key, 2, timeout=None)
+
+
+def response_cache_key(request, namespaces):
+    versions = ':'.join(f"{namespace}{get_version(namespace)}" for namespace in namespaces)
+    params = '&'.join(f"{key}={value}" for key, value in sorted(request.query_params.items()))
+    digest = hashlib.md5(f"{request.path}?{params}".encode()).hexdigest()
+    return f"api:response:{versions}:{digest}"
+
+
+def make_etag(data):
+    return quote_etag(hashlib.md5(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest())
+
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def cached_response(*namespaces):
+    """Cache a GET handler's successful response per path and query params, with ETag support
+
+    Entries are dropped by bumping one of the namespaces (see api.signals).
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            # Works on view methods (self, request, ...) and @api_view functions (request, ...)
+            request = next(arg for arg in args if isinstance(arg, Request))
+            key = response_cache_key(request, namespaces)
+            cached = cache.get(key)
+            if cached is None:
+                response = handler(*args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cached = {'data': response.data, 'etag': make_etag(response.data)}
+                cache.set(key, cached, settings.API_CACHE_TIMEOUT)
+            else:
+                logger.debug(f"Cache hit for {request.path}")
+
+            if etag_matches(request, cached['etag']):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = Response(cached['data'], status=status.HTTP_200_OK)
+            response['ETag'] = cached['etag']
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,62 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+# Rows fetched per database round trip while streaming
+EXPORT_CHUNK_SIZE = 2000
+
+# Same field names as AppointmentSerializer
+EXPORT_FIELDS = (
+    'id', 'docID', 'docName', 'patID', 'patName', 'date', 'time', 'status', 'patient_address',
+    'blockchain_id', 'blockchain_tx', 'blockchain_status', 'blockchain_action', 'action_status', 'chain_state',
+    'deposit_refunded', 'created_at', 'updated_at',
+)
+
+_COLUMNS = (
+    'id', 'doctor__docID', 'doctor__fName', 'doctor__lName', 'patient__patID', 'patient__patName',
+    'date', 'time', 'status', 'patient_address', 'blockchain_id', 'blockchain_tx', 'blockchain_status',
+    'blockchain_action', 'action_status', 'chain_state', 'deposit_refunded', 'created_at', 'updated_at',
+)
+
+
+def appointment_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield export rows as tuples, reading the queryset in chunks instead of loading it whole"""
+    values = queryset.order_by('date', 'time', 'id').values_list(*_COLUMNS)
+    for (pk, doc_id, f_name, l_name, pat_id, pat_name, *rest) in values.iterator(chunk_size=chunk_size):
+        doc_name = f"{f_name} {l_name}" if doc_id is not None else None
+        yield (pk, doc_id, doc_name, pat_id, pat_name, *rest)
+
+
+def ndjson_lines(rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(EXPORT_FIELDS, row))) + '\n'
+
+
+class _Echo:
+    """File-like object whose write() hands the formatted line back to the csv writer's caller"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+EXPORT_FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+    'csv': (csv_lines, 'text/csv'),
+}
+
+
+def export_appointments(queryset, export_format, filename='appointments'):
+    """StreamingHttpResponse with every appointment of the queryset as NDJSON or CSV"""
+    lines, content_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(lines(appointment_rows(queryset)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
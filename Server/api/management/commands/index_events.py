@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from api.models import ChainCheckpoint
+from api.services.indexer import EventIndexer
+
+
+class Command(BaseCommand):
+    help = 'Mirror AppointmentContract events into the database from the stored checkpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Index up to the current safe head and exit')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls')
+        parser.add_argument('--confirmations', type=int, default=None, help='Blocks to stay behind the head')
+        parser.add_argument('--from-block', type=int, default=None, help='Reset the checkpoint and start at this block')
+
+    def handle(self, *args, **options):
+        indexer = EventIndexer(confirmations=options['confirmations'], start_block=options['from_block'])
+
+        if options['from_block'] is not None:
+            ChainCheckpoint.objects.filter(name__startswith='appointments:').delete()
+
+        if options['once']:
+            applied = indexer.run_once()
+            self.stdout.write(self.style.SUCCESS(f"Applied {applied} contract events"))
+            return
+
+        self.stdout.write("Indexing contract events (Ctrl+C to stop)")
+        try:
+            indexer.run_forever(interval=options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api.services.receipts import ReceiptTracker
+
+
+class Command(BaseCommand):
+    help = 'Resolve pending appointment transactions by polling their receipts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process a single batch and exit')
+        parser.add_argument('--interval', type=float, default=None, help='Seconds between polls')
+        parser.add_argument('--batch-size', type=int, default=None, help='Pending rows fetched per poll')
+
+    def handle(self, *args, **options):
+        tracker = ReceiptTracker(poll_interval=options['interval'], batch_size=options['batch_size'])
+
+        if options['once']:
+            resolved = tracker.run_once()
+            self.stdout.write(self.style.SUCCESS(f"Resolved {resolved} pending transactions"))
+            return
+
+        self.stdout.write("Tracking pending appointment transactions (Ctrl+C to stop)")
+        try:
+            tracker.run_forever()
+        except KeyboardInterrupt:
+            tracker.stop()
@@ -0,0 +1,241 @@
+import bisect
+import logging
+import threading
+from contextvars import ContextVar
+
+logger = logging.getLogger('api')
+
+# Seconds; request, RPC and confirmation latencies all fit on this scale
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """One metric family; every distinct label combination is a separate series"""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def _collected(self):
+        """Series read from ``collect`` at scrape time: a number, or a dict of label values to numbers"""
+        try:
+            collected = self.collect()
+        except Exception as e:
+            logger.warning(f"Failed to collect metric {self.name}: {str(e)}")
+            return []
+        if isinstance(collected, dict):
+            return [('', key, (), value) for key, value in collected.items()]
+        return [('', (), (), collected)]
+
+    def samples(self):
+        """(suffix, label values, extra labels, value) for every series"""
+        raise NotImplementedError
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Counter incremented by the code, or read from ``collect`` for counts a component keeps itself"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def samples(self):
+        if self.collect is not None:
+            return self._collected()
+        with self._lock:
+            return [('', key, (), value) for key, value in self._series.items()]
+
+
+class Gauge(Metric):
+    """Gauge set by the code, or read from ``collect`` at scrape time"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.collect is not None:
+            return self._collected()
+        with self._lock:
+            return [('', key, (), value) for key, value in self._series.items()]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (plus +Inf), sum, count; made cumulative when exposed
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        samples = []
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float('inf')), counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', key, (('le', _format_value(bound)),), cumulative))
+            samples.append(('_sum', key, (), total))
+            samples.append(('_count', key, (), count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def expose(self):
+        """Every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _pending_transactions():
+    from django.db.models import Q
+    from api.models import Appointment
+    return Appointment.objects.filter(Q(blockchain_status='pending') | Q(action_status='pending')).count()
+
+
+def _chain_cache_lookups():
+    from api.services.chain_cache import contract_constants, gas_price_oracle
+    lookups = {}
+    for name, cache in (('contract_constants', contract_constants), ('gas_price', gas_price_oracle)):
+        stats = cache.stats()
+        lookups[(name, 'hit')] = stats['hits']
+        lookups[(name, 'miss')] = stats['misses']
+    return lookups
+
+
+HTTP_REQUESTS = registry.register(Counter(
+    'ehr_http_requests_total', 'HTTP requests by route, method and status code', ('route', 'method', 'status')))
+HTTP_LATENCY = registry.register(Histogram(
+    'ehr_http_request_duration_seconds', 'HTTP request latency by route', ('route', 'method')))
+DB_QUERIES = registry.register(Histogram(
+    'ehr_db_queries_per_request', 'Database queries issued by one HTTP request', ('route',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)))
+RPC_REQUESTS = registry.register(Counter(
+    'ehr_rpc_requests_total', 'JSON-RPC calls sent to the Ethereum node by method', ('method',)))
+RPC_ERRORS = registry.register(Counter(
+    'ehr_rpc_errors_total', 'JSON-RPC calls that failed or returned an error by method', ('method',)))
+RPC_LATENCY = registry.register(Histogram(
+    'ehr_rpc_duration_seconds', 'JSON-RPC round trip latency by method (batches as "batch")', ('method',)))
+TX_CONFIRMATION = registry.register(Histogram(
+    'ehr_tx_confirmation_seconds', 'Time from submitting an appointment transaction to its receipt', ('action',)))
+PENDING_TRANSACTIONS = registry.register(Gauge(
+    'ehr_pending_transactions', 'Appointment transactions still waiting for a receipt',
+    collect=_pending_transactions))
+CHAIN_CACHE_LOOKUPS = registry.register(Counter(
+    'ehr_chain_cache_lookups_total', 'Contract constant and gas price lookups by cache and whether they saved an RPC call',
+    ('cache', 'result'), collect=_chain_cache_lookups))
+SIGNATURE_VERIFICATIONS = registry.register(Counter(
+    'ehr_signature_verifications_total', 'Login signature recoveries by result (rejected when the queue stayed full)',
+    ('result',)))
+SIGNATURE_IN_FLIGHT = registry.register(Gauge(
+    'ehr_signature_verifications_in_flight', 'Login signature recoveries queued for or running in the worker pool'))
+SIGNATURE_WORKERS = registry.register(Gauge(
+    'ehr_signature_workers', 'Processes in the started signature verification pool'))
+SIGNATURE_QUEUE_WAIT = registry.register(Histogram(
+    'ehr_signature_queue_wait_seconds', 'Time a login signature waited for a verification worker',
+    buckets=(0.0005, 0.001, 0.0025, *DEFAULT_BUCKETS)))
+SIGNATURE_RECOVERY = registry.register(Histogram(
+    'ehr_signature_recovery_seconds', 'Time a verification worker spent recovering a login signature',
+    buckets=(0.0005, 0.001, 0.0025, *DEFAULT_BUCKETS)))
+
+
+def observe_rpc(method, seconds, error=False, calls=None):
+    """Record one provider round trip; ``calls`` lists the methods of a batch request"""
+    for call in calls or (method,):
+        RPC_REQUESTS.inc(method=call)
+    if error:
+        RPC_ERRORS.inc(method=method)
+    RPC_LATENCY.observe(seconds, method=method)
+
+
+# Query counter of the request running in the current context; sync_to_async copies the
+# context, so queries an async view runs in a worker thread are counted too
+_request_queries = ContextVar('request_queries', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    """Connection execute wrapper adding the query to the current request's count"""
+    counter = _request_queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def start_query_count():
+    counter = [0]
+    return counter, _request_queries.set(counter)
+
+
+def stop_query_count(token):
+    _request_queries.reset(token)
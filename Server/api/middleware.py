@@ -0,0 +1,59 @@
+import time
+import asyncio
+
+from .metrics import DB_QUERIES, HTTP_LATENCY, HTTP_REQUESTS, start_query_count, stop_query_count
+
+
+def route_label(request):
+    """URL pattern the request matched, so series stay bounded however many ids are requested"""
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+class MetricsMiddleware:
+    """Records latency, status and database query count of every request in api.metrics
+
+    Works in both sync and async stacks, so the async appointment views keep running on
+    the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._async = asyncio.iscoroutinefunction(get_response)
+        if self._async:
+            # Mark the instance as a coroutine function for Django's middleware adapter
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self._async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        counter, token = start_query_count()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_query_count(token)
+        self.record(request, response, time.perf_counter() - started, counter[0])
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        counter, token = start_query_count()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_query_count(token)
+        self.record(request, response, time.perf_counter() - started, counter[0])
+        return response
+
+    def record(self, request, response, seconds, queries):
+        match = getattr(request, 'resolver_match', None)
+        if match is not None and match.url_name == 'metrics':
+            # Scrapes would otherwise show up in the metrics they read
+            return
+        route = route_label(request)
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        HTTP_LATENCY.observe(seconds, route=route, method=request.method)
+        DB_QUERIES.observe(queries, route=route)
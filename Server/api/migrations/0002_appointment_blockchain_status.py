@@ -0,0 +1,23 @@
+# Generated by Django 4.0 on 2026-10-18 02:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='blockchain_action',
+            field=models.CharField(blank=True, choices=[('create', 'Create'), ('complete', 'Complete'), ('cancel', 'Cancel')], max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='blockchain_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('failed', 'Failed')], default='confirmed', max_length=20),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.0 on 2026-10-18 02:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_appointment_blockchain_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChainCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('block_number', models.BigIntegerField(default=0)),
+                ('block_hash', models.CharField(blank=True, max_length=66, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='chain_state',
+            field=models.CharField(blank=True, choices=[('created', 'Created'), ('confirmed', 'Confirmed'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='deposit_refunded',
+            field=models.BooleanField(default=False),
+        ),
+    ]
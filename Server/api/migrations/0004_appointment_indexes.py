@@ -0,0 +1,38 @@
+# Generated by Django 4.0 on 2026-10-18 02:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_chain_state_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointment',
+            name='blockchain_id',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['docID', 'date', 'time'], name='appointment_doc_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patID', 'date'], name='appointment_pat_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['date', 'time', 'id'], name='appointment_date_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['blockchain_tx'], name='appointment_tx_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['blockchain_status', 'updated_at'], name='appointment_chain_status_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.0 on 2026-10-18 02:51
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
+
+
+def link_doctors_and_patients(apps, schema_editor):
+    Appointment = apps.get_model('api', 'Appointment')
+    Doctor = apps.get_model('api', 'Doctor')
+    Patient = apps.get_model('api', 'Patient')
+
+    # Two set-based UPDATEs instead of a lookup per row
+    Appointment.objects.update(
+        doctor_id=Subquery(Doctor.objects.filter(docID=OuterRef('docID')).values('id')[:1]),
+        patient_id=Subquery(Patient.objects.filter(patID=OuterRef('patID')).values('id')[:1]),
+    )
+
+
+def copy_doctor_and_patient_names(apps, schema_editor):
+    Appointment = apps.get_model('api', 'Appointment')
+    Doctor = apps.get_model('api', 'Doctor')
+    Patient = apps.get_model('api', 'Patient')
+
+    doctors = Doctor.objects.filter(id=OuterRef('doctor_id'))
+    patients = Patient.objects.filter(id=OuterRef('patient_id'))
+    doctor_names = doctors.annotate(
+        name=Concat('fName', Value(' '), 'lName', output_field=models.CharField())
+    ).values('name')[:1]
+    # Rows whose doctor or patient was deleted fall back to empty strings
+    Appointment.objects.update(
+        docID=Coalesce(Subquery(doctors.values('docID')[:1]), Value('')),
+        docName=Coalesce(Subquery(doctor_names), Value('')),
+        patID=Coalesce(Subquery(patients.values('patID')[:1]), Value('')),
+        patName=Coalesce(Subquery(patients.values('patName')[:1]), Value('')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_appointment_foreign_keys'),
+    ]
+
+    # On its own so the data changes are committed before 0007 alters the table (PostgreSQL
+    # refuses schema changes while a transaction has pending trigger events)
+    operations = [
+        migrations.RunPython(link_doctors_and_patients, copy_doctor_and_patient_names),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.0 on 2026-10-18 02:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_link_appointment_doctors_and_patients'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_doc_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_pat_date_idx',
+        ),
+        migrations.RemoveField(
+            model_name='appointment',
+            name='docID',
+        ),
+        migrations.RemoveField(
+            model_name='appointment',
+            name='docName',
+        ),
+        migrations.RemoveField(
+            model_name='appointment',
+            name='patID',
+        ),
+        migrations.RemoveField(
+            model_name='appointment',
+            name='patName',
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'date', 'time'], name='appointment_doctor_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'date'], name='appointment_patient_date_idx'),
+        ),
+    ]
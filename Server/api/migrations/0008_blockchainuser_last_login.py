@@ -0,0 +1,19 @@
+# Generated by Django 4.0 on 2026-10-18 03:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_remove_appointment_names'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blockchainuser',
+            name='last_login',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
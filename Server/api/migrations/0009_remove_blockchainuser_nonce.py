@@ -0,0 +1,17 @@
+# Generated by Django 4.0 on 2026-10-18 03:39
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_blockchainuser_last_login'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='blockchainuser',
+            name='nonce',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0 on 2026-10-18 03:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_remove_blockchainuser_nonce'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(models.Q(('blockchain_status', 'failed'), _negated=True), models.Q(('chain_state', 'cancelled'), _negated=True)), fields=('doctor', 'date', 'time'), name='appointment_doctor_slot_unique'),
+        ),
+    ]
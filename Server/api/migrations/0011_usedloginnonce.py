@@ -0,0 +1,22 @@
+# Generated by Django 4.0 on 2026-10-18 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_appointment_doctor_slot_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsedLoginNonce',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nonce', models.CharField(max_length=128, unique=True)),
+                ('address', models.CharField(max_length=42)),
+                ('used_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.0 on 2026-10-18 03:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_usedloginnonce'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='action_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('failed', 'Failed')], max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='receipt_checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['action_status', 'receipt_checked_at'], name='appointment_action_status_idx'),
+        ),
+    ]
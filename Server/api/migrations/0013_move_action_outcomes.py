@@ -0,0 +1,33 @@
+# Generated by Django 4.0 on 2026-10-18 04:00
+
+from django.db import migrations
+
+
+def move_action_outcomes(apps, schema_editor):
+    Appointment = apps.get_model('api', 'Appointment')
+
+    # Complete/cancel outcomes used to overwrite the booking's own blockchain_status
+    actions = Appointment.objects.filter(blockchain_action__in=('complete', 'cancel'), action_status__isnull=True)
+    actions.filter(blockchain_status='confirmed').update(action_status='confirmed')
+    actions.filter(blockchain_status='pending').update(action_status='pending', blockchain_status='confirmed')
+
+    # A failed action left the booking live on chain, so it takes its slot back unless it was rebooked meanwhile
+    for appointment in actions.filter(blockchain_status='failed'):
+        appointment.action_status = 'failed'
+        rebooked = Appointment.objects.filter(
+            doctor_id=appointment.doctor_id, date=appointment.date, time=appointment.time
+        ).exclude(pk=appointment.pk).exclude(blockchain_status='failed').exclude(chain_state='cancelled')
+        if not rebooked.exists():
+            appointment.blockchain_status = 'confirmed'
+        appointment.save(update_fields=['action_status', 'blockchain_status'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_appointment_action_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_action_outcomes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 4.0 on 2026-10-18 04:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_move_action_outcomes'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='UsedLoginNonce',
+        ),
+    ]
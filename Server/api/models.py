@@ -3,19 +3,20 @@ from xmlrpc.client import DateTime
 from django.db import models
 from django.forms import CharField, DateField, TimeField
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 # Create your models here.
 
 class BlockchainUser(AbstractUser):
     address = models.CharField(max_length=42, unique=True, help_text=_('Ethereum wallet address'))
-    nonce = models.CharField(max_length=100, help_text=_('Random nonce for signature verification. Automatically generated.'), default='')
     role = models.CharField(max_length=20, choices=[
         ('admin', 'Admin'),
         ('doctor', 'Doctor'),
         ('patient', 'Patient')
     ], default='patient')
-    last_login = models.DateTimeField(auto_now=True)
+    # Set explicitly on login and by the activity tracker, not on every save()
+    last_login = models.DateTimeField(default=timezone.now)
     
     class Meta:
         verbose_name = _('Blockchain User')
@@ -24,13 +25,6 @@ class BlockchainUser(AbstractUser):
     def __str__(self):
         return f"{self.username} ({self.address})"
 
-    def generate_nonce(self):
-        """Generate a new nonce for signature verification"""
-        import secrets
-        self.nonce = secrets.token_hex(32)
-        self.save()
-        return self.nonce
-
 class Doctor(models.Model):
     docID = models.CharField(max_length=100, unique=True)
     fName = models.CharField(max_length=100)
@@ -57,19 +51,83 @@ class Patient(models.Model):
     def __str__(self):
         return self.patName
 
+# Appointments that still occupy their doctor's slot
+ACTIVE_APPOINTMENT = ~models.Q(blockchain_status='failed') & ~models.Q(chain_state='cancelled')
+
+
 class Appointment(models.Model):
-    docID = models.CharField(max_length=100)
-    docName = models.CharField(max_length=100)
-    patID = models.CharField(max_length=100)
-    patName = models.CharField(max_length=100)
+    BLOCKCHAIN_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('confirmed', 'Confirmed'),
+        ('failed', 'Failed')
+    ]
+    BLOCKCHAIN_ACTION_CHOICES = [
+        ('create', 'Create'),
+        ('complete', 'Complete'),
+        ('cancel', 'Cancel')
+    ]
+    CHAIN_STATE_CHOICES = [
+        ('created', 'Created'),
+        ('confirmed', 'Confirmed'),
+        ('completed', 'Completed'),
+        ('cancelled', 'Cancelled')
+    ]
+
+    # Protected, so an appointment never loses who it was with
+    doctor = models.ForeignKey(Doctor, on_delete=models.PROTECT, null=True, related_name='appointments')
+    patient = models.ForeignKey(Patient, on_delete=models.PROTECT, null=True, related_name='appointments')
     date = models.DateField()
     time = models.TimeField()
     status = models.BooleanField(default=False)
     patient_address = models.CharField(max_length=100, null=True, blank=True)
-    blockchain_id = models.CharField(max_length=100, null=True, blank=True)
+    blockchain_id = models.CharField(max_length=100, null=True, blank=True, unique=True)
     blockchain_tx = models.CharField(max_length=100, null=True, blank=True)
+    blockchain_status = models.CharField(max_length=20, choices=BLOCKCHAIN_STATUS_CHOICES, default='confirmed')
+    blockchain_action = models.CharField(max_length=20, choices=BLOCKCHAIN_ACTION_CHOICES, null=True, blank=True)
+    # Outcome of the latest complete/cancel transaction; blockchain_status stays the booking's own
+    action_status = models.CharField(max_length=20, choices=BLOCKCHAIN_STATUS_CHOICES, null=True, blank=True)
+    # When the receipt tracker last polled this row's transaction without finding it mined
+    receipt_checked_at = models.DateTimeField(null=True, blank=True)
+    chain_state = models.CharField(max_length=20, choices=CHAIN_STATE_CHOICES, null=True, blank=True)
+    deposit_refunded = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Doctor calendar and patient history lookups
+            models.Index(fields=['doctor', 'date', 'time'], name='appointment_doctor_date_idx'),
+            models.Index(fields=['patient', 'date'], name='appointment_patient_date_idx'),
+            # Keyset pagination order
+            models.Index(fields=['date', 'time', 'id'], name='appointment_date_time_idx'),
+            # Receipt tracker and event indexer joins
+            models.Index(fields=['blockchain_tx'], name='appointment_tx_idx'),
+            models.Index(fields=['blockchain_status', 'updated_at'], name='appointment_chain_status_idx'),
+            models.Index(fields=['action_status', 'receipt_checked_at'], name='appointment_action_status_idx'),
+        ]
+        constraints = [
+            # Availability calendars live per process, so the database has the final say on a slot
+            models.UniqueConstraint(
+                fields=['doctor', 'date', 'time'],
+                condition=ACTIVE_APPOINTMENT,
+                name='appointment_doctor_slot_unique'
+            ),
+        ]
+
+    @property
+    def is_active(self):
+        """ACTIVE_APPOINTMENT for a loaded row"""
+        return self.blockchain_status != 'failed' and self.chain_state != 'cancelled'
+
+    def __str__(self):
+        return f"{self.patient} - {self.doctor} - {self.date} {self.time}"
+
+class ChainCheckpoint(models.Model):
+    """Last block the event indexer has applied for a contract"""
+    name = models.CharField(max_length=100, unique=True)
+    block_number = models.BigIntegerField(default=0)
+    block_hash = models.CharField(max_length=66, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f"{self.patName} - {self.docName} - {self.date} {self.time}"
+        return f"{self.name} @ {self.block_number}"
@@ -0,0 +1,102 @@
+import base64
+from datetime import date, time
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def filter_appointments(queryset, params):
+    """Apply the date-range, status, doctor and patient query filters to an Appointment queryset"""
+    try:
+        if params.get('date_from'):
+            queryset = queryset.filter(date__gte=date.fromisoformat(params['date_from']))
+        if params.get('date_to'):
+            queryset = queryset.filter(date__lte=date.fromisoformat(params['date_to']))
+    except ValueError:
+        raise ValidationError({"error": "Dates must use the YYYY-MM-DD format"})
+
+    if params.get('status'):
+        queryset = queryset.filter(status=params['status'].lower() in ('1', 'true', 'yes'))
+    if params.get('blockchain_status'):
+        queryset = queryset.filter(blockchain_status=params['blockchain_status'])
+    if params.get('docID'):
+        queryset = queryset.filter(doctor__docID=params['docID'])
+    if params.get('patID'):
+        queryset = queryset.filter(patient__patID=params['patID'])
+    return queryset
+
+
+class AppointmentCursorPagination(BasePagination):
+    """Keyset pagination over (date, time, id), so every page costs the same regardless of history size
+
+    Only applied when the client sends ``cursor`` or ``page_size``; otherwise the full
+    result is returned as before.
+    """
+    ordering = ('date', 'time', 'id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 500
+
+    def encode_cursor(self, appointment):
+        raw = f"{appointment.date.isoformat()}|{appointment.time.isoformat()}|{appointment.id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+            cursor_date, cursor_time, cursor_id = raw.split('|')
+            return date.fromisoformat(cursor_date), time.fromisoformat(cursor_time), int(cursor_id)
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound("Invalid cursor")
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            page_size = self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = params.get(self.cursor_query_param)
+        position = self.decode_cursor(cursor) if cursor else None
+
+        rows = list(self.page_queryset(queryset, position, page_size))
+        page = rows[:page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if len(rows) > page_size else None
+        return page
+
+    def page_queryset(self, queryset, position, page_size):
+        """Rows after a decoded cursor position (None for the first page), plus one to tell whether more follow"""
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            cursor_date, cursor_time, cursor_id = position
+            # date >= cursor date lets the (date, time, id) index seek; the OR only sorts out that one date
+            queryset = queryset.filter(
+                Q(date__gte=cursor_date) &
+                (Q(date__gt=cursor_date) | Q(time__gt=cursor_time) | Q(time=cursor_time, id__gt=cursor_id))
+            )
+        return queryset[:page_size + 1]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            "status": "success",
+            "data": data,
+            "next": self.get_next_link(),
+            "next_cursor": self.next_cursor
+        })
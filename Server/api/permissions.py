@@ -0,0 +1,61 @@
+import hmac
+
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+ADDRESS_CLAIM = 'address'
+ROLE_CLAIM = 'role'
+
+
+def token_claim(request, claim):
+    """A claim of the validated access token, or None for unauthenticated or older tokens"""
+    token = getattr(request, 'auth', None)
+    if token is None:
+        return None
+    try:
+        return token.get(claim)
+    except AttributeError:
+        return None
+
+
+class HasTokenRole(BasePermission):
+    """Grants access when the token's role claim is one of ``roles``, without loading the user row"""
+    roles = ()
+    message = "Your role is not allowed to perform this action."
+
+    def has_permission(self, request, view):
+        return token_claim(request, ROLE_CLAIM) in self.roles
+
+
+class IsAdminRole(HasTokenRole):
+    roles = ('admin',)
+
+
+class IsDoctorRole(HasTokenRole):
+    roles = ('doctor', 'admin')
+
+
+class IsPatientRole(HasTokenRole):
+    roles = ('patient', 'admin')
+
+
+class HasMetricsToken(BasePermission):
+    """Grants access to requests bearing ``settings.METRICS_TOKEN``, for Prometheus scrapers"""
+
+    def has_permission(self, request, view):
+        if not settings.METRICS_TOKEN:
+            return False
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        return hmac.compare_digest(header.encode(), f"Bearer {settings.METRICS_TOKEN}".encode())
+
+
+class PatientOwnsAppointment(BasePermission):
+    """Object-level check that the token's wallet booked the appointment (admins and doctors may too)"""
+    message = "You can only access your own appointments."
+
+    def has_object_permission(self, request, view, obj):
+        role = token_claim(request, ROLE_CLAIM)
+        if role in ('admin', 'doctor'):
+            return True
+        address = token_claim(request, ADDRESS_CLAIM)
+        return bool(address and obj.patient_address and obj.patient_address.lower() == address.lower())
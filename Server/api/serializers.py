@@ -16,10 +16,23 @@ class PatientSerializer(serializers.ModelSerializer):
     fields = ('__all__')
 
 class AppointmentSerializer(serializers.ModelSerializer):
+  # Keep the historical docID/docName/patID/patName field names on top of the foreign keys;
+  # list views select_related('doctor', 'patient') so these never cost extra queries
+  docID = serializers.SlugRelatedField(source='doctor', slug_field='docID', queryset=Doctor.objects.all(), required=False)
+  docName = serializers.SerializerMethodField()
+  patID = serializers.SlugRelatedField(source='patient', slug_field='patID', queryset=Patient.objects.all(), required=False)
+  patName = serializers.SerializerMethodField()
 
   class Meta:
     model = Appointment
-    fields= ('__all__')
+    exclude = ('doctor', 'patient', 'receipt_checked_at')
+    read_only_fields = ('blockchain_status', 'blockchain_action', 'action_status', 'chain_state', 'deposit_refunded')
+
+  def get_docName(self, obj):
+    return f"{obj.doctor.fName} {obj.doctor.lName}" if obj.doctor else None
+
+  def get_patName(self, obj):
+    return obj.patient.patName if obj.patient else None
 
 class BlockchainUserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,87 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from datetime import timedelta
+
+from django.utils import timezone
+from dotenv import load_dotenv
+
+from api.authentication import invalidate_user
+from api.models import BlockchainUser
+
+logger = logging.getLogger('api')
+
+load_dotenv()
+
+
+class ActivityTracker:
+    """Coalesces last-activity timestamps in memory and writes them with one bulk_update per interval
+
+    A user only becomes due for a write once their stored last_login is older than
+    ``threshold`` seconds, so a session heartbeat polled every few seconds is a pure read.
+    """
+
+    def __init__(self, threshold=None, flush_interval=None):
+        self.threshold = timedelta(seconds=threshold if threshold is not None
+                                   else int(os.getenv('ACTIVITY_WRITE_THRESHOLD', '300')))
+        self.flush_interval = flush_interval if flush_interval is not None \
+            else float(os.getenv('ACTIVITY_FLUSH_INTERVAL', '30'))
+        self.pending = {}  # user id -> latest activity
+        self.last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def touch(self, user, now=None):
+        """Record activity for a user; the database is only written when a flush is due"""
+        now = now or timezone.now()
+        stale = user.last_login is None or now - user.last_login >= self.threshold
+        with self._lock:
+            if stale or user.pk in self.pending:
+                self.pending[user.pk] = now
+            due = self.pending and time.monotonic() - self.last_flush >= self.flush_interval
+        if stale:
+            # Keep the instance current for the response even before it is flushed
+            user.last_login = now
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write every pending timestamp with a single bulk_update"""
+        with self._lock:
+            pending, self.pending = self.pending, {}
+            self.last_flush = time.monotonic()
+        if not pending:
+            return 0
+        try:
+            BlockchainUser.objects.bulk_update(
+                [BlockchainUser(pk=user_id, last_login=last_login) for user_id, last_login in pending.items()],
+                ['last_login']
+            )
+        except Exception as e:
+            logger.error(f"Failed to flush activity for {len(pending)} users: {str(e)}")
+            with self._lock:
+                for user_id, last_login in pending.items():
+                    self.pending.setdefault(user_id, last_login)
+            return 0
+        # bulk_update sends no signals, so drop the cached request users by hand
+        for user_id in pending:
+            invalidate_user(user_id)
+        logger.debug(f"Flushed activity for {len(pending)} users")
+        return len(pending)
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_activity_tracker():
+    """Return the process-wide ActivityTracker, creating it on first use"""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = ActivityTracker()
+                # Don't lose the last interval's activity when the worker stops
+                atexit.register(_tracker.flush)
+    return _tracker
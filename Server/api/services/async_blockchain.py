@@ -0,0 +1,243 @@
+import os
+import time
+import logging
+import threading
+
+from django.conf import settings
+from web3 import AsyncWeb3, Web3
+from web3.exceptions import TimeExhausted
+from web3.providers import AsyncHTTPProvider
+from eth_account import Account
+from dotenv import load_dotenv
+
+from api.metrics import TX_CONFIRMATION, observe_rpc
+from .blockchain import load_contract_abi
+from .nonce import nonce_manager, is_already_known, is_nonce_error, may_be_in_flight, signer_address
+from .chain_cache import contract_constants, gas_price_oracle
+from .events import get_event_decoder
+from .rpc_trace import rpc_trace, rpc_step, trace_operation
+
+logger = logging.getLogger('api')
+
+load_dotenv()
+
+# Seconds an awaited transaction may take to be mined before the receipt tracker takes over
+RECEIPT_TIMEOUT = float(os.getenv('BLOCKCHAIN_ASYNC_RECEIPT_TIMEOUT', '120'))
+
+
+class InstrumentedAsyncHTTPProvider(AsyncHTTPProvider):
+    """AsyncHTTPProvider recording every call in api.metrics and the RPC trace"""
+
+    async def make_request(self, method, params):
+        started = time.perf_counter()
+        try:
+            response = await super().make_request(method, params)
+        except Exception as e:
+            observe_rpc(method, time.perf_counter() - started, error=True)
+            rpc_trace.observe(method, params, started, str(e))
+            raise
+        observe_rpc(method, time.perf_counter() - started, error='error' in response)
+        rpc_trace.observe(method, params, started, str(response['error']) if 'error' in response else None)
+        return response
+
+
+class AsyncBlockchainService:
+    """AsyncWeb3 counterpart of BlockchainService for the appointment writes
+
+    Every RPC is awaited instead of blocking a thread, so one ASGI worker can keep many
+    transactions in flight. Nonces, gas price and contract constants share the caches of
+    the synchronous service.
+    """
+
+    def __init__(self, provider=None):
+        if provider is None:
+            rpc_url = os.getenv('ETHEREUM_RPC_URL', 'http://localhost:8545')
+            logger.info(f"Using async Ethereum provider at: {rpc_url}")
+            provider = InstrumentedAsyncHTTPProvider(rpc_url, request_kwargs={'timeout': 10})
+        self.w3 = AsyncWeb3(provider)
+
+        self.contract_address = os.getenv('APPOINTMENT_CONTRACT_ADDRESS')
+        if not self.contract_address:
+            raise Exception("APPOINTMENT_CONTRACT_ADDRESS not set in environment")
+        self.private_key = os.getenv('PRIVATE_KEY')
+        if not self.private_key:
+            raise Exception("PRIVATE_KEY not set in environment")
+
+        self.contract = self.w3.eth.contract(address=self.contract_address, abi=load_contract_abi())
+        self.event_decoder = get_event_decoder()
+
+    async def get_deposit_amount(self):
+        return await contract_constants.get_async(
+            self.contract_address,
+            'DEPOSIT_AMOUNT',
+            lambda: self.contract.functions.DEPOSIT_AMOUNT().call()
+        )
+
+    async def get_chain_id(self):
+        return await contract_constants.get_async(self.contract_address, 'chain_id', lambda: self.w3.eth.chain_id)
+
+    async def send_transaction(self, contract_function, tx_params, private_key):
+        """Build, sign and broadcast a contract call using a locally managed nonce"""
+        sender = signer_address(private_key)
+        for attempt in range(2):
+            tx = await contract_function.build_transaction({
+                **tx_params,
+                'chainId': await self.get_chain_id(),
+                'nonce': await nonce_manager.allocate_async(self.w3, sender),
+            })
+            signed_tx = Account.sign_transaction(tx, private_key)
+            try:
+                return await self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+            except Exception as e:
+                if is_already_known(e):
+                    # The node already holds this exact transaction, so it is submitted
+                    logger.info(f"Transaction {signed_tx.hash.hex()} already known to the node")
+                    return signed_tx.hash
+                if may_be_in_flight(e):
+                    # The node may hold the transaction; handing its nonce out again could replace it
+                    raise
+                # Rejected outright, so the nonce was never used: resync, or every later
+                # transaction from this sender would queue behind the gap
+                try:
+                    await nonce_manager.resync_async(self.w3, sender)
+                except Exception as resync_error:
+                    logger.error(f"Failed to resync nonce for {sender}: {str(resync_error)}")
+                if attempt == 0 and is_nonce_error(e):
+                    logger.warning(f"Nonce rejected for {sender}, retrying: {str(e)}")
+                    continue
+                raise
+
+    async def _wait_for_receipt(self, tx_hash):
+        """Mined receipt, or None when it is still pending after RECEIPT_TIMEOUT"""
+        try:
+            with rpc_step('receipt_wait'):
+                return await self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=RECEIPT_TIMEOUT)
+        except TimeExhausted:
+            logger.warning(f"Transaction {tx_hash.hex()} still pending after {RECEIPT_TIMEOUT}s")
+            return None
+
+    async def _submit(self, contract_function, action, sender, private_key, wait, value=None):
+        """Send one appointment transaction and wait for it when asked to, in the sync service's result format"""
+        tx_params = {
+            'from': Web3.to_checksum_address(sender),
+            'gas': 200000,
+            'gasPrice': await gas_price_oracle.get_async(self.w3),
+        }
+        if value is not None:
+            tx_params['value'] = value
+            # The node would reject an underfunded send anyway; refuse it before a nonce is handed out
+            required = value + tx_params['gas'] * tx_params['gasPrice']
+            balance = await self.w3.eth.get_balance(tx_params['from'])
+            if balance < required:
+                raise Exception(f"Insufficient funds: balance {balance} wei, need {required} wei")
+        # Started before the send, as in the sync service, so both report the same span
+        submitted = time.perf_counter()
+        tx_hash = await self.send_transaction(contract_function, tx_params, private_key)
+        result = {'success': True, 'transaction_hash': tx_hash.hex()}
+
+        receipt = await self._wait_for_receipt(tx_hash) if wait else None
+        if receipt is None:
+            # Not waited for (or not mined in time); the receipt tracker settles it
+            result['status'] = 'pending'
+            return result
+        TX_CONFIRMATION.observe(time.perf_counter() - submitted, action=action)
+        if receipt.status != 1:
+            return {'success': False, 'error': 'Transaction reverted', 'transaction_hash': tx_hash.hex()}
+        result['receipt'] = receipt
+        return result
+
+    async def create_appointment(self, patient_address, doctor_address, timestamp, wait=True):
+        # With RPC_TRACE_ENABLED the result carries a per-call breakdown of where the time went
+        with trace_operation('create_appointment', enabled=settings.RPC_TRACE_ENABLED) as trace:
+            result = await self._create_appointment(patient_address, doctor_address, timestamp, wait)
+        if trace is not None:
+            result['trace'] = trace.breakdown()
+        return result
+
+    async def _create_appointment(self, patient_address, doctor_address, timestamp, wait):
+        try:
+            patient_private_key = os.getenv('PATIENT_PRIVATE_KEY')
+            if not patient_private_key:
+                raise Exception("PATIENT_PRIVATE_KEY not set in environment")
+
+            result = await self._submit(
+                self.contract.functions.createAppointment(Web3.to_checksum_address(doctor_address), timestamp),
+                'create',
+                patient_address,
+                patient_private_key,
+                wait,
+                value=await self.get_deposit_amount()
+            )
+            receipt = result.pop('receipt', None)
+            # Only the receipt's own AppointmentCreated log says which id this booking got;
+            # appointmentCount() may already include bookings mined after it
+            result['appointment_id'] = self.get_appointment_id_from_receipt(receipt) if receipt else None
+            if result['appointment_id'] is None:
+                # Never confirmed without its chain id; the receipt tracker settles it
+                result['status'] = 'pending'
+            return result
+        except Exception as e:
+            logger.error(f"Blockchain Transaction Failed: {str(e)}")
+            return {'success': False, 'error': str(e)}
+
+    async def complete_appointment(self, doctor_address, appointment_id, wait=True):
+        with trace_operation('complete_appointment', enabled=settings.RPC_TRACE_ENABLED) as trace:
+            result = await self._complete_appointment(doctor_address, appointment_id, wait)
+        if trace is not None:
+            result['trace'] = trace.breakdown()
+        return result
+
+    async def _complete_appointment(self, doctor_address, appointment_id, wait):
+        try:
+            result = await self._submit(
+                self.contract.functions.completeAppointment(int(appointment_id)),
+                'complete',
+                doctor_address,
+                self.private_key,
+                wait
+            )
+            result.pop('receipt', None)
+            return result
+        except Exception as e:
+            logger.error(f"Failed to complete appointment: {str(e)}")
+            return {'success': False, 'error': str(e)}
+
+    async def cancel_appointment(self, user_address, appointment_id, wait=True):
+        try:
+            result = await self._submit(
+                self.contract.functions.cancelAppointment(int(appointment_id)),
+                'cancel',
+                user_address,
+                self.private_key,
+                wait
+            )
+            result.pop('receipt', None)
+            return result
+        except Exception as e:
+            logger.error(f"Failed to cancel appointment: {str(e)}")
+            return {'success': False, 'error': str(e)}
+
+    def get_appointment_id_from_receipt(self, receipt):
+        """Return the id emitted by AppointmentCreated in a mined receipt, if any"""
+        for event in self.event_decoder.decode_logs(receipt.logs, self.contract_address):
+            if event['event'] == 'AppointmentCreated':
+                return event['args']['id']
+        return None
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_async_blockchain_service():
+    """Return the process-wide AsyncBlockchainService, creating it on first use
+
+    web3 keeps one aiohttp session per thread and event loop, so the instance can be
+    shared by every request.
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = AsyncBlockchainService()
+    return _service
@@ -0,0 +1,61 @@
+import os
+import hmac
+import time
+import hashlib
+import secrets
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from dotenv import load_dotenv
+
+logger = logging.getLogger('api')
+
+load_dotenv()
+
+# The frontend signs exactly this text, keep the two in sync
+AUTH_MESSAGE = "Sign this message to authenticate with EHR system. Nonce: {nonce}"
+
+
+class LoginNonceStore:
+    """HMAC-signed, single-use login nonces that need no per-wallet server state
+
+    A nonce is ``<random>.<issued_at>.<hmac>`` bound to the wallet address, so its origin
+    and age are checked without any lookup; the client sends it back with the signature
+    and only spent nonces are recorded, in the 'state' cache until they expire. Set
+    CACHE_REDIS_URL so every worker shares that record.
+    """
+
+    def __init__(self, ttl=None, secret=None):
+        self.ttl = ttl or int(os.getenv('AUTH_NONCE_TTL', '300'))
+        self.secret = (secret or settings.SECRET_KEY).encode()
+
+    def _sign(self, address, payload):
+        return hmac.new(self.secret, f"{address.lower()}:{payload}".encode(), hashlib.sha256).hexdigest()
+
+    def issue(self, address):
+        payload = f"{secrets.token_hex(16)}.{int(time.time())}"
+        return f"{payload}.{self._sign(address, payload)}"
+
+    def verify(self, address, nonce):
+        """Whether the nonce was issued by this server for the address and has not expired"""
+        try:
+            token, issued_at, signature = nonce.split('.')
+            age = time.time() - int(issued_at)
+        except (AttributeError, ValueError):
+            return False
+        if not hmac.compare_digest(signature, self._sign(address, f"{token}.{issued_at}")):
+            return False
+        return 0 <= age <= self.ttl
+
+    def consume(self, address, nonce):
+        """Spend a nonce; False when it was already used, so a captured signature cannot be replayed"""
+        # add() is atomic, so only one of several concurrent logins wins; the marker outlives
+        # the nonce itself, which verify() refuses once expired
+        if not caches['state'].add(f"auth:used:{nonce}", address, timeout=self.ttl + 1):
+            logger.warning(f"Replayed login nonce for {address}")
+            return False
+        return True
+
+
+login_nonces = LoginNonceStore()
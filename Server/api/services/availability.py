@@ -0,0 +1,286 @@
+import os
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+
+from dotenv import load_dotenv
+
+from api.cache import bump_version, get_version
+from api.models import ACTIVE_APPOINTMENT, Appointment
+
+logger = logging.getLogger('api')
+
+load_dotenv()
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def to_minute(value):
+    """Minute of the day for a time or an 'HH:MM[:SS]' string"""
+    if isinstance(value, str):
+        value = time.fromisoformat(value)
+    return value.hour * 60 + value.minute
+
+
+def to_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+class SlotUnavailable(Exception):
+    """The doctor already has an appointment overlapping the requested slot"""
+
+
+class DoctorCalendar:
+    """One doctor's bookings as a bitset per day, where bit n set means minute n is taken"""
+
+    def __init__(self, slot_minutes):
+        self.slot_minutes = slot_minutes
+        self.bookings = {}  # day -> {key: start minute}
+        self.masks = {}     # day -> bitset of taken minutes
+        self.days = {}      # key -> day
+
+    def span(self, minute):
+        """Bits covered by an appointment starting at the given minute"""
+        end = min(minute + self.slot_minutes, MINUTES_PER_DAY)
+        return ((1 << (end - minute)) - 1) << minute
+
+    def add(self, key, day, minute):
+        self.discard(key)
+        self.bookings.setdefault(day, {})[key] = minute
+        self.days[key] = day
+        self.masks[day] = self.masks.get(day, 0) | self.span(minute)
+
+    def discard(self, key):
+        day = self.days.pop(key, None)
+        if day is None:
+            return
+        bookings = self.bookings[day]
+        del bookings[key]
+        if not bookings:
+            del self.bookings[day]
+            del self.masks[day]
+            return
+        # Overlapping bookings share bits, so rebuild the day from the ones left
+        mask = 0
+        for minute in bookings.values():
+            mask |= self.span(minute)
+        self.masks[day] = mask
+
+    def is_free(self, day, minute):
+        return not self.masks.get(day, 0) & self.span(minute)
+
+
+class AvailabilityIndex:
+    """Per-doctor calendars built from Appointment rows and kept current by the model signals
+
+    Calendars are stamped with a version in the Django cache, so a worker reloads a doctor
+    whose appointments another worker changed (with a shared cache backend).
+    """
+
+    def __init__(self, slot_minutes=None, day_start=None, day_end=None):
+        self.slot_minutes = slot_minutes or int(os.getenv('APPOINTMENT_SLOT_MINUTES', '30'))
+        self.day_start = day_start if day_start is not None else to_minute(os.getenv('APPOINTMENT_DAY_START', '08:00'))
+        self.day_end = day_end if day_end is not None else to_minute(os.getenv('APPOINTMENT_DAY_END', '18:00'))
+        self.calendars = {}
+        self.versions = {}
+        self.holds = {}  # token -> doctor id
+        self._lock = threading.RLock()
+
+        # Bookable slots of a working day with their bit masks, computed once
+        span = DoctorCalendar(self.slot_minutes).span
+        self.grid = [
+            (minute, span(minute))
+            for minute in range(self.day_start, self.day_end - self.slot_minutes + 1, self.slot_minutes)
+        ]
+
+    def _namespace(self, doctor_id):
+        return f"calendar:{doctor_id}"
+
+    def _calendar(self, doctor_id):
+        """Calendar for a doctor, (re)loaded with one indexed query when missing or stale
+
+        The query runs outside the lock, so reloading one doctor does not stall every booking.
+        """
+        version = get_version(self._namespace(doctor_id))
+        with self._lock:
+            calendar = self.calendars.get(doctor_id)
+            if calendar is not None and self.versions.get(doctor_id) == version:
+                return calendar
+
+        upcoming = list(
+            Appointment.objects.filter(ACTIVE_APPOINTMENT, doctor_id=doctor_id, date__gte=date.today())
+            .values_list('id', 'date', 'time')
+        )
+        with self._lock:
+            calendar = self.calendars.get(doctor_id)
+            if calendar is not None and self.versions.get(doctor_id, 0) >= version:
+                # Reloaded or updated by another thread meanwhile
+                return calendar
+            fresh = DoctorCalendar(self.slot_minutes)
+            for pk, day, start in upcoming:
+                fresh.add(pk, day, to_minute(start))
+            if calendar is not None:
+                # Holds only live in this process, so carry them over
+                for token, day in calendar.days.items():
+                    if token in self.holds:
+                        fresh.add(token, day, calendar.bookings[day][token])
+            self.calendars[doctor_id] = fresh
+            self.versions[doctor_id] = version
+            return fresh
+
+    def _changed(self, doctor_id):
+        """Publish a change made to a doctor's calendar in this process"""
+        namespace = self._namespace(doctor_id)
+        previous = self.versions.get(doctor_id)
+        bump_version(namespace)
+        current = get_version(namespace)
+        if previous is not None and current == previous + 1:
+            self.versions[doctor_id] = current
+        else:
+            # Someone else changed it in between, reload on next use
+            self.versions.pop(doctor_id, None)
+
+    def free_slots(self, doctor_id, date_from, date_to, now=None):
+        """Free slot start times for every day in the range, skipping slots already in the past"""
+        now = now or datetime.now()
+        today, current_minute = now.date(), to_minute(now.time())
+        calendar = self._calendar(doctor_id)
+        with self._lock:
+            masks = dict(calendar.masks)
+
+        days = {}
+        day = date_from
+        while day <= date_to:
+            taken = masks.get(day, 0)
+            days[day] = [
+                time(minute // 60, minute % 60)
+                for minute, span in self.grid
+                if not taken & span and (day > today or (day == today and minute >= current_minute))
+            ]
+            day += timedelta(days=1)
+        return days
+
+    def hold(self, doctor_id, day, start):
+        """Claim a slot for a booking in progress; raises SlotUnavailable when it overlaps another"""
+        [held] = self.hold_many([(doctor_id, day, start)])
+        if isinstance(held, SlotUnavailable):
+            raise held
+        return held
+
+    def hold_many(self, slots):
+        """hold() for several (doctor_id, day, start) slots with a single database query
+
+        Returns a token, or the SlotUnavailable error, per slot. Slots overlapping each other
+        are refused too, after the first of them.
+        """
+        claimed = []
+        for doctor_id, day, start in slots:
+            day, minute = to_date(day), to_minute(start)
+            self._calendar(doctor_id)
+            with self._lock:
+                calendar = self.calendars[doctor_id]
+                if not calendar.is_free(day, minute):
+                    claimed.append(SlotUnavailable(self._taken_message(day, minute)))
+                    continue
+                token = uuid.uuid4().hex
+                calendar.add(token, day, minute)
+                self.holds[token] = doctor_id
+            claimed.append((token, doctor_id, day, minute))
+
+        # Checked once the slots are claimed here, so the query runs without the lock
+        held = [claim for claim in claimed if not isinstance(claim, SlotUnavailable)]
+        booked = self._booked([(doctor_id, day, minute) for _, doctor_id, day, minute in held])
+        results = []
+        for claim in claimed:
+            if isinstance(claim, SlotUnavailable):
+                results.append(claim)
+                continue
+            token, doctor_id, day, minute = claim
+            if (doctor_id, day, minute) in booked:
+                self.release(token)
+                results.append(SlotUnavailable(self._taken_message(day, minute)))
+            else:
+                results.append(token)
+        return results
+
+    def _taken_message(self, day, minute):
+        return f"Doctor is already booked at {day.isoformat()} {minute // 60:02d}:{minute % 60:02d}"
+
+    def _booked(self, slots):
+        """(doctor_id, day, minute) slots a saved appointment overlaps, including ones this process has not seen"""
+        if not slots:
+            return set()
+        saved = {}
+        rows = Appointment.objects.filter(
+            ACTIVE_APPOINTMENT,
+            doctor_id__in={doctor_id for doctor_id, _, _ in slots},
+            date__in={day for _, day, _ in slots}
+        ).values_list('doctor_id', 'date', 'time')
+        for doctor_id, day, start in rows:
+            saved.setdefault((doctor_id, day), []).append(to_minute(start))
+        return {
+            (doctor_id, day, minute)
+            for doctor_id, day, minute in slots
+            if any(abs(start - minute) < self.slot_minutes for start in saved.get((doctor_id, day), ()))
+        }
+
+    def release(self, token):
+        with self._lock:
+            doctor_id = self.holds.pop(token, None)
+            calendar = self.calendars.get(doctor_id)
+            if calendar is not None:
+                calendar.discard(token)
+
+    @contextmanager
+    def reserve(self, doctor_id, day, start):
+        """Hold a slot for the duration of the block; the saved Appointment takes it over"""
+        token = self.hold(doctor_id, day, start)
+        try:
+            yield
+        finally:
+            self.release(token)
+
+    def appointment_saved(self, appointment):
+        with self._lock:
+            # The doctor, day or time may have changed, so drop the old entry wherever it is
+            for doctor_id, calendar in list(self.calendars.items()):
+                if appointment.pk in calendar.days:
+                    calendar.discard(appointment.pk)
+                    if doctor_id != appointment.doctor_id:
+                        self._changed(doctor_id)
+            if appointment.doctor_id is None:
+                return
+            calendar = self.calendars.get(appointment.doctor_id)
+            # Failed and cancelled bookings give their slot back
+            if calendar is not None and appointment.is_active:
+                if appointment.pk is None:
+                    # bulk_create without returned ids; reload from the database instead
+                    self.versions.pop(appointment.doctor_id, None)
+                else:
+                    calendar.add(appointment.pk, to_date(appointment.date), to_minute(appointment.time))
+            self._changed(appointment.doctor_id)
+
+    def appointment_deleted(self, appointment):
+        with self._lock:
+            for doctor_id, calendar in list(self.calendars.items()):
+                if appointment.pk in calendar.days:
+                    calendar.discard(appointment.pk)
+                    self._changed(doctor_id)
+            if appointment.doctor_id is not None and appointment.doctor_id not in self.calendars:
+                self._changed(appointment.doctor_id)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_availability_index():
+    """Return the process-wide AvailabilityIndex, creating it on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = AvailabilityIndex()
+    return _index
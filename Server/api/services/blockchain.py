@@ -1,23 +1,57 @@
 import os
 import json
+import time
 from web3 import Web3
+from web3.datastructures import AttributeDict
+from web3._utils.method_formatters import receipt_formatter
+from hexbytes import HexBytes
 from eth_account import Account
 from dotenv import load_dotenv
+from django.conf import settings
 import logging
+from functools import lru_cache
+from .nonce import nonce_manager, is_already_known, is_nonce_error, may_be_in_flight, signer_address
+from .chain_cache import contract_constants, gas_price_oracle
+from .events import get_event_decoder
+from .rpc_trace import rpc_trace, rpc_step, trace_operation
+from api.metrics import TX_CONFIRMATION
 
 logger = logging.getLogger('api')
 
 load_dotenv()
 
+# Calls packed into a single JSON-RPC batch request
+BATCH_SIZE = int(os.getenv('BLOCKCHAIN_BATCH_SIZE', '50'))
+
+CONTRACT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'contracts',
+    'AppointmentContract.json'
+)
+
+
+@lru_cache(maxsize=None)
+def load_contract_abi(contract_path=CONTRACT_PATH):
+    """Read the contract ABI from disk once per process"""
+    logger.info(f"Loading contract from: {contract_path}")
+    with open(contract_path, 'r') as f:
+        contract_json = json.load(f)
+    return contract_json['abi']
+
+
 class BlockchainService:
-    def __init__(self):
+    def __init__(self, provider=None):
         try:
             logger.info("=== Initializing BlockchainService ===")
             
             # Initialize Web3
-            rpc_url = os.getenv('ETHEREUM_RPC_URL', 'http://localhost:8545')
-            logger.info(f"Connecting to Ethereum node at: {rpc_url}")
-            self.w3 = Web3(Web3.HTTPProvider(rpc_url))
+            if provider is None:
+                rpc_url = os.getenv('ETHEREUM_RPC_URL', 'http://localhost:8545')
+                logger.info(f"Connecting to Ethereum node at: {rpc_url}")
+                provider = Web3.HTTPProvider(rpc_url)
+            self.w3 = Web3(provider)
+            # Innermost, so the recorded duration is the provider round trip
+            self.w3.middleware_onion.inject(rpc_trace.middleware, name='rpc_trace', layer=0)
             
             if not self.w3.is_connected():
                 raise Exception("Failed to connect to Ethereum node")
@@ -37,13 +71,7 @@ class BlockchainService:
             
             # Load contract ABI
             try:
-                project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-                contract_path = os.path.join(project_root, 'contracts', 'AppointmentContract.json')
-                logger.info(f"Loading contract from: {contract_path}")
-                
-                with open(contract_path, 'r') as f:
-                    contract_json = json.load(f)
-                    self.contract_abi = contract_json['abi']
+                self.contract_abi = load_contract_abi()
                 logger.info("Contract ABI loaded successfully")
             except Exception as e:
                 logger.error(f"Failed to load contract ABI: {str(e)}")
@@ -54,6 +82,7 @@ class BlockchainService:
                 address=self.contract_address,
                 abi=self.contract_abi
             )
+            self.event_decoder = get_event_decoder()
             logger.info("Contract initialized successfully")
             logger.info("=== BlockchainService Initialization Complete ===")
             
@@ -61,7 +90,63 @@ class BlockchainService:
             logger.error(f"Error Initializing BlockchainService: {str(e)}")
             raise
 
-    def create_appointment(self, patient_address, doctor_address, timestamp):
+    def get_deposit_amount(self):
+        return contract_constants.get(
+            self.contract_address,
+            'DEPOSIT_AMOUNT',
+            lambda: self.contract.functions.DEPOSIT_AMOUNT().call()
+        )
+
+    def get_chain_id(self):
+        return contract_constants.get(self.contract_address, 'chain_id', lambda: self.w3.eth.chain_id)
+
+    def cache_stats(self):
+        """Hit/miss counters showing how many RPC round trips the caches saved"""
+        return {
+            'contract_constants': contract_constants.stats(),
+            'gas_price': gas_price_oracle.stats()
+        }
+
+    def send_transaction(self, contract_function, tx_params, private_key):
+        """Build, sign and broadcast a contract call using a locally managed nonce"""
+        sender = signer_address(private_key)
+        for attempt in range(2):
+            tx = contract_function.build_transaction({
+                **tx_params,
+                'chainId': self.get_chain_id(),
+                'nonce': nonce_manager.allocate(self.w3, sender),
+            })
+            signed_tx = Account.sign_transaction(tx, private_key)
+            try:
+                return self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+            except Exception as e:
+                if is_already_known(e):
+                    # The node already holds this exact transaction, so it is submitted
+                    logger.info(f"Transaction {signed_tx.hash.hex()} already known to the node")
+                    return signed_tx.hash
+                if may_be_in_flight(e):
+                    # The node may hold the transaction; handing its nonce out again could replace it
+                    raise
+                # Rejected outright, so the nonce was never used: resync, or every later
+                # transaction from this sender would queue behind the gap
+                try:
+                    nonce_manager.resync(self.w3, sender)
+                except Exception as resync_error:
+                    logger.error(f"Failed to resync nonce for {sender}: {str(resync_error)}")
+                if attempt == 0 and is_nonce_error(e):
+                    logger.warning(f"Nonce rejected for {sender}, retrying: {str(e)}")
+                    continue
+                raise
+
+    def create_appointment(self, patient_address, doctor_address, timestamp, wait=True):
+        # With RPC_TRACE_ENABLED the result carries a per-call breakdown of where the time went
+        with trace_operation('create_appointment', enabled=settings.RPC_TRACE_ENABLED) as trace:
+            result = self._create_appointment(patient_address, doctor_address, timestamp, wait)
+        if trace is not None:
+            result['trace'] = trace.breakdown()
+        return result
+
+    def _create_appointment(self, patient_address, doctor_address, timestamp, wait):
         try:
             logger.info("=== Starting Blockchain Transaction ===")
             logger.info(f"Patient Address: {patient_address}")
@@ -73,95 +158,62 @@ class BlockchainService:
             doctor_address = Web3.to_checksum_address(doctor_address)
             logger.info(f"Checksum Addresses - Patient: {patient_address}, Doctor: {doctor_address}")
             
-            # Get deposit amount from contract
-            deposit_amount = self.contract.functions.DEPOSIT_AMOUNT().call()
+            # Get deposit amount from contract (a constant, so only read once per contract)
+            deposit_amount = self.get_deposit_amount()
             logger.info(f"Deposit Amount: {deposit_amount}")
             
             # Get patient's balance
             patient_balance = self.w3.eth.get_balance(patient_address)
             logger.info(f"Patient Balance: {patient_balance}")
+
+            # The node would reject an underfunded send anyway; refuse it before a nonce is handed out
+            gas_price = gas_price_oracle.get(self.w3)
+            required = deposit_amount + 200000 * gas_price
+            if patient_balance < required:
+                raise Exception(f"Insufficient funds: balance {patient_balance} wei, need {required} wei")
             
             # Get patient's private key from environment
             patient_private_key = os.getenv('PATIENT_PRIVATE_KEY')
             if not patient_private_key:
                 raise Exception("PATIENT_PRIVATE_KEY not set in environment")
             
-            # Get the current appointment count before the transaction
-            try:
-                # Since appointmentCount is incremented when a new appointment is created,
-                # the current count + 1 will be the new appointment ID
-                current_count = self.contract.functions.appointmentCount().call()
-                logger.info(f"Current appointment count: {current_count}")
-                # The new appointment ID will be current_count + 1
-                expected_id = current_count + 1
-                logger.info(f"Expected new appointment ID: {expected_id}")
-            except Exception as e:
-                logger.error(f"Failed to get current appointment count: {str(e)}")
-                expected_id = None
-            
-            # Build transaction
-            nonce = self.w3.eth.get_transaction_count(patient_address)
-            
-            # Build contract transaction call
-            tx = self.contract.functions.createAppointment(
-                doctor_address,
-                timestamp
-            ).build_transaction({
-                'from': patient_address,
-                'value': deposit_amount,
-                'gas': 200000,
-                'gasPrice': self.w3.eth.gas_price,
-                'nonce': nonce,
-            })
-            
-            # Sign the transaction
-            signed_tx = Account.sign_transaction(tx, patient_private_key)
-            
-            # Send the transaction
-            tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+            # Build, sign and send the contract transaction call
+            submitted = time.perf_counter()
+            tx_hash = self.send_transaction(
+                self.contract.functions.createAppointment(
+                    doctor_address,
+                    timestamp
+                ),
+                {
+                    'from': patient_address,
+                    'value': deposit_amount,
+                    'gas': 200000,
+                    'gasPrice': gas_price,
+                },
+                patient_private_key
+            )
             logger.info(f"Transaction Hash: {tx_hash.hex()}")
             
+            if not wait:
+                logger.info("=== Transaction Submitted, Receipt Pending ===")
+                return {
+                    'success': True,
+                    'status': 'pending',
+                    'appointment_id': None,
+                    'transaction_hash': tx_hash.hex()
+                }
+            
             # Wait for receipt
-            receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+            with rpc_step('receipt_wait'):
+                receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+            TX_CONFIRMATION.observe(time.perf_counter() - submitted, action='create')
             logger.info(f"Transaction Receipt: {receipt}")
             
             # Get appointment ID from event logs
             appointment_id = None
             try:
-                # Try to get from event logs
-                for log in receipt.logs:
-                    if log.address.lower() == self.contract_address.lower():
-                        logger.info(f"Found log for our contract: {log}")
-                        try:
-                            # Process log manually 
-                            event_signature_hash = self.w3.keccak(text="AppointmentCreated(uint256,address,address,uint256)").hex()
-                            logger.info(f"Event signature hash: {event_signature_hash}")
-                            
-                            if log.topics and len(log.topics) > 0:
-                                for i, topic in enumerate(log.topics):
-                                    logger.info(f"Topic {i}: {topic.hex()}")
-                                
-                            if log.data:
-                                logger.info(f"Log data: {log.data.hex()}")
-                                # Decode the log data
-                                decoded_data = self.w3.codec.decode_abi(
-                                    ['uint256', 'address', 'address', 'uint256'], 
-                                    bytes.fromhex(log.data.hex()[2:])  # Remove '0x' prefix
-                                )
-                                logger.info(f"Decoded data: {decoded_data}")
-                                if decoded_data and len(decoded_data) > 0:
-                                    appointment_id = decoded_data[0]
-                                    logger.info(f"Extracted appointment ID from decoded data: {appointment_id}")
-                                    break
-                        except Exception as e:
-                            logger.warning(f"Error processing log manually: {str(e)}")
-                            continue
+                appointment_id = self.get_appointment_id_from_receipt(receipt)
                 
-                # If we still don't have an ID, use the expected ID
-                if appointment_id is None and expected_id is not None:
-                    appointment_id = expected_id
-                    logger.info(f"Using expected appointment ID: {appointment_id}")
-                    
                 # If we still don't have an ID, get the current count after transaction 
                 if appointment_id is None:
                     # Get the current appointment count after the transaction
@@ -172,11 +224,15 @@ class BlockchainService:
                 logger.error(f"Error extracting appointment ID: {str(e)}")
                 
             logger.info("=== Transaction Completed Successfully ===")
-            return {
+            result = {
                 'success': True,
                 'appointment_id': appointment_id,
                 'transaction_hash': tx_hash.hex()
             }
+            if appointment_id is None:
+                # Never confirmed without its chain id; the receipt tracker settles it
+                result['status'] = 'pending'
+            return result
             
         except Exception as e:
             logger.error(f"Blockchain Transaction Failed: {str(e)}")
@@ -185,30 +241,117 @@ class BlockchainService:
                 'error': str(e)
             }
 
-    def confirm_appointment(self, doctor_address, appointment_id):
+    def get_appointment_id_from_receipt(self, receipt):
+        """Return the id emitted by AppointmentCreated in a mined receipt, if any"""
+        for event in self.event_decoder.decode_logs(receipt.logs, self.contract_address):
+            if event['event'] == 'AppointmentCreated':
+                logger.info(f"Extracted appointment ID from AppointmentCreated: {event['args']['id']}")
+                return event['args']['id']
+        return None
+
+    def create_appointments(self, patient_address, slots, wait=True, timeout=120, poll_interval=0.5):
+        """Submit createAppointment for each (doctor_address, timestamp) slot back-to-back, one result per slot"""
+        patient_private_key = os.getenv('PATIENT_PRIVATE_KEY')
+        if not patient_private_key:
+            raise Exception("PATIENT_PRIVATE_KEY not set in environment")
+
+        patient_address = Web3.to_checksum_address(patient_address)
+        deposit_amount = self.get_deposit_amount()
+        gas_price = gas_price_oracle.get(self.w3)
+        # Stop before a send the node would reject for funds, so no nonce is handed out for it
+        cost = deposit_amount + 200000 * gas_price
+        balance = self.w3.eth.get_balance(patient_address)
+
+        # Nonces come from the local counter, so nothing waits on the node between sends
+        submitted_at = {}
+        results = []
+        for doctor_address, timestamp in slots:
+            if balance < cost:
+                results.append({'success': False, 'error': f"Insufficient funds: balance {balance} wei, need {cost} wei"})
+                continue
+            try:
+                submitted = time.perf_counter()
+                tx_hash = self.send_transaction(
+                    self.contract.functions.createAppointment(Web3.to_checksum_address(doctor_address), timestamp),
+                    {
+                        'from': patient_address,
+                        'value': deposit_amount,
+                        'gas': 200000,
+                        'gasPrice': gas_price,
+                    },
+                    patient_private_key
+                )
+                results.append({
+                    'success': True,
+                    'status': 'pending',
+                    'appointment_id': None,
+                    'transaction_hash': tx_hash.hex()
+                })
+                submitted_at[tx_hash.hex()] = submitted
+                balance -= cost
+            except Exception as e:
+                logger.error(f"Failed to submit appointment for {doctor_address} at {timestamp}: {str(e)}")
+                results.append({'success': False, 'error': str(e)})
+
+        if wait:
+            self._wait_for_created(results, submitted_at, timeout, poll_interval)
+        logger.info(f"Submitted {sum(result['success'] for result in results)}/{len(results)} appointments")
+        return results
+
+    def _wait_for_created(self, results, submitted_at, timeout, poll_interval):
+        """Poll every pending receipt in one batch per round until all are mined or the timeout passes"""
+        pending = {result['transaction_hash']: result for result in results if result['success']}
+        deadline = time.monotonic() + timeout
+        while pending:
+            tx_hashes = list(pending)
+            for tx_hash, receipt in zip(tx_hashes, self.get_transaction_receipts(tx_hashes)):
+                if receipt is None:
+                    continue
+                result = pending.pop(tx_hash)
+                TX_CONFIRMATION.observe(time.perf_counter() - submitted_at[tx_hash], action='create')
+                if receipt.status == 1:
+                    result['appointment_id'] = self.get_appointment_id_from_receipt(receipt)
+                    # appointmentCount says nothing about which of the batch this was, so a receipt
+                    # without a decodable AppointmentCreated stays pending for the receipt tracker
+                    if result['appointment_id'] is not None:
+                        result['status'] = 'confirmed'
+                    else:
+                        logger.warning(f"No AppointmentCreated event in the receipt of {tx_hash}")
+                else:
+                    result.update({'success': False, 'status': 'failed', 'error': 'Transaction reverted'})
+            if pending and time.monotonic() >= deadline:
+                # Left as pending for the receipt tracker to settle
+                logger.warning(f"{len(pending)} appointment transactions still pending after {timeout}s")
+                break
+            if pending:
+                time.sleep(poll_interval)
+
+    def confirm_appointment(self, doctor_address, appointment_id, wait=True):
         try:
             doctor_address = Web3.to_checksum_address(doctor_address)
             
-            # Build transaction
-            nonce = self.w3.eth.get_transaction_count(doctor_address)
-            
-            tx = self.contract.functions.confirmAppointment(
-                appointment_id
-            ).build_transaction({
-                'from': doctor_address,
-                'gas': 200000,
-                'gasPrice': self.w3.eth.gas_price,
-                'nonce': nonce
-            })
-            
-            # Sign the transaction
-            signed_tx = Account.sign_transaction(tx, self.private_key)
+            # Build, sign and send the transaction
+            submitted = time.perf_counter()
+            tx_hash = self.send_transaction(
+                self.contract.functions.confirmAppointment(appointment_id),
+                {
+                    'from': doctor_address,
+                    'gas': 200000,
+                    'gasPrice': gas_price_oracle.get(self.w3),
+                },
+                self.private_key
+            )
             
-            # Send the transaction
-            tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+            if not wait:
+                return {
+                    'success': True,
+                    'status': 'pending',
+                    'transaction_hash': tx_hash.hex()
+                }
             
             # Wait for receipt
             receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+            TX_CONFIRMATION.observe(time.perf_counter() - submitted, action='confirm')
             
             return {
                 'success': True,
@@ -222,30 +365,40 @@ class BlockchainService:
                 'error': str(e)
             }
 
-    def complete_appointment(self, doctor_address, appointment_id):
+    def complete_appointment(self, doctor_address, appointment_id, wait=True):
+        with trace_operation('complete_appointment', enabled=settings.RPC_TRACE_ENABLED) as trace:
+            result = self._complete_appointment(doctor_address, appointment_id, wait)
+        if trace is not None:
+            result['trace'] = trace.breakdown()
+        return result
+
+    def _complete_appointment(self, doctor_address, appointment_id, wait):
         try:
             doctor_address = Web3.to_checksum_address(doctor_address)
             
-            # Build transaction
-            nonce = self.w3.eth.get_transaction_count(doctor_address)
-            
-            tx = self.contract.functions.completeAppointment(
-                appointment_id
-            ).build_transaction({
-                'from': doctor_address,
-                'gas': 200000,
-                'gasPrice': self.w3.eth.gas_price,
-                'nonce': nonce
-            })
-            
-            # Sign the transaction
-            signed_tx = Account.sign_transaction(tx, self.private_key)
+            # Build, sign and send the transaction
+            submitted = time.perf_counter()
+            tx_hash = self.send_transaction(
+                self.contract.functions.completeAppointment(appointment_id),
+                {
+                    'from': doctor_address,
+                    'gas': 200000,
+                    'gasPrice': gas_price_oracle.get(self.w3),
+                },
+                self.private_key
+            )
             
-            # Send the transaction
-            tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+            if not wait:
+                return {
+                    'success': True,
+                    'status': 'pending',
+                    'transaction_hash': tx_hash.hex()
+                }
             
             # Wait for receipt
-            receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+            with rpc_step('receipt_wait'):
+                receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+            TX_CONFIRMATION.observe(time.perf_counter() - submitted, action='complete')
             
             return {
                 'success': True,
@@ -259,30 +412,32 @@ class BlockchainService:
                 'error': str(e)
             }
 
-    def cancel_appointment(self, user_address, appointment_id):
+    def cancel_appointment(self, user_address, appointment_id, wait=True):
         try:
             user_address = Web3.to_checksum_address(user_address)
             
-            # Build transaction
-            nonce = self.w3.eth.get_transaction_count(user_address)
-            
-            tx = self.contract.functions.cancelAppointment(
-                appointment_id
-            ).build_transaction({
-                'from': user_address,
-                'gas': 200000,
-                'gasPrice': self.w3.eth.gas_price,
-                'nonce': nonce
-            })
-            
-            # Sign the transaction
-            signed_tx = Account.sign_transaction(tx, self.private_key)
+            # Build, sign and send the transaction
+            submitted = time.perf_counter()
+            tx_hash = self.send_transaction(
+                self.contract.functions.cancelAppointment(appointment_id),
+                {
+                    'from': user_address,
+                    'gas': 200000,
+                    'gasPrice': gas_price_oracle.get(self.w3),
+                },
+                self.private_key
+            )
             
-            # Send the transaction
-            tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+            if not wait:
+                return {
+                    'success': True,
+                    'status': 'pending',
+                    'transaction_hash': tx_hash.hex()
+                }
             
             # Wait for receipt
             receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+            TX_CONFIRMATION.observe(time.perf_counter() - submitted, action='cancel')
             
             return {
                 'success': True,
@@ -296,20 +451,23 @@ class BlockchainService:
                 'error': str(e)
             }
 
+    def _format_appointment(self, appointment):
+        return {
+            'id': appointment[0],
+            'patient': appointment[1],
+            'doctor': appointment[2],
+            'timestamp': appointment[3],
+            'status': appointment[4],
+            'deposit': appointment[5]
+        }
+
     def get_appointment(self, appointment_id):
         try:
             appointment = self.contract.functions.getAppointment(appointment_id).call()
             
             return {
                 'success': True,
-                'appointment': {
-                    'id': appointment[0],
-                    'patient': appointment[1],
-                    'doctor': appointment[2],
-                    'timestamp': appointment[3],
-                    'status': appointment[4],
-                    'deposit': appointment[5]
-                }
+                'appointment': self._format_appointment(appointment)
             }
             
         except Exception as e:
@@ -317,4 +475,68 @@ class BlockchainService:
             return {
                 'success': False,
                 'error': str(e)
-            } 
\ No newline at end of file
+            }
+
+    def batch_request(self, calls, chunk_size=None):
+        """Send (method, params) pairs as JSON-RPC batches and return the raw responses in order
+
+        Providers without batch support fall back to one request per call through the
+        middleware onion, so provider middlewares and the RPC trace still see every call.
+        """
+        chunk_size = chunk_size or BATCH_SIZE
+        provider = self.w3.provider
+        if not hasattr(provider, 'make_batch_request'):
+            responses = []
+            for method, params in calls:
+                try:
+                    responses.append({'result': self.w3.manager.request_blocking(method, params)})
+                except Exception as e:
+                    responses.append({'error': str(e)})
+            return responses
+
+        responses = []
+        for start in range(0, len(calls), chunk_size):
+            responses.extend(provider.make_batch_request(calls[start:start + chunk_size]))
+        return responses
+
+    def get_appointments(self, appointment_ids, chunk_size=None):
+        """Bulk get_appointment: one eth_call per id, packed into as few round trips as possible"""
+        try:
+            output_types = [output['type'] for output in self.contract.get_function_by_name('getAppointment').abi['outputs']]
+            calls = [
+                ('eth_call', [{
+                    'to': self.contract_address,
+                    'data': self.contract.encodeABI(fn_name='getAppointment', args=[appointment_id])
+                }, 'latest'])
+                for appointment_id in appointment_ids
+            ]
+            responses = self.batch_request(calls, chunk_size)
+        except Exception as e:
+            logger.error(f"Failed to get appointments: {str(e)}")
+            return [{'success': False, 'error': str(e)} for _ in appointment_ids]
+
+        results = []
+        for response in responses:
+            if 'error' in response:
+                results.append({'success': False, 'error': str(response['error'])})
+                continue
+            try:
+                appointment = self.w3.codec.decode(output_types, HexBytes(response['result']))
+                results.append({'success': True, 'appointment': self._format_appointment(appointment)})
+            except Exception as e:
+                results.append({'success': False, 'error': str(e)})
+        return results
+
+    def get_transaction_receipts(self, tx_hashes, chunk_size=None):
+        """Receipts for many transactions in batched round trips; None for ones not mined yet"""
+        responses = self.batch_request(
+            [('eth_getTransactionReceipt', [tx_hash]) for tx_hash in tx_hashes],
+            chunk_size
+        )
+        receipts = []
+        for response in responses:
+            if 'error' in response:
+                raise Exception(f"Failed to get transaction receipt: {response['error']}")
+            result = response.get('result')
+            receipts.append(AttributeDict.recursive(receipt_formatter(result)) if result else None)
+        return receipts
@@ -0,0 +1,112 @@
+import os
+import math
+import time
+import logging
+import threading
+from collections import deque
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger('api')
+
+load_dotenv()
+
+
+class ContractConstantCache:
+    """Values that never change for a deployed contract, fetched once per contract address"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, contract_address, name, fetch):
+        key = (contract_address.lower(), name)
+        with self._lock:
+            if key in self._values:
+                self.hits += 1
+                return self._values[key]
+            self.misses += 1
+
+        # Fetch outside the lock; a concurrent miss only costs one extra call
+        value = fetch()
+        with self._lock:
+            return self._values.setdefault(key, value)
+
+    async def get_async(self, contract_address, name, fetch):
+        """Same as get() for a coroutine ``fetch``, e.g. an AsyncWeb3 call"""
+        key = (contract_address.lower(), name)
+        with self._lock:
+            if key in self._values:
+                self.hits += 1
+                return self._values[key]
+            self.misses += 1
+
+        value = await fetch()
+        with self._lock:
+            return self._values.setdefault(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._values)}
+
+
+class GasPriceOracle:
+    """Gas price refreshed at most once per TTL and smoothed over recent samples"""
+
+    def __init__(self, ttl=None, window=None, percentile=None):
+        self.ttl = ttl if ttl is not None else float(os.getenv('BLOCKCHAIN_GAS_PRICE_TTL', '15'))
+        self.percentile = percentile if percentile is not None \
+            else float(os.getenv('BLOCKCHAIN_GAS_PRICE_PERCENTILE', '60'))
+        self._samples = deque(maxlen=window or int(os.getenv('BLOCKCHAIN_GAS_PRICE_WINDOW', '10')))
+        self._price = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _smoothed(self):
+        ordered = sorted(self._samples)
+        index = max(0, math.ceil(self.percentile / 100 * len(ordered)) - 1)
+        return ordered[index]
+
+    def _fresh(self):
+        return self._price is not None and time.monotonic() - self._fetched_at < self.ttl
+
+    def _record(self, sample):
+        self._samples.append(sample)
+        self._price = self._smoothed()
+        self._fetched_at = time.monotonic()
+        return self._price
+
+    def get(self, w3):
+        with self._lock:
+            if self._fresh():
+                self.hits += 1
+                return self._price
+            self.misses += 1
+            return self._record(w3.eth.gas_price)
+
+    async def get_async(self, w3):
+        """Same as get() for an AsyncWeb3 client"""
+        with self._lock:
+            if self._fresh():
+                self.hits += 1
+                return self._price
+            self.misses += 1
+
+        # The lock is never held across an await; concurrent misses each add a sample
+        sample = await w3.eth.gas_price
+        with self._lock:
+            return self._record(sample)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'price': self._price, 'samples': len(self._samples)}
+
+
+contract_constants = ContractConstantCache()
+gas_price_oracle = GasPriceOracle()
@@ -0,0 +1,74 @@
+import logging
+from functools import lru_cache
+
+from eth_abi import decode
+from eth_utils import event_abi_to_log_topic
+
+logger = logging.getLogger('api')
+
+
+class EventSpec:
+    """Precomputed decoding layout for one ABI event"""
+
+    def __init__(self, event_abi):
+        self.name = event_abi['name']
+        self.topic = bytes(event_abi_to_log_topic(event_abi))
+        self.indexed = [(arg['name'], arg['type']) for arg in event_abi['inputs'] if arg.get('indexed')]
+        self.data_names = [arg['name'] for arg in event_abi['inputs'] if not arg.get('indexed')]
+        self.data_types = [arg['type'] for arg in event_abi['inputs'] if not arg.get('indexed')]
+
+    def decode(self, log):
+        args = dict(zip(self.data_names, decode(self.data_types, bytes(log['data'])))) if self.data_types else {}
+        for (name, arg_type), topic in zip(self.indexed, log['topics'][1:]):
+            args[name] = decode([arg_type], bytes(topic))[0]
+        return args
+
+
+class EventDecoder:
+    """Decodes contract logs by dispatching on topics[0] to precomputed event layouts"""
+
+    def __init__(self, abi):
+        self.events = {}
+        for item in abi:
+            if item.get('type') == 'event' and not item.get('anonymous'):
+                spec = EventSpec(item)
+                self.events[spec.topic] = spec
+
+    def decode(self, log):
+        """Decoded event dict for a log, or None when it is not one of our events"""
+        if not log['topics']:
+            return None
+        spec = self.events.get(bytes(log['topics'][0]))
+        if spec is None:
+            return None
+        return {
+            'event': spec.name,
+            'args': spec.decode(log),
+            'address': log['address'],
+            'transactionHash': log['transactionHash'],
+            'blockNumber': log['blockNumber'],
+            'logIndex': log['logIndex'],
+        }
+
+    def decode_logs(self, logs, address=None):
+        """Decode every log emitted by our contract, skipping foreign or unknown ones"""
+        address = address.lower() if address else None
+        events = []
+        for log in logs:
+            if address and log['address'].lower() != address:
+                continue
+            try:
+                event = self.decode(log)
+            except Exception as e:
+                logger.warning(f"Failed to decode log {log.get('logIndex')} of {log.get('transactionHash')}: {str(e)}")
+                continue
+            if event is not None:
+                events.append(event)
+        return events
+
+
+@lru_cache(maxsize=None)
+def get_event_decoder():
+    """EventDecoder for the AppointmentContract ABI, built once per process"""
+    from .blockchain import load_contract_abi
+    return EventDecoder(load_contract_abi())
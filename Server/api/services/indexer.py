@@ -0,0 +1,155 @@
+import os
+import time
+import logging
+
+from django.db import transaction, close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from dotenv import load_dotenv
+
+from api.models import Appointment, ChainCheckpoint
+from .availability import get_availability_index
+from .registry import get_blockchain_pool
+
+logger = logging.getLogger('api')
+
+load_dotenv()
+
+EVENT_CHAIN_STATES = {
+    'AppointmentCreated': 'created',
+    'AppointmentConfirmed': 'confirmed',
+    'AppointmentCompleted': 'completed',
+    'AppointmentCancelled': 'cancelled',
+}
+
+
+class EventIndexer:
+    """Mirrors AppointmentContract events into the Appointment table from a stored checkpoint"""
+
+    def __init__(self, confirmations=None, start_block=None, initial_window=None, max_window=None, min_window=1):
+        self.confirmations = confirmations if confirmations is not None \
+            else int(os.getenv('BLOCKCHAIN_INDEXER_CONFIRMATIONS', '3'))
+        self.start_block = start_block if start_block is not None \
+            else int(os.getenv('BLOCKCHAIN_INDEXER_START_BLOCK', '0'))
+        self.max_window = max_window or int(os.getenv('BLOCKCHAIN_INDEXER_MAX_WINDOW', '5000'))
+        self.window = min(initial_window or int(os.getenv('BLOCKCHAIN_INDEXER_WINDOW', '500')), self.max_window)
+        self.min_window = min_window
+
+    def _checkpoint(self, blockchain_service):
+        checkpoint, _ = ChainCheckpoint.objects.get_or_create(
+            name=f"appointments:{blockchain_service.contract_address.lower()}",
+            defaults={'block_number': self.start_block - 1}
+        )
+        return checkpoint
+
+    def _resume_block(self, blockchain_service, checkpoint):
+        """First block to index, rewound when the checkpointed block was reorganised away"""
+        if checkpoint.block_hash and checkpoint.block_number >= 0:
+            block = blockchain_service.w3.eth.get_block(checkpoint.block_number)
+            if block['hash'].hex() != checkpoint.block_hash:
+                rewind_to = max(self.start_block, checkpoint.block_number - self.confirmations)
+                logger.warning(
+                    f"Reorg detected at block {checkpoint.block_number}, rewinding indexer to {rewind_to}"
+                )
+                return rewind_to
+        return checkpoint.block_number + 1
+
+    def run_once(self):
+        """Index every safe block since the checkpoint; returns the number of logs applied"""
+        with get_blockchain_pool().borrow() as blockchain_service:
+            w3 = blockchain_service.w3
+            checkpoint = self._checkpoint(blockchain_service)
+            from_block = self._resume_block(blockchain_service, checkpoint)
+            safe_head = w3.eth.block_number - self.confirmations
+            applied = 0
+
+            while from_block <= safe_head:
+                to_block = min(from_block + self.window - 1, safe_head)
+                try:
+                    logs = w3.eth.get_logs({
+                        'address': blockchain_service.contract_address,
+                        'fromBlock': from_block,
+                        'toBlock': to_block,
+                    })
+                except Exception as e:
+                    # Nodes cap range size and result count, so retry with a smaller window
+                    if self.window <= self.min_window:
+                        raise
+                    self.window = max(self.min_window, self.window // 2)
+                    logger.warning(f"get_logs {from_block}-{to_block} failed ({str(e)}), window now {self.window}")
+                    continue
+
+                events = blockchain_service.event_decoder.decode_logs(logs, blockchain_service.contract_address)
+                block_hash = w3.eth.get_block(to_block)['hash'].hex()
+                with transaction.atomic():
+                    self._apply(events)
+                    checkpoint.block_number = to_block
+                    checkpoint.block_hash = block_hash
+                    checkpoint.save()
+
+                applied += len(events)
+                logger.info(f"Indexed blocks {from_block}-{to_block}: {len(events)} events")
+
+                # Grow the window again after every range the node accepted
+                self.window = min(self.max_window, self.window * 2)
+                from_block = to_block + 1
+
+            return applied
+
+    def run_forever(self, interval=5):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Event indexer iteration failed: {str(e)}")
+            finally:
+                close_old_connections()
+            time.sleep(interval)
+
+    def _apply(self, events):
+        """Fold the events into per-appointment changes and write them with one bulk_update"""
+        changes = {}
+        created_tx = {}
+        for event in events:
+            appointment_id = str(event['args']['id'])
+            change = changes.setdefault(appointment_id, {})
+            if event['event'] == 'DepositRefunded':
+                change['deposit_refunded'] = True
+            else:
+                change['chain_state'] = EVENT_CHAIN_STATES[event['event']]
+            if event['event'] == 'AppointmentCompleted':
+                change['status'] = True
+            if event['event'] == 'AppointmentCreated':
+                created_tx[event['transactionHash'].hex()] = appointment_id
+
+        if not changes:
+            return 0
+
+        appointments = Appointment.objects.filter(
+            Q(blockchain_id__in=list(changes)) | Q(blockchain_tx__in=list(created_tx))
+        )
+        now = timezone.now()
+        updated = []
+        for appointment in appointments:
+            appointment_id = created_tx.get(appointment.blockchain_tx, appointment.blockchain_id)
+            if appointment_id not in changes:
+                continue
+            if appointment.blockchain_id != appointment_id:
+                appointment.blockchain_id = appointment_id
+                if appointment.blockchain_status == 'pending':
+                    # A create that was still pending when its block got indexed; failed rows stay
+                    # failed, as their slot may have been booked again since
+                    appointment.blockchain_status = 'confirmed'
+            for field, value in changes[appointment_id].items():
+                setattr(appointment, field, value)
+            appointment.updated_at = now
+            updated.append(appointment)
+
+        Appointment.objects.bulk_update(updated, [
+            'blockchain_id', 'blockchain_status', 'chain_state', 'deposit_refunded', 'status', 'updated_at'
+        ])
+        # bulk_update sends no post_save, so give the slots of cancelled bookings back directly
+        for appointment in updated:
+            if not appointment.is_active:
+                get_availability_index().appointment_saved(appointment)
+        return len(updated)
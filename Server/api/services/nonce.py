@@ -0,0 +1,154 @@
+import os
+import logging
+import threading
+from functools import lru_cache
+
+import aiohttp
+import requests
+from django.core.cache import cache
+from dotenv import load_dotenv
+from eth_account import Account
+
+logger = logging.getLogger('api')
+
+load_dotenv()
+
+# The node rejected the nonce itself, so resending with a fresh one may succeed
+NONCE_ERROR_MESSAGES = (
+    'nonce too low',
+    'nonce too high',
+    'correct nonce',
+)
+
+# The node already holds a transaction with this nonce; resending under a new nonce would
+# submit the same call twice
+ALREADY_KNOWN_MESSAGES = (
+    'already known',
+    'known transaction',
+)
+
+
+# The request may have reached the node before it failed, so the transaction can still be mined
+IN_FLIGHT_ERRORS = (
+    TimeoutError,
+    ConnectionError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    aiohttp.ClientError,
+)
+
+
+def is_nonce_error(error):
+    """Whether a send failure means our local nonce is out of step with the node"""
+    message = str(error).lower()
+    return any(text in message for text in NONCE_ERROR_MESSAGES)
+
+
+def is_already_known(error):
+    """Whether a send failure means the node already has this exact transaction"""
+    message = str(error).lower()
+    return any(text in message for text in ALREADY_KNOWN_MESSAGES)
+
+
+def may_be_in_flight(error):
+    """Whether a send failure leaves it unknown if the node accepted the transaction"""
+    return isinstance(error, IN_FLIGHT_ERRORS)
+
+
+@lru_cache(maxsize=128)
+def signer_address(private_key):
+    """Address that actually signs (and spends nonces) for a private key"""
+    return Account.from_key(private_key).address
+
+
+class LocalNonceBackend:
+    """Per-process nonce counters guarded by a lock per sender"""
+
+    def __init__(self):
+        self._next = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock_for(self, address):
+        with self._locks_lock:
+            return self._locks.setdefault(address, threading.Lock())
+
+    def allocate(self, address, fetch_chain_nonce):
+        with self._lock_for(address):
+            if address not in self._next:
+                self._next[address] = fetch_chain_nonce()
+            nonce = self._next[address]
+            self._next[address] = nonce + 1
+            return nonce
+
+    def resync(self, address, chain_nonce):
+        with self._lock_for(address):
+            self._next[address] = chain_nonce
+
+    def is_seeded(self, address):
+        return address in self._next
+
+
+class CacheNonceBackend:
+    """Nonce counters kept in the Django cache so several workers can share a sender
+
+    Needs a cache with an atomic incr (Redis, Memcached) to be safe across processes.
+    """
+
+    def __init__(self, prefix='blockchain_nonce'):
+        self.prefix = prefix
+
+    def _key(self, address):
+        return f"{self.prefix}:{address}"
+
+    def allocate(self, address, fetch_chain_nonce):
+        key = self._key(address)
+        # The counter stores the last handed out nonce
+        if cache.get(key) is None:
+            cache.add(key, fetch_chain_nonce() - 1, timeout=None)
+        return cache.incr(key)
+
+    def resync(self, address, chain_nonce):
+        cache.set(self._key(address), chain_nonce - 1, timeout=None)
+
+    def is_seeded(self, address):
+        return cache.get(self._key(address)) is not None
+
+
+class NonceManager:
+    """Hands out monotonically increasing nonces per sender without an RPC per transaction"""
+
+    def __init__(self, backend=None):
+        if backend is None:
+            backend_name = os.getenv('BLOCKCHAIN_NONCE_BACKEND', 'local')
+            backend = CacheNonceBackend() if backend_name == 'cache' else LocalNonceBackend()
+        self.backend = backend
+
+    def allocate(self, w3, address):
+        return self.backend.allocate(
+            address,
+            lambda: w3.eth.get_transaction_count(address, 'pending')
+        )
+
+    def resync(self, w3, address):
+        chain_nonce = w3.eth.get_transaction_count(address, 'pending')
+        logger.info(f"Resyncing nonce for {address} to {chain_nonce}")
+        self.backend.resync(address, chain_nonce)
+        return chain_nonce
+
+    async def allocate_async(self, w3, address):
+        """allocate() for an AsyncWeb3 client; the node is only asked while the counter is unseeded"""
+        chain_nonce = None
+        if not self.backend.is_seeded(address):
+            chain_nonce = await w3.eth.get_transaction_count(address, 'pending')
+        # A concurrent allocation may have seeded the counter meanwhile; the backend keeps the first seed
+        return self.backend.allocate(address, lambda: chain_nonce)
+
+    async def resync_async(self, w3, address):
+        chain_nonce = await w3.eth.get_transaction_count(address, 'pending')
+        logger.info(f"Resyncing nonce for {address} to {chain_nonce}")
+        self.backend.resync(address, chain_nonce)
+        return chain_nonce
+
+
+nonce_manager = NonceManager()
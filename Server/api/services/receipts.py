@@ -0,0 +1,167 @@
+import os
+import logging
+import threading
+
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+from dotenv import load_dotenv
+
+from api.metrics import TX_CONFIRMATION
+from api.models import Appointment
+from .availability import get_availability_index
+from .registry import get_blockchain_pool
+
+logger = logging.getLogger('api')
+
+load_dotenv()
+
+
+class ReceiptTracker:
+    """Background worker that resolves pending appointment transactions"""
+
+    def __init__(self, poll_interval=None, batch_size=None, timeout=None):
+        self.poll_interval = poll_interval or float(os.getenv('BLOCKCHAIN_RECEIPT_POLL_INTERVAL', '2'))
+        self.batch_size = batch_size or int(os.getenv('BLOCKCHAIN_RECEIPT_BATCH_SIZE', '50'))
+        self.timeout = timeout or float(os.getenv('BLOCKCHAIN_RECEIPT_TIMEOUT', '600'))
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def track(self):
+        """Make sure the worker is running and poll for new pending rows right away"""
+        self.start()
+        self._wake.set()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='receipt-tracker', daemon=True)
+            self._thread.start()
+            logger.info("Receipt tracker started")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                resolved = self.run_once()
+            except Exception as e:
+                logger.error(f"Receipt tracker iteration failed: {str(e)}")
+                resolved = 0
+            finally:
+                close_old_connections()
+
+            # Keep draining while full batches come back, otherwise sleep until woken
+            if resolved < self.batch_size:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def run_once(self):
+        """Fetch receipts for one batch of pending rows; returns how many were resolved"""
+        pending = list(
+            Appointment.objects.filter(Q(blockchain_status='pending') | Q(action_status='pending'))
+            .exclude(blockchain_tx__isnull=True)
+            # Least recently polled first, so transactions that stay unmined cannot starve newer ones
+            .order_by(F('receipt_checked_at').asc(nulls_first=True), 'updated_at')[:self.batch_size]
+        )
+        if not pending:
+            return 0
+
+        with get_blockchain_pool().borrow() as blockchain_service:
+            # One JSON-RPC batch for the whole set of pending transactions
+            receipts = blockchain_service.get_transaction_receipts(
+                [appointment.blockchain_tx for appointment in pending]
+            )
+            return self._apply(blockchain_service, pending, receipts)
+
+    def _settle(self, appointment, outcome):
+        """Record a transaction's outcome; a failed complete/cancel leaves the booking as it was on chain"""
+        if appointment.blockchain_action == 'create':
+            appointment.blockchain_status = outcome
+        else:
+            appointment.action_status = outcome
+
+    def _apply(self, blockchain_service, pending, receipts):
+        now = timezone.now()
+        updated = []
+        unresolved = []
+        cancelled_ids = []
+
+        for appointment, receipt in zip(pending, receipts):
+            appointment_id = None
+            if receipt is not None and receipt.status == 1 and appointment.blockchain_action == 'create':
+                appointment_id = blockchain_service.get_appointment_id_from_receipt(receipt)
+                if appointment_id is None:
+                    # A booking is never confirmed without its chain id; retried until the timeout
+                    logger.warning(f"No AppointmentCreated event in the receipt of {appointment.blockchain_tx}")
+                    receipt = None
+
+            if receipt is None:
+                # Give up on transactions the node never mined (or whose id never showed up)
+                if (now - appointment.updated_at).total_seconds() > self.timeout:
+                    logger.warning(f"Transaction {appointment.blockchain_tx} timed out waiting for a receipt")
+                    self._settle(appointment, 'failed')
+                    appointment.updated_at = now
+                    updated.append(appointment)
+                else:
+                    unresolved.append(appointment.id)
+                continue
+
+            # The row was last saved when the transaction was submitted
+            TX_CONFIRMATION.observe((now - appointment.updated_at).total_seconds(),
+                                    action=appointment.blockchain_action or 'unknown')
+            if receipt.status != 1:
+                logger.warning(f"Transaction {appointment.blockchain_tx} reverted")
+                self._settle(appointment, 'failed')
+            elif appointment.blockchain_action == 'cancel':
+                cancelled_ids.append(appointment.id)
+                continue
+            else:
+                if appointment.blockchain_action == 'create':
+                    appointment.blockchain_id = appointment_id
+                elif appointment.blockchain_action == 'complete':
+                    appointment.status = True
+                self._settle(appointment, 'confirmed')
+
+            appointment.updated_at = now
+            updated.append(appointment)
+
+        if updated:
+            Appointment.objects.bulk_update(
+                updated, ['blockchain_status', 'action_status', 'blockchain_id', 'status', 'updated_at']
+            )
+            # bulk_update sends no post_save, so give the slots of bookings that failed back directly
+            for appointment in updated:
+                if not appointment.is_active:
+                    get_availability_index().appointment_saved(appointment)
+        if unresolved:
+            # Moves them behind the rows polled less recently; update() leaves updated_at alone
+            Appointment.objects.filter(id__in=unresolved).update(receipt_checked_at=now)
+        if cancelled_ids:
+            Appointment.objects.filter(id__in=cancelled_ids).delete()
+
+        resolved = len(updated) + len(cancelled_ids)
+        if resolved:
+            logger.info(f"Receipt tracker resolved {resolved} of {len(pending)} pending transactions")
+        return resolved
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_receipt_tracker():
+    """Return the process-wide ReceiptTracker, creating it on first use"""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = ReceiptTracker()
+    return _tracker
@@ -0,0 +1,176 @@
+import os
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+from dotenv import load_dotenv
+
+from api.metrics import observe_rpc
+from .blockchain import BlockchainService
+from .rpc_trace import rpc_trace
+
+logger = logging.getLogger('api')
+
+load_dotenv()
+
+
+class KeepAliveHTTPProvider(Web3.HTTPProvider):
+    """HTTPProvider that sends every request through one shared keep-alive session"""
+
+    def __init__(self, endpoint_uri, session, request_kwargs=None):
+        super().__init__(endpoint_uri, request_kwargs=request_kwargs)
+        self.session = session
+
+    def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        kwargs = self.get_request_kwargs()
+        kwargs.setdefault('timeout', 10)
+        started = time.perf_counter()
+        try:
+            response = self.session.post(self.endpoint_uri, data=request_data, **kwargs)
+            response.raise_for_status()
+            result = self.decode_rpc_response(response.content)
+        except Exception:
+            observe_rpc(method, time.perf_counter() - started, error=True)
+            raise
+        observe_rpc(method, time.perf_counter() - started, error='error' in result)
+        return result
+
+    def make_batch_request(self, calls):
+        """Send several (method, params) pairs in one HTTP round trip, responses in call order
+
+        Batches skip the middleware onion, so every call is recorded in the RPC trace here.
+        """
+        payload = [
+            {'jsonrpc': '2.0', 'method': method, 'params': params, 'id': index}
+            for index, (method, params) in enumerate(calls)
+        ]
+        kwargs = self.get_request_kwargs()
+        kwargs.setdefault('timeout', 10)
+        methods = [method for method, _ in calls]
+        started = time.perf_counter()
+        try:
+            response = self.session.post(self.endpoint_uri, json=payload, **kwargs)
+            response.raise_for_status()
+            responses = response.json()
+            if isinstance(responses, dict):
+                # Nodes answer with a single error object when they reject the whole batch
+                raise Exception(f"Batch request failed: {responses.get('error', responses)}")
+        except Exception as e:
+            observe_rpc('batch', time.perf_counter() - started, error=True, calls=methods)
+            rpc_trace.observe_batch(calls, started, error=str(e))
+            raise
+        responses = sorted(responses, key=lambda item: item['id'])
+        observe_rpc('batch', time.perf_counter() - started, error=any('error' in item for item in responses),
+                    calls=methods)
+        rpc_trace.observe_batch(calls, started, responses)
+        return responses
+
+
+class BlockchainServicePool:
+    """Thread-safe pool of ready BlockchainService clients shared by all requests"""
+
+    def __init__(self, size=None, health_check_interval=None, timeout=None, rpc_url=None):
+        self.size = size or int(os.getenv('BLOCKCHAIN_POOL_SIZE', '4'))
+        self.health_check_interval = health_check_interval if health_check_interval is not None \
+            else float(os.getenv('BLOCKCHAIN_HEALTH_CHECK_INTERVAL', '30'))
+        self.timeout = timeout if timeout is not None else float(os.getenv('BLOCKCHAIN_POOL_TIMEOUT', '10'))
+        self.rpc_url = rpc_url or os.getenv('ETHEREUM_RPC_URL', 'http://localhost:8545')
+
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+        # One keep-alive session with enough connections for every pooled client
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _create(self):
+        provider = KeepAliveHTTPProvider(self.rpc_url, session=self.session)
+        service = BlockchainService(provider=provider)
+        service.last_health_check = time.monotonic()
+        return service
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+
+        if can_create:
+            try:
+                return self._create()
+            except Exception:
+                self._discard()
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise Exception(f"Timed out after {self.timeout}s waiting for a blockchain client")
+
+    def _discard(self):
+        with self._lock:
+            self._created -= 1
+
+    def _ensure_healthy(self, service):
+        now = time.monotonic()
+        if now - service.last_health_check < self.health_check_interval:
+            return service
+
+        try:
+            connected = service.w3.is_connected()
+        except Exception:
+            connected = False
+
+        if connected:
+            service.last_health_check = now
+            return service
+
+        logger.warning("Pooled blockchain client lost its connection, reconnecting")
+        return self._create()
+
+    @contextmanager
+    def borrow(self):
+        """Check out a connected BlockchainService for the duration of the block"""
+        service = self._acquire()
+        try:
+            service = self._ensure_healthy(service)
+        except Exception:
+            self._discard()
+            raise
+
+        try:
+            yield service
+        except requests.exceptions.ConnectionError:
+            # Force a health check the next time this client is borrowed
+            service.last_health_check = float('-inf')
+            raise
+        finally:
+            self._idle.put(service)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_blockchain_pool():
+    """Return the process-wide BlockchainServicePool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = BlockchainServicePool()
+    return _pool
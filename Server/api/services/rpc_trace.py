@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import lru_cache
+
+from dotenv import load_dotenv
+from eth_utils import function_abi_to_4byte_selector
+
+load_dotenv()
+
+# Operation being traced in the current context (see trace_operation)
+_operation = ContextVar('rpc_operation', default=None)
+
+
+@lru_cache(maxsize=None)
+def contract_function_names():
+    """4-byte selector -> function name for the AppointmentContract ABI, so eth_calls can be told apart"""
+    from .blockchain import load_contract_abi
+    return {
+        '0x' + function_abi_to_4byte_selector(item).hex(): item['name']
+        for item in load_contract_abi() if item.get('type') == 'function'
+    }
+
+
+def call_label(method, params):
+    """RPC method, plus the contract function for eth_call / eth_estimateGas"""
+    if method in ('eth_call', 'eth_estimateGas') and params and isinstance(params[0], dict):
+        data = params[0].get('data') or params[0].get('input') or ''
+        if not isinstance(data, str):
+            data = '0x' + bytes(data).hex()
+        name = contract_function_names().get(data[:10])
+        if name:
+            return f"{method}:{name}"
+    return method
+
+
+def payload_size(params):
+    try:
+        return len(json.dumps(params, default=str))
+    except (TypeError, ValueError):
+        return None
+
+
+class OperationTrace:
+    """RPC calls and named steps of one BlockchainService operation"""
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.started = time.perf_counter()
+        self.calls = []
+        self.steps = {}
+
+    @contextmanager
+    def step(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps[name] = self.steps.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+    def breakdown(self):
+        """Total time, time per named step and calls/time/errors per RPC label, in milliseconds"""
+        by_call = {}
+        for call in self.calls:
+            entry = by_call.setdefault(call['label'], {'calls': 0, 'total_ms': 0.0, 'errors': 0})
+            entry['calls'] += 1
+            entry['total_ms'] += call['duration_ms']
+            entry['errors'] += call['error'] is not None
+        return {
+            'operation': self.operation,
+            'total_ms': (time.perf_counter() - self.started) * 1000,
+            'steps': self.steps,
+            'rpc': by_call,
+        }
+
+
+@contextmanager
+def trace_operation(operation, enabled=True):
+    """Collect every RPC made in this context into an OperationTrace (None when disabled)"""
+    if not enabled:
+        yield None
+        return
+    trace = OperationTrace(operation)
+    token = _operation.set(trace)
+    try:
+        yield trace
+    finally:
+        _operation.reset(token)
+
+
+def rpc_step(name):
+    """Time a named step of the traced operation; a no-op outside trace_operation"""
+    trace = _operation.get()
+    return trace.step(name) if trace is not None else nullcontext()
+
+
+class RpcTrace:
+    """Ring buffer of the most recent JSON-RPC calls, fed by a web3 request middleware"""
+
+    def __init__(self, size=None):
+        self.calls = deque(maxlen=size or int(os.getenv('BLOCKCHAIN_RPC_TRACE_SIZE', '1000')))
+        self._lock = threading.Lock()
+
+    def record(self, call):
+        with self._lock:
+            self.calls.append(call)
+        trace = _operation.get()
+        if trace is not None:
+            trace.calls.append(call)
+
+    def observe(self, method, params, started, error=None):
+        """Record a call that started at ``started`` (a perf_counter value) and has just finished"""
+        self.record({
+            'method': method,
+            'label': call_label(method, params),
+            'at': time.time(),
+            'duration_ms': (time.perf_counter() - started) * 1000,
+            'request_bytes': payload_size(params),
+            'error': error,
+        })
+
+    def observe_batch(self, calls, started, responses=None, error=None):
+        """Record every (method, params) call of one batch round trip
+
+        Each call gets an equal share of the round trip, so totals still add up, and
+        ``batch`` holds the number of calls sent together.
+        """
+        duration_ms = (time.perf_counter() - started) * 1000 / max(len(calls), 1)
+        for index, (method, params) in enumerate(calls):
+            call_error = error
+            if call_error is None and responses is not None and 'error' in responses[index]:
+                call_error = str(responses[index]['error'])
+            self.record({
+                'method': method,
+                'label': call_label(method, params),
+                'at': time.time(),
+                'duration_ms': duration_ms,
+                'request_bytes': payload_size(params),
+                'error': call_error,
+                'batch': len(calls),
+            })
+
+    def recent(self, limit=None):
+        with self._lock:
+            calls = list(self.calls)
+        return calls[-limit:] if limit else calls
+
+    def summary(self):
+        """Calls, errors, mean/max duration and request bytes per RPC label over the buffer"""
+        summary = {}
+        for call in self.recent():
+            entry = summary.setdefault(call['label'], {
+                'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'request_bytes': 0
+            })
+            entry['calls'] += 1
+            entry['errors'] += call['error'] is not None
+            entry['total_ms'] += call['duration_ms']
+            entry['max_ms'] = max(entry['max_ms'], call['duration_ms'])
+            entry['request_bytes'] += call['request_bytes'] or 0
+        for entry in summary.values():
+            entry['avg_ms'] = entry['total_ms'] / entry['calls']
+        return summary
+
+    def middleware(self, make_request, w3):
+        """web3 middleware recording method, duration, request size and error of every call"""
+        def trace_request(method, params):
+            started = time.perf_counter()
+            error = None
+            try:
+                response = make_request(method, params)
+                if 'error' in response:
+                    error = str(response['error'])
+                return response
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                self.observe(method, params, started, error)
+        return trace_request
+
+
+rpc_trace = RpcTrace()
@@ -0,0 +1,145 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from dotenv import load_dotenv
+from eth_account import Account
+from eth_account.messages import encode_defunct
+
+from api.metrics import (
+    SIGNATURE_IN_FLIGHT, SIGNATURE_QUEUE_WAIT, SIGNATURE_RECOVERY, SIGNATURE_VERIFICATIONS, SIGNATURE_WORKERS
+)
+
+logger = logging.getLogger('api')
+
+load_dotenv()
+
+
+class VerifierBusy(Exception):
+    """Every verification slot stayed taken for the whole queue timeout"""
+
+
+def recover_signer(message, signature):
+    """Recover the address that signed a text message, plus when the recovery started and how long it took"""
+    started = time.time()
+    address = Account.recover_message(encode_defunct(text=message), signature=signature)
+    return address, started, time.time() - started
+
+
+class SignatureVerifier:
+    """Runs secp256k1 recovery in a bounded process pool so it stays off the request threads
+
+    ``workers=0`` recovers inline, which is handy for development and tests.
+    """
+
+    def __init__(self, workers=None, queue_depth=None, queue_timeout=None):
+        self.workers = workers if workers is not None \
+            else int(os.getenv('SIGNATURE_WORKERS', str(min(4, os.cpu_count() or 1))))
+        self.queue_depth = queue_depth or int(os.getenv('SIGNATURE_QUEUE_DEPTH', '64'))
+        self.queue_timeout = queue_timeout or float(os.getenv('SIGNATURE_QUEUE_TIMEOUT', '5'))
+        self._slots = threading.BoundedSemaphore(self.queue_depth)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'verified': 0,
+            'rejected': 0,
+            'queue_wait_total': 0.0,
+            'queue_wait_max': 0.0,
+            'recovery_total': 0.0,
+            'recovery_max': 0.0,
+        }
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn, as forking a threaded web worker can deadlock the child
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                    SIGNATURE_WORKERS.set(self.workers)
+        return self._executor
+
+    def recover(self, message, signature):
+        """Address that signed the message; raises VerifierBusy when the queue is full"""
+        if not self.workers:
+            address, _, recovery = recover_signer(message, signature)
+            self._record(0.0, recovery)
+            return address
+
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self._stats['rejected'] += 1
+            SIGNATURE_VERIFICATIONS.inc(result='rejected')
+            raise VerifierBusy(f"Signature verification queue is full ({self.queue_depth} in flight)")
+        SIGNATURE_IN_FLIGHT.inc()
+        try:
+            submitted = time.time()
+            try:
+                future = self._pool().submit(recover_signer, message, signature)
+                address, started, recovery = future.result()
+            except BrokenProcessPool:
+                # A crashed worker breaks the whole pool, so start a new one for the next call
+                logger.error("Signature verification pool broke, recreating it")
+                with self._lock:
+                    self._executor = None
+                raise
+            self._record(max(0.0, started - submitted), recovery)
+            return address
+        finally:
+            SIGNATURE_IN_FLIGHT.dec()
+            self._slots.release()
+
+    def _record(self, queue_wait, recovery):
+        with self._lock:
+            stats = self._stats
+            stats['verified'] += 1
+            stats['queue_wait_total'] += queue_wait
+            stats['queue_wait_max'] = max(stats['queue_wait_max'], queue_wait)
+            stats['recovery_total'] += recovery
+            stats['recovery_max'] = max(stats['recovery_max'], recovery)
+        SIGNATURE_VERIFICATIONS.inc(result='verified')
+        SIGNATURE_QUEUE_WAIT.observe(queue_wait)
+        SIGNATURE_RECOVERY.observe(recovery)
+
+    def stats(self):
+        """Counters plus mean/max queue wait and recovery time in milliseconds"""
+        with self._lock:
+            stats = dict(self._stats)
+        verified = stats['verified'] or 1
+        return {
+            'workers': self.workers,
+            'queue_depth': self.queue_depth,
+            'verified': stats['verified'],
+            'rejected': stats['rejected'],
+            'queue_wait_ms_avg': stats['queue_wait_total'] / verified * 1000,
+            'queue_wait_ms_max': stats['queue_wait_max'] * 1000,
+            'recovery_ms_avg': stats['recovery_total'] / verified * 1000,
+            'recovery_ms_max': stats['recovery_max'] * 1000,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            SIGNATURE_WORKERS.set(0)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_signature_verifier():
+    """Return the process-wide SignatureVerifier, creating it on first use"""
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = SignatureVerifier()
+    return _verifier
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from api.models import Appointment, BlockchainUser, Doctor, Patient
+from .authentication import invalidate_user
+from .cache import bump_version
+from .metrics import count_query
+from .services.availability import get_availability_index
+
+
+@receiver([post_save, post_delete], sender=Doctor)
+def invalidate_doctor_cache(sender, **kwargs):
+    bump_version('doctors')
+
+
+@receiver([post_save, post_delete], sender=Patient)
+def invalidate_patient_cache(sender, **kwargs):
+    bump_version('patients')
+
+
+@receiver(post_save, sender=Appointment)
+def update_availability(sender, instance, **kwargs):
+    get_availability_index().appointment_saved(instance)
+
+
+@receiver(post_delete, sender=Appointment)
+def release_availability(sender, instance, **kwargs):
+    get_availability_index().appointment_deleted(instance)
+
+
+@receiver([post_save, post_delete], sender=BlockchainUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+@receiver(connection_created)
+def count_request_queries(sender, connection, **kwargs):
+    # The wrapper list outlives reconnects, so only add it once
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
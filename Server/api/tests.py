@@ -1,3 +1,1286 @@
-from django.test import TestCase
+import io
+import os
+import csv
+import json
+import runpy
+import asyncio
+import time as time_module
+from datetime import date, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+import psycopg2
+import requests
+import rlp
+from eth_abi import encode
+from django.core.cache import cache, caches
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from eth_utils import keccak
+from hexbytes import HexBytes
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, transaction
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from web3.datastructures import AttributeDict
+from web3.providers import AsyncHTTPProvider, BaseProvider
+
+from ehr.db.postgresql.base import ConnectionPool
+from api.authentication import tokens_for_user
+from api.cache import bump_version, get_version
+from api.export import EXPORT_FIELDS, appointment_rows
+from api.models import ACTIVE_APPOINTMENT, Appointment, BlockchainUser, ChainCheckpoint, Doctor, Patient
+from api.services.auth_nonce import AUTH_MESSAGE, LoginNonceStore
+from api.services.availability import SlotUnavailable, get_availability_index
+from api.services.activity import ActivityTracker
+from api.services.async_blockchain import AsyncBlockchainService, InstrumentedAsyncHTTPProvider
+from api.services.blockchain import BlockchainService
+from api.services.chain_cache import contract_constants
+from api.services.events import EventDecoder, get_event_decoder
+from api.services.indexer import EventIndexer
+from api.services.nonce import LocalNonceBackend, NonceManager
+from api.services.receipts import ReceiptTracker
+from api.services.registry import BlockchainServicePool, KeepAliveHTTPProvider
+from api.services.rpc_trace import rpc_trace
+from api.services.signatures import SignatureVerifier
+from api.views import AppointmentView, save_booking
+
+CONTRACT_ADDRESS = '0x' + '11' * 20
+SIGNER = Account.create()
+PATIENT = Account.create()
+APPOINTMENT_CREATED = keccak(text='AppointmentCreated(uint256,address,address,uint256)')
+
+
+class RpcError:
+    """Marks a FakeProvider response as a JSON-RPC error"""
+
+    def __init__(self, message):
+        self.message = message
+
+
+class FakeProvider(BaseProvider):
+    """JSON-RPC provider answering from a method -> result map; a callable result gets the params"""
+
+    def __init__(self, responses=None):
+        self.responses = {'eth_chainId': '0x539', 'web3_clientVersion': 'fake', **(responses or {})}
+        self.calls = []
+
+    def make_request(self, method, params):
+        self.calls.append((method, params))
+        result = self.responses.get(method)
+        if callable(result):
+            result = result(params)
+        if isinstance(result, RpcError):
+            return {'jsonrpc': '2.0', 'id': 1, 'error': {'code': -32000, 'message': result.message}}
+        return {'jsonrpc': '2.0', 'id': 1, 'result': result}
+
+    def is_connected(self, show_traceback=False):
+        return True
+
+    def methods(self):
+        return [method for method, _ in self.calls]
+
+
+def raw_receipt(tx_hash, logs=(), status=1):
+    """Receipt as a node returns it over JSON-RPC"""
+    return {
+        'blockHash': '0x' + '22' * 32, 'blockNumber': '0x1', 'contractAddress': None,
+        'cumulativeGasUsed': '0x5208', 'effectiveGasPrice': '0x3b9aca00', 'from': SIGNER.address,
+        'gasUsed': '0x5208', 'logs': list(logs), 'logsBloom': '0x' + '00' * 256, 'status': hex(status),
+        'to': CONTRACT_ADDRESS, 'transactionHash': tx_hash, 'transactionIndex': '0x0', 'type': '0x0',
+    }
+
+
+def created_log(tx_hash, appointment_id, doctor, timestamp=1900000000):
+    """AppointmentCreated log as a node returns it over JSON-RPC"""
+    data = encode(['uint256', 'address', 'address', 'uint256'], [appointment_id, PATIENT.address, doctor, timestamp])
+    return {
+        'address': CONTRACT_ADDRESS, 'topics': ['0x' + APPOINTMENT_CREATED.hex()], 'data': '0x' + data.hex(),
+        'blockHash': '0x' + '22' * 32, 'blockNumber': '0x1', 'transactionHash': tx_hash,
+        'transactionIndex': '0x0', 'logIndex': '0x0', 'removed': False,
+    }
+
+
+def use_fresh_nonces(test):
+    """Give the test its own nonce counters, seeded from eth_getTransactionCount"""
+    patcher = mock.patch('api.services.blockchain.nonce_manager', NonceManager(LocalNonceBackend()))
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+class ApiTestCase(TestCase):
+    """Starts every test without the cache and availability calendars earlier tests left in the process"""
+
+    def setUp(self):
+        cache.clear()
+        caches['state'].clear()
+        patcher = mock.patch('api.services.availability._index', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+def authenticate(client, user):
+    """Authenticate as the user with its access token, whose claims the role permissions read"""
+    client.force_authenticate(user, token=tokens_for_user(user).access_token)
+
+
+def load_settings(**env):
+    """ehr.settings evaluated afresh with the given environment variables, as a dict"""
+    with mock.patch.dict(os.environ, env):
+        return runpy.run_module('ehr.settings')
+
+
+def blockchain_service(provider):
+    with mock.patch.dict(os.environ, {
+        'APPOINTMENT_CONTRACT_ADDRESS': CONTRACT_ADDRESS,
+        'PRIVATE_KEY': SIGNER.key.hex(),
+    }):
+        return BlockchainService(provider)
+
+
+class SendTransactionTests(TestCase):
+    def setUp(self):
+        use_fresh_nonces(self)
+
+    def send(self, provider):
+        service = blockchain_service(provider)
+        return service.send_transaction(
+            service.contract.functions.completeAppointment(1),
+            {'from': SIGNER.address, 'gas': 200000, 'gasPrice': 10 ** 9},
+            SIGNER.key.hex()
+        )
+
+    def sent_transactions(self, provider):
+        return [params[0] for method, params in provider.calls if method == 'eth_sendRawTransaction']
+
+    def sent_nonces(self, provider):
+        # Legacy transactions: rlp([nonce, gasPrice, gas, to, value, data, v, r, s])
+        return [int.from_bytes(rlp.decode(bytes.fromhex(raw[2:]))[0], 'big') for raw in self.sent_transactions(provider)]
+
+    def test_already_known_returns_the_hash_without_resending(self):
+        provider = FakeProvider({
+            'eth_getTransactionCount': '0x5',
+            'eth_sendRawTransaction': RpcError('already known'),
+        })
+        tx_hash = self.send(provider)
+
+        raw = self.sent_transactions(provider)
+        self.assertEqual(len(raw), 1)
+        self.assertEqual(tx_hash, keccak(hexstr=raw[0]))
+        self.assertEqual(provider.methods().count('eth_getTransactionCount'), 1)
+
+    def test_nonce_too_low_resyncs_and_retries_once(self):
+        counts = iter(['0x5', '0x9'])
+        sends = iter([RpcError('nonce too low'), '0x' + 'ab' * 32])
+        provider = FakeProvider({
+            'eth_getTransactionCount': lambda params: next(counts),
+            'eth_sendRawTransaction': lambda params: next(sends),
+        })
+        self.send(provider)
+        self.assertEqual(self.sent_nonces(provider), [5, 9])
+
+    def test_rejected_sends_give_the_nonce_back(self):
+        for message in ('insufficient funds for gas * price + value', 'intrinsic gas too low',
+                        'replacement transaction underpriced'):
+            use_fresh_nonces(self)
+            provider = FakeProvider({
+                'eth_getTransactionCount': '0x5',
+                'eth_sendRawTransaction': RpcError(message),
+            })
+            with self.assertRaises(ValueError):
+                self.send(provider)
+            with self.assertRaises(ValueError):
+                self.send(provider)
+            # Never accepted, so nonce 5 is handed out again rather than leaving a gap; no retry either
+            self.assertEqual(self.sent_nonces(provider), [5, 5], message)
+
+    def test_timeouts_keep_the_nonce_in_flight(self):
+        def timeout(params):
+            raise requests.exceptions.ReadTimeout('read timed out')
+        provider = FakeProvider({
+            'eth_getTransactionCount': '0x5',
+            'eth_sendRawTransaction': timeout,
+        })
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.send(provider)
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.send(provider)
+        # The first transaction may still be mined, so the second takes the next nonce
+        self.assertEqual(provider.methods().count('eth_getTransactionCount'), 1)
+        self.assertEqual(self.sent_nonces(provider), [5, 6])
+
+    def test_underfunded_create_is_refused_before_sending(self):
+        provider = FakeProvider({
+            'eth_getTransactionCount': '0x5',
+            'eth_gasPrice': hex(10 ** 9),
+            'eth_getBalance': hex(10 ** 16),
+            'eth_call': '0x' + encode(['uint256'], [10 ** 16]).hex(),
+        })
+        service = blockchain_service(provider)
+        with mock.patch.dict(os.environ, {'PATIENT_PRIVATE_KEY': PATIENT.key.hex()}):
+            result = service.create_appointment(PATIENT.address, SIGNER.address, 1900000000, wait=False)
+
+        self.assertFalse(result['success'])
+        self.assertIn('Insufficient funds', result['error'])
+        self.assertEqual(self.sent_transactions(provider), [])
+
+
+class BlockchainServicePoolTests(TestCase):
+    """Pooled clients are reused, capped at the pool size and reconnected when they stop answering"""
+
+    def setUp(self):
+        self.created = []
+        self.pool = BlockchainServicePool(size=2, health_check_interval=30, timeout=0.01, rpc_url='http://node.invalid')
+        patcher = mock.patch.object(self.pool, '_create', side_effect=self.create)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create(self):
+        service = mock.Mock(last_health_check=time_module.monotonic())
+        self.created.append(service)
+        return service
+
+    def test_returned_clients_are_reused(self):
+        with self.pool.borrow() as first:
+            pass
+        with self.pool.borrow() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(len(self.created), 1)
+
+    def test_size_bounds_clients_in_use(self):
+        with self.pool.borrow(), self.pool.borrow():
+            with self.assertRaisesRegex(Exception, 'Timed out'):
+                with self.pool.borrow():
+                    pass
+        self.assertEqual(len(self.created), 2)
+
+    def test_connection_errors_force_a_health_check(self):
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            with self.pool.borrow() as broken:
+                raise requests.exceptions.ConnectionError()
+        broken.w3.is_connected.return_value = False
+
+        with self.pool.borrow() as service:
+            pass
+
+        broken.w3.is_connected.assert_called_once()
+        self.assertIs(service, self.created[1])
+
+
+class EventDecoderTests(TestCase):
+    """Logs are decoded by their topic, and logs of other contracts or unknown events are skipped"""
+
+    def formatted(self, log, **fields):
+        """A raw log with its topics and data as web3 returns them from a receipt"""
+        log = {**log, **fields}
+        return AttributeDict({
+            **log, 'topics': [HexBytes(topic) for topic in log['topics']], 'data': HexBytes(log['data'])
+        })
+
+    def test_decodes_our_events_only(self):
+        doctor = Account.create().address
+        ours = self.formatted(created_log('0x' + '33' * 32, 7, doctor))
+        foreign = self.formatted(created_log('0x' + '44' * 32, 8, doctor), address='0x' + '99' * 20)
+        unknown = self.formatted(created_log('0x' + '55' * 32, 9, doctor), topics=['0x' + 'ab' * 32])
+        truncated = self.formatted(created_log('0x' + '66' * 32, 10, doctor), data='0x1234')
+
+        events = get_event_decoder().decode_logs([ours, foreign, unknown, truncated], CONTRACT_ADDRESS.upper())
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['event'], 'AppointmentCreated')
+        self.assertEqual(events[0]['args'], {
+            'id': 7, 'patient': PATIENT.address.lower(), 'doctor': doctor.lower(), 'timestamp': 1900000000
+        })
+        self.assertEqual(events[0]['transactionHash'], '0x' + '33' * 32)
+
+    def test_indexed_arguments_come_from_the_topics(self):
+        decoder = EventDecoder([{
+            'type': 'event', 'name': 'Refunded', 'anonymous': False, 'inputs': [
+                {'name': 'id', 'type': 'uint256', 'indexed': True},
+                {'name': 'amount', 'type': 'uint256', 'indexed': False},
+            ],
+        }])
+        log = self.formatted({
+            'address': CONTRACT_ADDRESS, 'transactionHash': '0x' + '33' * 32, 'blockNumber': 1, 'logIndex': 0,
+            'topics': ['0x' + keccak(text='Refunded(uint256,uint256)').hex(), '0x' + encode(['uint256'], [7]).hex()],
+            'data': '0x' + encode(['uint256'], [500]).hex(),
+        })
+
+        self.assertEqual(decoder.decode(log)['args'], {'id': 7, 'amount': 500})
+
+
+class OperationTraceTests(TestCase):
+    """Per-operation RPC breakdowns are attached only when RPC_TRACE_ENABLED asks for them"""
+
+    def create(self):
+        use_fresh_nonces(self)
+        service = blockchain_service(FakeProvider({
+            'eth_getTransactionCount': '0x0',
+            'eth_gasPrice': hex(10 ** 9),
+            'eth_getBalance': hex(10 ** 18),
+            'eth_call': '0x' + encode(['uint256'], [10 ** 16]).hex(),
+            'eth_sendRawTransaction': lambda params: '0x' + keccak(hexstr=params[0]).hex(),
+        }))
+        with mock.patch.dict(os.environ, {'PATIENT_PRIVATE_KEY': PATIENT.key.hex()}):
+            return service.create_appointment(PATIENT.address, SIGNER.address, 1900000000, wait=False)
+
+    @override_settings(DEBUG=True)
+    def test_debug_alone_does_not_trace(self):
+        result = self.create()
+        self.assertTrue(result['success'])
+        self.assertNotIn('trace', result)
+
+    @override_settings(RPC_TRACE_ENABLED=True)
+    def test_enabled_setting_traces(self):
+        result = self.create()
+        self.assertTrue(result['success'])
+        self.assertIn('trace', result)
+
+
+class BatchRequestFallbackTests(TestCase):
+    """FakeProvider has no make_batch_request, so batch reads take the per-call fallback"""
+
+    def test_receipts_are_formatted_and_traced(self):
+        mined, pending = '0x' + 'aa' * 32, '0x' + 'bb' * 32
+        provider = FakeProvider({
+            'eth_getTransactionReceipt': lambda params: raw_receipt(mined) if params[0] == mined else None,
+        })
+        service = blockchain_service(provider)
+        traced = len(rpc_trace.recent())
+
+        receipt, missing = service.get_transaction_receipts([mined, pending])
+
+        self.assertIsNone(missing)
+        self.assertEqual(receipt.transactionHash, HexBytes(mined))
+        self.assertEqual(receipt.blockNumber, 1)
+        self.assertEqual(receipt.status, 1)
+        # Routed through the middleware onion, so the RPC trace saw both calls
+        labels = [call['label'] for call in rpc_trace.recent()[traced:]]
+        self.assertEqual(labels, ['eth_getTransactionReceipt', 'eth_getTransactionReceipt'])
+
+    def test_appointments_are_decoded_per_call(self):
+        service = blockchain_service(FakeProvider())
+        doctor, patient = Account.create().address, Account.create().address
+        encoded = service.w3.codec.encode(
+            ['uint256', 'address', 'address', 'uint256', 'uint256', 'bool', 'bool', 'bool'],
+            [7, patient, doctor, 1700000000, 10 ** 16, True, False, False]
+        )
+
+        def call(params):
+            appointment_id = int(params[0]['data'][-64:], 16)
+            return '0x' + encoded.hex() if appointment_id == 7 else RpcError('execution reverted')
+        service.w3.provider.responses['eth_call'] = call
+
+        found, failed = service.get_appointments([7, 8])
+
+        self.assertTrue(found['success'])
+        self.assertEqual(found['appointment']['id'], 7)
+        self.assertEqual(found['appointment']['doctor'].lower(), doctor.lower())
+        self.assertFalse(failed['success'])
+        self.assertIn('execution reverted', failed['error'])
+
+
+class ProviderTraceTests(TestCase):
+    """Calls that bypass the middleware onion are put in the RPC trace by the providers"""
+
+    def test_batched_calls_are_traced(self):
+        session = mock.Mock()
+        session.post.return_value.json.return_value = [
+            {'jsonrpc': '2.0', 'id': 1, 'error': {'code': -32000, 'message': 'execution reverted'}},
+            {'jsonrpc': '2.0', 'id': 0, 'result': None},
+        ]
+        provider = KeepAliveHTTPProvider('http://node.invalid', session=session)
+        traced = len(rpc_trace.recent())
+
+        responses = provider.make_batch_request([
+            ('eth_getTransactionReceipt', ['0x' + 'aa' * 32]),
+            ('eth_call', [{'to': CONTRACT_ADDRESS, 'data': '0x'}, 'latest']),
+        ])
+
+        self.assertEqual([response['id'] for response in responses], [0, 1])
+        calls = rpc_trace.recent()[traced:]
+        self.assertEqual([(call['method'], call['batch']) for call in calls],
+                         [('eth_getTransactionReceipt', 2), ('eth_call', 2)])
+        self.assertIsNone(calls[0]['error'])
+        self.assertIn('execution reverted', calls[1]['error'])
+
+    def test_async_calls_are_traced(self):
+        provider = InstrumentedAsyncHTTPProvider('http://node.invalid')
+        traced = len(rpc_trace.recent())
+
+        response = {'jsonrpc': '2.0', 'id': 0, 'result': '0x1'}
+        with mock.patch.object(AsyncHTTPProvider, 'make_request', mock.AsyncMock(return_value=response)):
+            asyncio.run(provider.make_request('eth_chainId', []))
+
+        [call] = rpc_trace.recent()[traced:]
+        self.assertEqual((call['method'], call['error']), ('eth_chainId', None))
+
+
+class AsyncCreateTests(TestCase):
+    def test_create_without_its_log_stays_pending(self):
+        with mock.patch.dict(os.environ, {
+            'APPOINTMENT_CONTRACT_ADDRESS': CONTRACT_ADDRESS,
+            'PRIVATE_KEY': SIGNER.key.hex(),
+            'PATIENT_PRIVATE_KEY': PATIENT.key.hex(),
+        }):
+            service = AsyncBlockchainService(InstrumentedAsyncHTTPProvider('http://node.invalid'))
+            service.get_deposit_amount = mock.AsyncMock(return_value=10 ** 16)
+            service._submit = mock.AsyncMock(return_value={
+                'success': True, 'transaction_hash': '0x' + 'ab' * 32, 'receipt': AttributeDict({'logs': []})
+            })
+
+            result = asyncio.run(service.create_appointment(PATIENT.address, SIGNER.address, 1900000000))
+
+        self.assertEqual(result, {'success': True, 'transaction_hash': '0x' + 'ab' * 32,
+                                  'appointment_id': None, 'status': 'pending'})
+
+
+class AppointmentListingTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        authenticate(self.client, BlockchainUser.objects.create(username='admin', address='0xadmin', role='admin'))
+        doctor = Doctor.objects.create(docID='D1', fName='Ada', lName='Lovelace')
+        patient = Patient.objects.create(patID='P1', patName='Alan')
+        # Several appointments share a (date, time), so only the id breaks the tie; as the doctor
+        # can only hold one active booking per slot, the earlier ones there failed on chain
+        slots = [(3, 9), (1, 10), (1, 9), (2, 9), (1, 9), (1, 10), (1, 9), (2, 9)]
+        for n, (day, start) in enumerate(slots):
+            Appointment.objects.create(doctor=doctor, patient=patient, date=date(2030, 1, day), time=time(start),
+                                       blockchain_status='failed' if (day, start) in slots[n + 1:] else 'confirmed')
+        self.expected = list(Appointment.objects.order_by('date', 'time', 'id').values_list('id', flat=True))
+
+    def walk(self, url):
+        ids, pages = [], 0
+        while url:
+            body = self.client.get(url).json()
+            self.assertEqual(body['status'], 'success')
+            ids.extend(appointment['id'] for appointment in body['data'])
+            url, pages = body['next'], pages + 1
+        return ids, pages
+
+    def test_cursor_pages_follow_date_time_id_order(self):
+        for url, page_size in (('/api/appointment/', 2), ('/api/getAppointmentDoc/D1', 3)):
+            ids, pages = self.walk(f'{url}?page_size={page_size}')
+            self.assertEqual(ids, self.expected)
+            self.assertEqual(pages, -(-len(self.expected) // page_size))
+
+    def test_unpaginated_listings_share_the_envelope(self):
+        for url in ('/api/appointment/', '/api/getAppointmentDoc/D1', '/api/getAppointmentPat/P1'):
+            body = self.client.get(url).json()
+            self.assertEqual(body['status'], 'success')
+            self.assertEqual(sorted(appointment['id'] for appointment in body['data']), sorted(self.expected))
+
+    def test_filters_apply_to_pages(self):
+        ids, _ = self.walk('/api/appointment/?page_size=2&date_from=2030-01-02')
+        self.assertEqual(ids, list(Appointment.objects.filter(date__gte=date(2030, 1, 2))
+                                   .order_by('date', 'time', 'id').values_list('id', flat=True)))
+
+    def test_page_boundaries(self):
+        # Pages that end exactly on the last row do not leave an empty page behind
+        for page_size in (len(self.expected), len(self.expected) // 2):
+            ids, pages = self.walk(f'/api/appointment/?page_size={page_size}')
+            self.assertEqual(ids, self.expected)
+            self.assertEqual(pages, len(self.expected) // page_size)
+
+        body = self.client.get(f'/api/appointment/?page_size={len(self.expected) + 1}').json()
+        self.assertEqual((len(body['data']), body['next'], body['next_cursor']), (len(self.expected), None, None))
+
+    def test_page_size_is_clamped(self):
+        for page_size, expected in (('0', 1), ('-3', 1), ('abc', len(self.expected)), ('100000', len(self.expected))):
+            body = self.client.get(f'/api/appointment/?page_size={page_size}').json()
+            self.assertEqual(len(body['data']), expected, page_size)
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get('/api/appointment/?cursor=not-a-cursor').status_code, 404)
+
+    def test_status_filter(self):
+        Appointment.objects.filter(id=self.expected[0]).update(status=True)
+        completed = self.client.get('/api/appointment/?status=true').json()['data']
+        self.assertEqual([appointment['id'] for appointment in completed], [self.expected[0]])
+        self.assertEqual(len(self.client.get('/api/appointment/?status=false').json()['data']), len(self.expected) - 1)
+        # An empty value is no filter at all
+        self.assertEqual(len(self.client.get('/api/appointment/?status=').json()['data']), len(self.expected))
+
+
+class ExportTests(ApiTestCase):
+    """/api/appointment/export/ streams the filtered appointments in listing order"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        authenticate(self.client, BlockchainUser.objects.create(username='admin', address='0xadmin', role='admin'))
+        doctor = Doctor.objects.create(docID='D1', fName='Ada', lName='Lovelace')
+        patient = Patient.objects.create(patID='P1', patName='Turing, "Alan"')
+        for day in (3, 1, 2):
+            Appointment.objects.create(doctor=doctor, patient=patient, date=date(2030, 1, day), time=time(9))
+
+    def export(self, query):
+        response = self.client.get(f'/api/appointment/export/?{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response, body = self.export('type=csv&date_from=2030-01-02')
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="appointments.csv"')
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(list(rows[0]), list(EXPORT_FIELDS))
+        self.assertEqual([row['date'] for row in rows], ['2030-01-02', '2030-01-03'])
+        self.assertEqual((rows[0]['docName'], rows[0]['patName']), ('Ada Lovelace', 'Turing, "Alan"'))
+
+    def test_ndjson(self):
+        response, body = self.export('')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['date'] for row in rows], ['2030-01-01', '2030-01-02', '2030-01-03'])
+        self.assertEqual(rows[0]['docID'], 'D1')
+
+    def test_rows_are_read_in_chunks(self):
+        rows = list(appointment_rows(Appointment.objects.all(), chunk_size=2))
+        self.assertEqual([row[EXPORT_FIELDS.index('date')] for row in rows],
+                         [date(2030, 1, 1), date(2030, 1, 2), date(2030, 1, 3)])
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get('/api/appointment/export/?type=xml').status_code, 400)
+
+
+class BulkCreateTests(ApiTestCase):
+    """create_appointments and the receipt tracker never confirm a booking without its chain id"""
+
+    def setUp(self):
+        super().setUp()
+        use_fresh_nonces(self)
+        self.doctor = Doctor.objects.create(docID='D1', fName='Ada', lName='Lovelace', address=Account.create().address)
+        self.patient = Patient.objects.create(patID='P1', patName='Alan', address=PATIENT.address)
+        self.sent = []
+        # The first transaction sent emits AppointmentCreated(5); the second one's log is missing
+        self.logs = {0: lambda tx_hash: [created_log(tx_hash, 5, self.doctor.address)], 1: lambda tx_hash: []}
+        self.provider = FakeProvider({
+            'eth_getTransactionCount': '0x0',
+            'eth_gasPrice': hex(10 ** 9),
+            'eth_getBalance': hex(10 ** 18),
+            'eth_call': '0x' + encode(['uint256'], [10 ** 16]).hex(),
+            'eth_sendRawTransaction': self.send,
+            'eth_getTransactionReceipt': self.receipt,
+        })
+        self.service = blockchain_service(self.provider)
+
+    def send(self, params):
+        self.sent.append('0x' + keccak(hexstr=params[0]).hex())
+        return self.sent[-1]
+
+    def receipt(self, params):
+        tx_hash = params[0]
+        return raw_receipt(tx_hash, self.logs[self.sent.index(tx_hash)](tx_hash))
+
+    def create(self):
+        with mock.patch.dict(os.environ, {'PATIENT_PRIVATE_KEY': PATIENT.key.hex()}):
+            return self.service.create_appointments(
+                PATIENT.address, [(self.doctor.address, 1900000000), (self.doctor.address, 1900003600)],
+                poll_interval=0
+            )
+
+    def test_receipt_without_created_event_stays_pending(self):
+        confirmed, unresolved = self.create()
+
+        self.assertEqual((confirmed['status'], confirmed['appointment_id']), ('confirmed', 5))
+        self.assertTrue(unresolved['success'])
+        self.assertEqual((unresolved['status'], unresolved['appointment_id']), ('pending', None))
+
+    def test_bulk_endpoint_saves_unresolved_bookings_as_pending(self):
+        client = APIClient()
+        authenticate(client, BlockchainUser.objects.create(username='pat', address=PATIENT.address, role='patient'))
+        pool = mock.Mock()
+        pool.borrow.return_value.__enter__ = lambda *args: self.service
+        pool.borrow.return_value.__exit__ = lambda *args: None
+        tracker = mock.Mock()
+
+        with mock.patch('api.views.get_blockchain_pool', return_value=pool), \
+                mock.patch('api.views.get_receipt_tracker', return_value=tracker), \
+                mock.patch.dict(os.environ, {'PATIENT_PRIVATE_KEY': PATIENT.key.hex()}):
+            response = client.post('/api/appointment/bulk/', {
+                'patID': 'P1', 'docID': 'D1', 'patient_address': PATIENT.address,
+                'appointments': [{'date': '2030-03-04', 'time': '09:00'}, {'date': '2030-03-04', 'time': '10:00'}],
+            }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        rows = list(Appointment.objects.order_by('time').values_list('blockchain_status', 'blockchain_id'))
+        self.assertEqual(rows, [('confirmed', '5'), ('pending', None)])
+        tracker.track.assert_called_once()
+
+    def test_tracker_confirms_only_with_an_id(self):
+        _, unresolved = self.create()
+        appointment = Appointment.objects.create(
+            doctor=self.doctor, patient=self.patient, date=date(2030, 3, 4), time=time(10),
+            blockchain_tx=unresolved['transaction_hash'], blockchain_status='pending', blockchain_action='create'
+        )
+        tracker = ReceiptTracker(timeout=600)
+
+        tracker._apply(self.service, [appointment], self.service.get_transaction_receipts([appointment.blockchain_tx]))
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.blockchain_status, appointment.blockchain_id), ('pending', None))
+
+        # The event shows up once the log can be decoded
+        self.logs[1] = lambda tx_hash: [created_log(tx_hash, 6, self.doctor.address)]
+        tracker._apply(self.service, [appointment], self.service.get_transaction_receipts([appointment.blockchain_tx]))
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.blockchain_status, appointment.blockchain_id), ('confirmed', '6'))
+
+
+class ReceiptTrackerTests(ApiTestCase):
+    """Complete/cancel outcomes stay off the booking, and unmined transactions do not hold up the batch"""
+
+    def setUp(self):
+        super().setUp()
+        self.doctor = Doctor.objects.create(docID='D1', fName='Ada', lName='Lovelace')
+        self.patient = Patient.objects.create(patID='P1', patName='Alan')
+        self.service = mock.Mock()
+        self.service.get_transaction_receipts.side_effect = lambda tx_hashes: [None] * len(tx_hashes)
+        pool = mock.Mock()
+        pool.borrow.return_value.__enter__ = lambda *args: self.service
+        pool.borrow.return_value.__exit__ = lambda *args: None
+        patcher = mock.patch('api.services.receipts.get_blockchain_pool', return_value=pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def appointment(self, hour, action, **fields):
+        return Appointment.objects.create(
+            doctor=self.doctor, patient=self.patient, date=date(2030, 3, 4), time=time(hour),
+            blockchain_id=str(hour), blockchain_tx=f'0x{hour:064x}', blockchain_action=action, **fields
+        )
+
+    def test_failed_actions_leave_the_booking_live(self):
+        reverted = self.appointment(9, 'complete', action_status='pending')
+        timed_out = self.appointment(10, 'cancel', action_status='pending')
+        Appointment.objects.filter(pk=timed_out.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        timed_out.refresh_from_db()
+
+        ReceiptTracker(timeout=600)._apply(self.service, [reverted, timed_out], [mock.Mock(status=0), None])
+
+        rows = Appointment.objects.order_by('time').values_list('blockchain_status', 'action_status', 'status')
+        self.assertEqual(list(rows), [('confirmed', 'failed', False), ('confirmed', 'failed', False)])
+        self.assertEqual(Appointment.objects.filter(ACTIVE_APPOINTMENT).count(), 2)
+
+    def test_reverted_create_gives_the_slot_back(self):
+        booking = self.appointment(9, 'create', blockchain_status='pending')
+        index = get_availability_index()
+        with self.assertRaises(SlotUnavailable):
+            index.hold(self.doctor.id, date(2030, 3, 4), time(9))
+
+        ReceiptTracker(timeout=600)._apply(self.service, [booking], [mock.Mock(status=0)])
+
+        index.release(index.hold(self.doctor.id, date(2030, 3, 4), time(9)))
+
+    def test_unmined_transactions_rotate_through_the_batch(self):
+        stuck = [self.appointment(hour, 'create', blockchain_status='pending') for hour in (9, 10, 11)]
+        tracker = ReceiptTracker(batch_size=2, timeout=600)
+
+        polled = []
+        for _ in range(3):
+            tracker.run_once()
+            polled.append(self.service.get_transaction_receipts.call_args[0][0])
+
+        self.assertEqual(polled[0], [stuck[0].blockchain_tx, stuck[1].blockchain_tx])
+        self.assertIn(stuck[2].blockchain_tx, polled[1])
+        self.assertEqual(Appointment.objects.filter(blockchain_status='pending').count(), 3)
+
+
+class EventIndexerTests(ApiTestCase):
+    """The indexer applies contract events range by range and resumes from its checkpoint"""
+
+    CREATE_TX = '0x' + '33' * 32
+
+    def setUp(self):
+        super().setUp()
+        self.doctor = Doctor.objects.create(docID='D1', fName='Ada', lName='Lovelace', address=Account.create().address)
+        self.patient = Patient.objects.create(patID='P1', patName='Alan')
+        self.hashes = {}
+        self.ranges = []
+        self.provider = FakeProvider({
+            'eth_blockNumber': '0x10',
+            'eth_getLogs': self.get_logs,
+            'eth_getBlockByNumber': lambda params: {'number': params[0], 'hash': self.block_hash(int(params[0], 16))},
+        })
+        pool = mock.Mock()
+        pool.borrow.return_value.__enter__ = lambda *args: blockchain_service(self.provider)
+        pool.borrow.return_value.__exit__ = lambda *args: None
+        patcher = mock.patch('api.services.indexer.get_blockchain_pool', return_value=pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def block_hash(self, number):
+        return self.hashes.get(number, '0x' + f'{number:064x}')
+
+    def get_logs(self, params):
+        from_block, to_block = int(params[0]['fromBlock'], 16), int(params[0]['toBlock'], 16)
+        self.ranges.append((from_block, to_block))
+        return [created_log(self.CREATE_TX, 7, self.doctor.address)] if from_block <= 11 <= to_block else []
+
+    def checkpoint(self):
+        return ChainCheckpoint.objects.get(name=f'appointments:{CONTRACT_ADDRESS}')
+
+    def test_events_are_applied_up_to_the_safe_head(self):
+        booking = Appointment.objects.create(
+            doctor=self.doctor, patient=self.patient, date=date(2030, 3, 4), time=time(9),
+            blockchain_tx=self.CREATE_TX, blockchain_status='pending', blockchain_action='create'
+        )
+        indexer = EventIndexer(confirmations=3, start_block=10, initial_window=2)
+
+        self.assertEqual(indexer.run_once(), 1)
+
+        booking.refresh_from_db()
+        self.assertEqual((booking.blockchain_id, booking.blockchain_status, booking.chain_state),
+                         ('7', 'confirmed', 'created'))
+        self.assertEqual(self.ranges, [(10, 11), (12, 13)])
+        checkpoint = self.checkpoint()
+        self.assertEqual((checkpoint.block_number, checkpoint.block_hash), (13, self.block_hash(13)))
+
+        # Nothing new below the safe head, so the next run does not fetch logs again
+        self.assertEqual(indexer.run_once(), 0)
+        self.assertEqual(len(self.ranges), 2)
+
+    def test_reorged_checkpoint_rewinds_by_the_confirmation_depth(self):
+        EventIndexer(confirmations=3, start_block=10, initial_window=10).run_once()
+        self.hashes[13] = '0x' + 'ee' * 32
+        self.provider.responses['eth_blockNumber'] = '0x11'
+
+        EventIndexer(confirmations=3, start_block=10, initial_window=10).run_once()
+
+        self.assertEqual(self.ranges, [(10, 13), (10, 14)])
+        self.assertEqual(self.checkpoint().block_number, 14)
+
+
+class SlotHoldTests(ApiTestCase):
+    """Booking views hold the parsed slot, give it back when the chain call fails and let the database arbitrate"""
+
+    def setUp(self):
+        super().setUp()
+        self.doctor = Doctor.objects.create(docID='D1', fName='Ada', lName='Lovelace', address=Account.create().address)
+        self.patient = Patient.objects.create(patID='P1', patName='Alan', address=PATIENT.address)
+        self.user = BlockchainUser.objects.create(username='pat', address=PATIENT.address, role='patient')
+        self.service = mock.Mock()
+        self.service.create_appointment.return_value = {'success': False, 'error': 'execution reverted'}
+        pool = mock.Mock()
+        pool.borrow.return_value.__enter__ = lambda *args: self.service
+        pool.borrow.return_value.__exit__ = lambda *args: None
+        for target, value in (('api.views.get_blockchain_pool', pool), ('api.views.get_receipt_tracker', mock.Mock())):
+            patcher = mock.patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def booking(self, **fields):
+        return {'docID': 'D1', 'patID': 'P1', 'patient_address': PATIENT.address,
+                'date': '2030-03-04', 'time': '9:00', **fields}
+
+    def post_view(self, data):
+        request = APIRequestFactory().post('/api/appointment/', data, format='json')
+        force_authenticate(request, self.user)
+        return AppointmentView.as_view()(request)
+
+    def assert_slot_free(self):
+        get_availability_index().release(get_availability_index().hold(self.doctor.id, date(2030, 3, 4), time(9)))
+
+    def test_single_digit_hours_are_booked(self):
+        self.service.create_appointment.return_value = {
+            'success': True, 'transaction_hash': '0x' + 'ab' * 32, 'appointment_id': 7, 'status': 'confirmed'
+        }
+        response = self.post_view(self.booking())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Appointment.objects.get().time, time(9))
+
+    def test_failed_chain_call_releases_the_slot(self):
+        client = APIClient()
+        authenticate(client, self.user)
+
+        self.assertEqual(self.post_view(self.booking()).status_code, 500)
+        self.assert_slot_free()
+        self.assertEqual(client.post('/api/appointment/', self.booking(), format='json').status_code, 500)
+        self.assert_slot_free()
+        self.assertFalse(Appointment.objects.exists())
+
+    def test_async_view_releases_the_slot(self):
+        async_service = mock.Mock()
+        async_service.create_appointment = mock.AsyncMock(return_value={'success': False, 'error': 'execution reverted'})
+        client = APIClient()
+
+        with mock.patch('api.async_views.get_async_blockchain_service', return_value=async_service):
+            response = client.post('/api/async/appointment/', self.booking(), format='json',
+                                   HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.user).access_token}")
+
+        self.assertEqual(response.status_code, 500)
+        async_service.create_appointment.assert_awaited_once()
+        self.assert_slot_free()
+
+    def test_bookings_unseen_by_this_process_are_refused(self):
+        self.assert_slot_free()
+        # Saved by another worker: no signal reaches this process's calendar
+        Appointment.objects.bulk_create([Appointment(doctor=self.doctor, patient=self.patient,
+                                                     date=date(2030, 3, 4), time=time(9, 15))])
+
+        self.assertEqual(self.post_view(self.booking()).status_code, 409)
+        self.service.create_appointment.assert_not_called()
+
+    def test_database_keeps_one_active_booking_per_slot(self):
+        slot = {'doctor': self.doctor, 'patient': self.patient, 'date': date(2030, 3, 4), 'time': time(9)}
+        first = Appointment.objects.create(**slot)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Appointment.objects.create(**slot)
+
+        first.blockchain_status = 'failed'
+        first.save()
+        Appointment.objects.create(**slot)
+
+    def test_losing_the_slot_at_save_time_is_a_conflict(self):
+        self.service.create_appointment.return_value = {
+            'success': True, 'transaction_hash': '0x' + 'ab' * 32, 'appointment_id': 7, 'status': 'confirmed'
+        }
+        # Another worker saves the same slot while this booking waits for the chain
+        def create_appointment(**kwargs):
+            Appointment.objects.bulk_create([Appointment(doctor=self.doctor, patient=self.patient,
+                                                         date=date(2030, 3, 4), time=time(9))])
+            return self.service.create_appointment.return_value
+        self.service.create_appointment.side_effect = create_appointment
+
+        response = self.post_view(self.booking())
+
+        self.assertEqual(response.status_code, 409)
+        # The mined booking is kept on record as failed rather than dropped
+        rows = Appointment.objects.order_by('id').values_list('blockchain_status', 'blockchain_tx', 'blockchain_id')
+        self.assertEqual(list(rows), [('confirmed', None, None), ('failed', '0x' + 'ab' * 32, '7')])
+
+    def test_other_integrity_errors_are_not_a_lost_slot(self):
+        # Saved by another worker with the same chain id after this request was validated
+        Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=date(2030, 3, 5), time=time(9),
+                                   blockchain_id='7')
+        def save(booking_status):
+            return Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=date(2030, 3, 4),
+                                              time=time(9), blockchain_id='7', blockchain_status=booking_status)
+
+        with self.assertRaises(IntegrityError):
+            save_booking(save, 'confirmed', self.doctor, date(2030, 3, 4), time(9), '0x' + 'ab' * 32)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_bulk_holds_check_the_database_once(self):
+        Appointment.objects.bulk_create([Appointment(doctor=self.doctor, patient=self.patient,
+                                                     date=date(2030, 3, 4), time=time(10))])
+        index = get_availability_index()
+        index.free_slots(self.doctor.id, date(2030, 3, 4), date(2030, 3, 4))
+        slots = [(self.doctor.id, date(2030, 3, 4), time(hour)) for hour in range(8, 18)]
+        slots.append((self.doctor.id, date(2030, 3, 4), time(8, 15)))
+
+        with self.assertNumQueries(1):
+            held = index.hold_many(slots)
+
+        refused = [slot[2] for slot, hold in zip(slots, held) if isinstance(hold, SlotUnavailable)]
+        self.assertEqual(refused, [time(10), time(8, 15)])
+        for hold in held:
+            if not isinstance(hold, SlotUnavailable):
+                index.release(hold)
+
+    def test_failed_and_cancelled_bookings_free_their_slot(self):
+        failed = Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=date(2030, 3, 4),
+                                            time=time(9), blockchain_status='failed')
+        Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=date(2030, 3, 4),
+                                   time=time(10), chain_state='cancelled')
+        index = get_availability_index()
+
+        slots = index.free_slots(self.doctor.id, date(2030, 3, 4), date(2030, 3, 4))[date(2030, 3, 4)]
+        self.assertIn(time(9), slots)
+        self.assertIn(time(10), slots)
+        self.assert_slot_free()
+
+        # A live booking leaving the active state gives its slot back too
+        live = Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=date(2030, 3, 4), time=time(11))
+        with self.assertRaises(SlotUnavailable):
+            index.hold(self.doctor.id, date(2030, 3, 4), time(11))
+        live.blockchain_status = 'failed'
+        live.save()
+        index.release(index.hold(self.doctor.id, date(2030, 3, 4), time(11)))
+        self.assertEqual(failed.blockchain_status, 'failed')
+
+
+class ProtectedPartiesTests(ApiTestCase):
+    def test_doctors_and_patients_with_appointments_are_kept(self):
+        doctor = Doctor.objects.create(docID='D1', fName='Ada', lName='Lovelace', address=Account.create().address)
+        patient = Patient.objects.create(patID='P1', patName='Alan', address=PATIENT.address)
+        Appointment.objects.create(doctor=doctor, patient=patient, date=date(2030, 3, 4), time=time(9))
+        client = APIClient()
+        client.force_authenticate(BlockchainUser.objects.create(username='admin', address=SIGNER.address, role='admin'))
+
+        self.assertEqual(client.delete(f'/api/doctor/{doctor.pk}/').status_code, 409)
+        self.assertEqual(client.delete(f'/api/patients/{patient.pk}/').status_code, 409)
+        self.assertEqual(Appointment.objects.values_list('doctor__docID', 'patient__patID').get(), ('D1', 'P1'))
+
+
+class RolePermissionTests(ApiTestCase):
+    """Doctor and patient endpoints refuse access tokens of the wrong role with 403"""
+
+    def setUp(self):
+        super().setUp()
+        doctor = Doctor.objects.create(docID='D1', fName='Ada', lName='Lovelace', address=Account.create().address)
+        patient = Patient.objects.create(patID='P1', patName='Alan', address=PATIENT.address)
+        self.appointment = Appointment.objects.create(doctor=doctor, patient=patient, date=date(2030, 3, 4),
+                                                      time=time(9), patient_address=PATIENT.address)
+        self.client = APIClient()
+
+    def as_role(self, role, address=None):
+        user = BlockchainUser.objects.create(username=role, address=address or Account.create().address, role=role)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(user).access_token}")
+
+    def test_doctor_endpoints_refuse_patients(self):
+        self.as_role('patient', PATIENT.address)
+        self.assertEqual(self.client.get('/api/getAppointmentDoc/D1').status_code, 403)
+        self.assertEqual(self.client.get('/api/appointment/').status_code, 403)
+        self.assertEqual(self.client.get('/api/appointment/export/').status_code, 403)
+        self.assertEqual(self.client.put(f'/api/async/appointment/{self.appointment.id}').status_code, 403)
+
+    def test_patient_endpoints_refuse_doctors(self):
+        self.as_role('doctor')
+        self.assertEqual(self.client.post('/api/appointment/', {}, format='json').status_code, 403)
+        self.assertEqual(self.client.post('/api/appointment/bulk/', {}, format='json').status_code, 403)
+        self.assertEqual(self.client.post('/api/async/appointment/', {}, format='json').status_code, 403)
+        self.assertEqual(self.client.get('/api/getAppointmentDoc/D1').status_code, 200)
+
+    def test_patients_only_reach_their_own_appointments(self):
+        self.as_role('patient')
+        self.assertEqual(self.client.get(f'/api/appointment/{self.appointment.id}/').status_code, 403)
+        self.assertEqual(self.client.delete(f'/api/async/appointment/{self.appointment.id}').status_code, 403)
+        self.assertEqual(self.client.get('/api/getAppointmentPat/P1').json()['data'], [])
+
+    def test_owner_sees_their_appointment(self):
+        self.as_role('patient', PATIENT.address)
+        self.assertEqual(self.client.get(f'/api/appointment/{self.appointment.id}/').status_code, 200)
+        self.assertEqual(len(self.client.get('/api/getAppointmentPat/P1').json()['data']), 1)
+
+
+class SqlitePragmaTests(TestCase):
+    def test_tuning_is_opt_in(self):
+        self.assertEqual(load_settings(SQLITE_TUNING='false')['SQLITE_PRAGMAS'], {})
+        pragmas = load_settings(SQLITE_TUNING='true', SQLITE_BUSY_TIMEOUT='1234')['SQLITE_PRAGMAS']
+        self.assertEqual((pragmas['journal_mode'], pragmas['synchronous'], pragmas['busy_timeout']),
+                         ('WAL', 'NORMAL', 1234))
+
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': 1234, 'cache_size': -2048})
+    def test_new_connections_get_the_pragmas(self):
+        connection = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA busy_timeout')
+                self.assertEqual(cursor.fetchone()[0], 1234)
+                cursor.execute('PRAGMA cache_size')
+                self.assertEqual(cursor.fetchone()[0], -2048)
+        finally:
+            connection.close()
+
+
+class PostgresSettingsTests(TestCase):
+    def test_pool_settings(self):
+        pooled = load_settings(DB_ENGINE='postgres', DB_POOL_SIZE='8', DB_POOL_TIMEOUT='2.5')['DATABASES']['default']
+        self.assertEqual(pooled['ENGINE'], 'ehr.db.postgresql')
+        # Pooled connections go back to the pool at the end of each request
+        self.assertEqual((pooled['POOL_SIZE'], pooled['POOL_TIMEOUT'], pooled['CONN_MAX_AGE']), (8, 2.5, 0))
+        self.assertTrue(pooled['HEALTH_CHECKS'])
+
+        persistent = load_settings(DB_ENGINE='postgres', DB_POOL_SIZE='0', DB_CONN_MAX_AGE='90',
+                                   DB_HEALTH_CHECKS='false')['DATABASES']['default']
+        self.assertEqual((persistent['POOL_SIZE'], persistent['CONN_MAX_AGE']), (0, 90))
+        self.assertFalse(persistent['HEALTH_CHECKS'])
+
+        self.assertEqual(load_settings(DB_ENGINE='sqlite')['DATABASES']['default']['ENGINE'],
+                         'django.db.backends.sqlite3')
+
+
+class ConnectionPoolTests(TestCase):
+    """The pool hands out idle connections newest first, skips dead ones and bounds how many are out"""
+
+    def setUp(self):
+        self.opened = []
+        self.pool = ConnectionPool(self.connect, size=2, timeout=0.01)
+
+    def connect(self):
+        connection = mock.Mock(closed=False)
+        connection.get_transaction_status.return_value = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        self.opened.append(connection)
+        return connection
+
+    def test_returned_connections_are_reused(self):
+        first, reused = self.pool.get()
+        self.assertFalse(reused)
+        self.pool.put(first)
+
+        self.assertEqual(self.pool.get(), (first, True))
+
+    def test_size_bounds_connections_in_use(self):
+        self.pool.get()
+        held, _ = self.pool.get()
+        with self.assertRaises(psycopg2.OperationalError):
+            self.pool.get()
+
+        self.pool.put(held)
+        self.assertEqual(self.pool.get(), (held, True))
+
+    def test_closed_and_idle_broken_connections_are_dropped(self):
+        closed, _ = self.pool.get()
+        stale, _ = self.pool.get()
+        self.pool.put(stale)
+        self.pool.put(closed)
+        closed.closed = True
+        stale.cursor.side_effect = psycopg2.OperationalError('server closed the connection')
+
+        # Idle past IDLE_CHECK_AFTER, so the stale one is pinged and fails
+        with mock.patch('ehr.db.postgresql.base.time.monotonic', return_value=time_module.monotonic() + 3600):
+            connection, reused = self.pool.get()
+
+        self.assertEqual((connection, reused), (self.opened[2], False))
+        stale.close.assert_called_once()
+
+    def test_open_transactions_are_rolled_back_on_return(self):
+        connection, _ = self.pool.get()
+        connection.get_transaction_status.return_value = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        self.pool.put(connection)
+        connection.rollback.assert_called_once()
+
+
+class ActivityTrackerTests(ApiTestCase):
+    """Session heartbeats only write last_login once it is stale, in one bulk_update per interval"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = BlockchainUser.objects.create(username='pat', address=PATIENT.address, role='patient')
+
+    def stored_last_login(self):
+        return BlockchainUser.objects.values_list('last_login', flat=True).get(pk=self.user.pk)
+
+    def test_recent_activity_is_not_written(self):
+        tracker = ActivityTracker(threshold=300, flush_interval=0)
+        stored = self.stored_last_login()
+
+        with self.assertNumQueries(0):
+            tracker.touch(self.user, now=stored + timedelta(seconds=299))
+
+        self.assertEqual(tracker.pending, {})
+        self.assertEqual(self.user.last_login, stored)
+
+    def test_stale_activity_is_coalesced_until_the_flush(self):
+        tracker = ActivityTracker(threshold=300, flush_interval=3600)
+        stale = self.stored_last_login() + timedelta(minutes=10)
+
+        with self.assertNumQueries(0):
+            tracker.touch(self.user, now=stale)
+            tracker.touch(self.user, now=stale + timedelta(seconds=5))
+
+        self.assertEqual(tracker.pending, {self.user.pk: stale + timedelta(seconds=5)})
+        with self.assertNumQueries(1):
+            self.assertEqual(tracker.flush(), 1)
+        self.assertEqual(self.stored_last_login(), stale + timedelta(seconds=5))
+
+    def test_session_verification_records_activity(self):
+        tracker = ActivityTracker(threshold=0, flush_interval=0)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.user).access_token}")
+        before = self.stored_last_login()
+
+        with mock.patch('api.views.get_activity_tracker', return_value=tracker):
+            response = self.client.get('/api/auth/verify-session/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(self.stored_last_login(), before)
+
+
+class CachedUserTests(ApiTestCase):
+    """Authenticated requests reuse the cached user until the user row changes"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = BlockchainUser.objects.create(username='pat', address=PATIENT.address, role='patient')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.user).access_token}")
+
+    def user_queries(self):
+        """Number of BlockchainUser reads one session check makes"""
+        table = BlockchainUser._meta.db_table
+        with mock.patch('api.views.get_activity_tracker'), CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/auth/verify-session/')
+        self.assertEqual(response.status_code, 200)
+        return sum(query['sql'].startswith('SELECT') and table in query['sql'] for query in queries)
+
+    def test_user_is_loaded_once(self):
+        self.assertEqual(self.user_queries(), 1)
+        self.assertEqual(self.user_queries(), 0)
+
+    def test_saving_the_user_drops_the_cached_copy(self):
+        self.user_queries()
+        self.user.is_active = False
+        self.user.save()
+
+        with mock.patch('api.views.get_activity_tracker'):
+            response = self.client.get('/api/auth/verify-session/')
+
+        self.assertEqual(response.status_code, 401)
+
+
+class LoginNonceTests(ApiTestCase):
+    """A login nonce is issued, signed, sent back once and refused after that"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        # Recover in this process instead of the verifier's worker pool
+        patcher = mock.patch('api.views.get_signature_verifier', return_value=SignatureVerifier(workers=0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login_request(self, account=PATIENT):
+        nonce = self.client.get(f'/api/auth/nonce/{account.address}/').json()['nonce']
+        message = encode_defunct(text=AUTH_MESSAGE.format(nonce=nonce))
+        signature = Account.sign_message(message, account.key).signature.hex()
+        return {'address': account.address, 'signature': signature, 'nonce': nonce}
+
+    def login(self, data):
+        return self.client.post('/api/auth/authenticate/', data, format='json')
+
+    def test_issue_verify_and_replay(self):
+        data = self.login_request()
+
+        response = self.login(data)
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['token']}")
+        self.assertEqual(self.client.get('/api/auth/verify-session/').status_code, 200)
+
+        self.client.credentials()
+        self.assertEqual(self.login(data).status_code, 401)
+
+    def test_login_writes_the_database_once(self):
+        BlockchainUser.objects.create(username='pat', address=PATIENT.address, role='patient')
+        data = self.login_request()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.login(data).status_code, 200)
+
+        writes = [query['sql'] for query in queries if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual(len(writes), 1, writes)
+
+    def test_nonce_is_required(self):
+        data = self.login_request()
+        del data['nonce']
+        self.assertEqual(self.login(data).status_code, 400)
+
+    def test_nonce_is_bound_to_its_address(self):
+        other = Account.create()
+        data = self.login_request(other)
+        data['address'] = PATIENT.address
+        self.assertEqual(self.login(data).status_code, 401)
+        # Refused before it is spent, so the rightful owner can still use it
+        data['address'] = other.address
+        self.assertEqual(self.login(data).status_code, 200)
+
+    def test_spent_nonces_outlive_the_response_cache(self):
+        nonces = LoginNonceStore(ttl=300)
+        nonce = nonces.issue(PATIENT.address)
+
+        self.assertTrue(nonces.verify(PATIENT.address, nonce))
+        self.assertTrue(nonces.consume(PATIENT.address, nonce))
+        # Dropping cached responses does not forget which nonces were spent
+        cache.clear()
+        self.assertFalse(LoginNonceStore(ttl=300).consume(PATIENT.address, nonce))
+
+
+class CacheVersionTests(ApiTestCase):
+    """Cached listings answer If-None-Match with 304 until a write bumps their version"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        authenticate(self.client, BlockchainUser.objects.create(username='admin', address='0xadmin', role='admin'))
+        Doctor.objects.create(docID='D1', fName='Ada', lName='Lovelace')
+
+    def test_etag_and_invalidation(self):
+        first = self.client.get('/api/doctor/')
+        etag = first['ETag']
+        self.assertEqual(first.status_code, 200)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/doctor/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/api/doctor/', HTTP_IF_NONE_MATCH=f'"other", W/{etag}').status_code, 304)
+
+        Doctor.objects.create(docID='D2', fName='Grace', lName='Hopper')
+        fresh = self.client.get('/api/doctor/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh['ETag'], etag)
+        self.assertEqual(len(fresh.json()), 2)
+
+    def test_namespaces_are_invalidated_separately(self):
+        self.client.get('/api/getCount')
+        patients = self.client.get('/api/patients/')['ETag']
+
+        Doctor.objects.create(docID='D2', fName='Grace', lName='Hopper')
+
+        self.assertEqual(self.client.get('/api/getCount').json()['doctor_count'], 2)
+        self.assertEqual(self.client.get('/api/patients/', HTTP_IF_NONE_MATCH=patients).status_code, 304)
+
+    def test_culling_cached_responses_keeps_the_versions(self):
+        bump_version('doctors')
+        version = get_version('doctors')
+        # More entries than the response cache holds, so it culls
+        for number in range(settings.CACHES['default'].get('OPTIONS', {}).get('MAX_ENTRIES', 300) + 1):
+            cache.set(f"filler:{number}", number)
+
+        self.assertEqual(get_version('doctors'), version)
+
+
+@override_settings(METRICS_TOKEN='scrape-secret')
+class MetricsAccessTests(ApiTestCase):
+    """/metrics is for the scraper's token or admins, and does not count its own scrapes"""
+
+    def scrape(self, authorization=None):
+        headers = {'HTTP_AUTHORIZATION': authorization} if authorization else {}
+        return self.client.get('/metrics', **headers)
+
+    def bearer(self, role):
+        user = BlockchainUser.objects.create(username=role, address=f'0x{role}', role=role)
+        return f"Bearer {tokens_for_user(user).access_token}"
+
+    def test_scraper_token_and_admins_are_allowed(self):
+        self.assertEqual(self.scrape('Bearer scrape-secret').status_code, 200)
+        self.assertEqual(self.scrape(self.bearer('admin')).status_code, 200)
+
+    def test_everyone_else_is_refused(self):
+        self.assertEqual(self.scrape().status_code, 401)
+        self.assertEqual(self.scrape('Bearer wrong-secret').status_code, 401)
+        self.assertEqual(self.scrape(self.bearer('patient')).status_code, 403)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_unset_token_is_not_a_match(self):
+        self.assertEqual(self.scrape('Bearer ').status_code, 401)
+
+    def test_chain_cache_lookups_are_published(self):
+        contract_constants.get(CONTRACT_ADDRESS, 'metrics-test', lambda: 1)
+        contract_constants.get(CONTRACT_ADDRESS, 'metrics-test', lambda: 1)
+        stats = contract_constants.stats()
+
+        body = self.scrape('Bearer scrape-secret').content.decode()
+        self.assertIn(f'ehr_chain_cache_lookups_total{{cache="contract_constants",result="hit"}} {stats["hits"]}', body)
+        self.assertIn(f'ehr_chain_cache_lookups_total{{cache="contract_constants",result="miss"}} {stats["misses"]}', body)
+        self.assertIn('ehr_chain_cache_lookups_total{cache="gas_price",result="hit"}', body)
+
+    def test_signature_verifications_are_published(self):
+        message = AUTH_MESSAGE.format(nonce='metrics-test')
+        signature = Account.sign_message(encode_defunct(text=message), PATIENT.key).signature
+        SignatureVerifier(workers=0).recover(message, signature)
+
+        body = self.scrape('Bearer scrape-secret').content.decode()
+        self.assertIn('ehr_signature_verifications_total{result="verified"}', body)
+        self.assertIn('ehr_signature_queue_wait_seconds_count', body)
+        self.assertIn('ehr_signature_recovery_seconds_count', body)
+
+    def test_scrapes_are_not_recorded(self):
+        for _ in range(2):
+            body = self.scrape('Bearer scrape-secret').content.decode()
+        self.assertNotIn('route="metrics"', body)
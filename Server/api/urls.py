@@ -2,9 +2,10 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     DoctorViewSet, PatientViewSet, AppointmentViewSet,
-    getAppointmentDoc, getAppointmentPat, getCount, clear,
+    getAppointmentDoc, getAppointmentPat, getCount, getAvailability, clear, getRpcTrace,
     BlockchainAuthView, SessionVerificationView, GetNonceView
 )
+from .async_views import appointmentAsync, appointmentDetailAsync
 
 router = DefaultRouter()
 router.register(r'doctor', DoctorViewSet)
@@ -18,7 +19,11 @@ urlpatterns = [
     path('getAppointmentPat/<int:id>', getAppointmentPat),
     path('getAppointmentPat/<str:pat_id>', getAppointmentPat),
     path('getCount', getCount),
+    path('availability/<str:doc_id>', getAvailability),
+    path('async/appointment/', appointmentAsync),
+    path('async/appointment/<int:id>', appointmentDetailAsync),
     path('clear', clear),
+    path('blockchain/rpc-trace', getRpcTrace),
     path('api-auth/', include('rest_framework.urls')),
     path('auth/authenticate/', BlockchainAuthView.as_view(), name='authenticate'),
     path('auth/verify-session/', SessionVerificationView.as_view(), name='verify-session'),
@@ -1,36 +1,100 @@
 from dataclasses import dataclass
 from django.shortcuts import render
+from django.http import HttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from api.models import Appointment, Doctor, Patient, BlockchainUser
+from api.models import ACTIVE_APPOINTMENT, Appointment, Doctor, Patient, BlockchainUser
 from .serializers import (
     AppointmentSerializer, DoctorSerializer, PatientSerializer,
     BlockchainUserSerializer
 )
+from .pagination import AppointmentCursorPagination, filter_appointments
+from .cache import cached_response
+from .export import EXPORT_FORMATS, export_appointments
+from .metrics import registry
+from .authentication import CachedJWTAuthentication, invalidate_user, tokens_for_user
+from .permissions import (
+    ADDRESS_CLAIM, ROLE_CLAIM, HasMetricsToken, IsAdminRole, IsDoctorRole, IsPatientRole, PatientOwnsAppointment,
+    token_claim
+)
 from rest_framework import viewsets
 from web3 import Web3
 import json
 import logging
 from django.core.cache import cache
 from django.conf import settings
-from eth_account.messages import encode_defunct
-from eth_account import Account
+from django.db import IntegrityError, transaction
+from django.db.models import ProtectedError
 import time
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
-from .services.blockchain import BlockchainService
-from datetime import datetime
+from .services.registry import get_blockchain_pool
+from .services.receipts import get_receipt_tracker
+from .services.availability import SlotUnavailable, get_availability_index
+from .services.auth_nonce import AUTH_MESSAGE, login_nonces
+from .services.activity import get_activity_tracker
+from .services.signatures import VerifierBusy, get_signature_verifier
+from .services.rpc_trace import rpc_trace
+from datetime import date, datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+# Largest series a single bulk booking request may submit
+BULK_APPOINTMENT_LIMIT = 52
+
+# Longest date range one availability query may cover
+AVAILABILITY_MAX_DAYS = 62
+
 # Create your views here.
 
 
+def wait_for_receipts():
+    """Whether chain writes block on the receipt or are resolved by the receipt tracker"""
+    return settings.BLOCKCHAIN_SUBMIT_MODE != 'async'
+
+
+def save_booking(save, blockchain_status, doctor, day, start, transaction_hash):
+    """Run save(blockchain_status) for a booking already sent to the chain and return its result
+
+    When another worker took the slot meanwhile, the booking is saved as failed instead, so
+    the transaction and the patient's deposit stay on record, and SlotUnavailable is raised.
+    """
+    try:
+        with transaction.atomic():
+            return save(blockchain_status)
+    except IntegrityError:
+        # Only a lost slot is expected here; any other constraint is a real error
+        if not Appointment.objects.filter(ACTIVE_APPOINTMENT, doctor=doctor, date=day, time=start).exists():
+            raise
+    logger.error(f"Slot {day} {start:%H:%M} was taken before the booking from {transaction_hash} was saved; "
+                 f"recorded as failed, cancel it on chain to refund the deposit")
+    with transaction.atomic():
+        save('failed')
+    raise SlotUnavailable(f"Doctor is already booked at {day} {start:%H:%M}")
+
+
+def with_trace(blockchain, blockchain_result):
+    """Add the RPC breakdown BlockchainService attaches to its results with RPC_TRACE_ENABLED"""
+    if 'trace' in blockchain_result:
+        blockchain['trace'] = blockchain_result['trace']
+    return blockchain
+
+
+def list_appointments(request, queryset):
+    """Filtered appointment listing, paginated by cursor when the client asks for a page"""
+    queryset = filter_appointments(queryset.select_related('doctor', 'patient'), request.query_params)
+    paginator = AppointmentCursorPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    if page is not None:
+        serializer = AppointmentSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+    serializer = AppointmentSerializer(queryset, many=True)
+    return Response({"status": "success", "data": serializer.data}, status.HTTP_200_OK)
+
+
 class DoctorView(APIView):
     def post(self, request):
         serializer = DoctorSerializer(data=request.data)
@@ -40,6 +104,7 @@ class DoctorView(APIView):
         else:
             return Response({"status": "error", "data": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
+    @cached_response('doctors')
     def get(self, request, id=None):
         print(id)
         if id:
@@ -68,6 +133,7 @@ class PatientView(APIView):
         else:
             return Response({"status": "error", "data": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
+    @cached_response('patients')
     def get(self, request, id=None):
         if id:
             patient = Patient.objects.filter(patID=id)
@@ -79,21 +145,8 @@ class PatientView(APIView):
 
 
 class AppointmentView(APIView):
-    blockchain_service = None
-
-    def __init__(self):
-        super().__init__()
-        try:
-            print("\n=== Initializing AppointmentView ===")
-            self.blockchain_service = BlockchainService()
-            print("=== AppointmentView Initialization Complete ===\n")
-        except Exception as e:
-            print(f"\n=== Error Initializing AppointmentView ===")
-            print(f"Error: {str(e)}")
-            print("==========================================\n")
-            raise
-
     def post(self, request):
+        hold = None
         try:
             doctor = Doctor.objects.get(docID=request.data.get('docID'))
             patient = Patient.objects.get(patID=request.data.get('patID'))
@@ -118,19 +171,25 @@ class AppointmentView(APIView):
             # Convert date and time to timestamp
             appointment_date = request.data.get('date')
             appointment_time = request.data.get('time')
-            timestamp = int(datetime.combine(
+            appointment_datetime = datetime.combine(
                 datetime.strptime(appointment_date, '%Y-%m-%d').date(),
                 datetime.strptime(appointment_time, '%H:%M').time()
-            ).timestamp())
+            )
+            timestamp = int(appointment_datetime.timestamp())
+
+            # Claim the slot before paying for a transaction that would double-book it
+            hold = get_availability_index().hold(doctor.id, appointment_datetime.date(), appointment_datetime.time())
 
             logger.info(f"Creating appointment on blockchain with patient_address: {patient_address}, doctor_address: {doctor.address}, timestamp: {timestamp}")
 
             # Create appointment on blockchain
-            blockchain_result = self.blockchain_service.create_appointment(
-                patient_address=patient_address,
-                doctor_address=doctor.address,
-                timestamp=timestamp
-            )
+            with get_blockchain_pool().borrow() as blockchain_service:
+                blockchain_result = blockchain_service.create_appointment(
+                    patient_address=patient_address,
+                    doctor_address=doctor.address,
+                    timestamp=timestamp,
+                    wait=wait_for_receipts()
+                )
 
             logger.info(f"Blockchain result: {blockchain_result}")
 
@@ -141,24 +200,39 @@ class AppointmentView(APIView):
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
 
-            # Create appointment in database
+            # Create appointment in database; doctor and patient are already loaded,
+            # so hand them to save() instead of letting the serializer look them up again
             appointment_data = request.data.copy()
-            appointment_data['docName'] = doctor.fName + ' ' + doctor.lName
-            appointment_data['patName'] = patient.patName
+            appointment_data.pop('docID', None)
+            appointment_data.pop('patID', None)
             appointment_data['blockchain_id'] = blockchain_result.get('appointment_id')
             appointment_data['blockchain_tx'] = blockchain_result['transaction_hash']
 
+            blockchain_status = blockchain_result.get('status', 'confirmed')
+
             serializer = AppointmentSerializer(data=appointment_data)
             if serializer.is_valid():
-                serializer.save()
+                save_booking(
+                    lambda booking_status: serializer.save(
+                        doctor=doctor,
+                        patient=patient,
+                        blockchain_status=booking_status,
+                        blockchain_action='create'
+                    ),
+                    blockchain_status, doctor, serializer.validated_data['date'], serializer.validated_data['time'],
+                    blockchain_result['transaction_hash']
+                )
+                if blockchain_status == 'pending':
+                    get_receipt_tracker().track()
                 logger.info(f"Appointment created successfully with blockchain_id: {blockchain_result.get('appointment_id')}")
                 return Response({
                     "status": "success",
                     "data": serializer.data,
-                    "blockchain": {
+                    "blockchain": with_trace({
                         "id": blockchain_result.get('appointment_id'),
-                        "transaction": blockchain_result['transaction_hash']
-                    }
+                        "transaction": blockchain_result['transaction_hash'],
+                        "status": blockchain_status
+                    }, blockchain_result)
                 }, status=status.HTTP_200_OK)
             else:
                 logger.error(f"Serializer errors: {serializer.errors}")
@@ -175,20 +249,27 @@ class AppointmentView(APIView):
             return Response({
                 "error": "Patient not found"
             }, status=status.HTTP_404_NOT_FOUND)
+        except SlotUnavailable as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_409_CONFLICT)
         except Exception as e:
             return Response({
                 "error": str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            if hold:
+                get_availability_index().release(hold)
 
     def get(self, request):
-        appointments = Appointment.objects.all()
-        serializer = AppointmentSerializer(appointments, many=True)
-        return Response({"status": "success", "data": serializer.data}, status.HTTP_200_OK)
+        return list_appointments(request, Appointment.objects.all())
 
     def put(self, request, id):
         try:
-            appointment = Appointment.objects.get(id=id)
-            doctor = Doctor.objects.get(docID=appointment.docID)
+            appointment = Appointment.objects.select_related('doctor').get(id=id)
+            doctor = appointment.doctor
+            if doctor is None:
+                raise Doctor.DoesNotExist
 
             # Check if doctor has a blockchain address
             if not doctor.address:
@@ -199,10 +280,12 @@ class AppointmentView(APIView):
                 )
 
             # Update appointment status on blockchain
-            blockchain_result = self.blockchain_service.complete_appointment(
-                doctor_address=doctor.address,
-                appointment_id=appointment.blockchain_id
-            )
+            with get_blockchain_pool().borrow() as blockchain_service:
+                blockchain_result = blockchain_service.complete_appointment(
+                    doctor_address=doctor.address,
+                    appointment_id=appointment.blockchain_id,
+                    wait=wait_for_receipts()
+                )
 
             if not blockchain_result['success']:
                 return Response({
@@ -210,16 +293,26 @@ class AppointmentView(APIView):
                 }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
             # Update appointment in database
-            appointment.status = True
-            appointment.save()
+            appointment.blockchain_tx = blockchain_result['transaction_hash']
+            appointment.blockchain_action = 'complete'
+            if blockchain_result.get('status') == 'pending':
+                # The receipt tracker marks the appointment completed once mined
+                appointment.action_status = 'pending'
+                appointment.save()
+                get_receipt_tracker().track()
+            else:
+                appointment.status = True
+                appointment.action_status = 'confirmed'
+                appointment.save()
 
             return Response({
                 "status": "success",
                 "data": {
                     "status": appointment.status,
-                    "blockchain": {
-                        "transaction": blockchain_result['transaction_hash']
-                    }
+                    "blockchain": with_trace({
+                        "transaction": blockchain_result['transaction_hash'],
+                        "status": appointment.action_status
+                    }, blockchain_result)
                 }
             }, status=status.HTTP_200_OK)
 
@@ -238,8 +331,10 @@ class AppointmentView(APIView):
 
     def delete(self, request, id):
         try:
-            appointment = Appointment.objects.get(id=id)
-            patient = Patient.objects.get(patID=appointment.patID)
+            appointment = Appointment.objects.select_related('patient').get(id=id)
+            patient = appointment.patient
+            if patient is None:
+                raise Patient.DoesNotExist
 
             # Check if patient has a blockchain address
             if not patient.address:
@@ -250,24 +345,35 @@ class AppointmentView(APIView):
                 )
 
             # Cancel appointment on blockchain
-            blockchain_result = self.blockchain_service.cancel_appointment(
-                user_address=patient.address,
-                appointment_id=appointment.blockchain_id
-            )
+            with get_blockchain_pool().borrow() as blockchain_service:
+                blockchain_result = blockchain_service.cancel_appointment(
+                    user_address=patient.address,
+                    appointment_id=appointment.blockchain_id,
+                    wait=wait_for_receipts()
+                )
 
             if not blockchain_result['success']:
                 return Response({
                     "error": f"Blockchain error: {blockchain_result['error']}"
                 }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            # Delete appointment from database
-            appointment.delete()
+            if blockchain_result.get('status') == 'pending':
+                # The receipt tracker deletes the appointment once the cancellation is mined
+                appointment.blockchain_tx = blockchain_result['transaction_hash']
+                appointment.action_status = 'pending'
+                appointment.blockchain_action = 'cancel'
+                appointment.save()
+                get_receipt_tracker().track()
+            else:
+                # Delete appointment from database
+                appointment.delete()
 
             return Response({
                 "status": "success",
                 "data": True,
                 "blockchain": {
-                    "transaction": blockchain_result['transaction_hash']
+                    "transaction": blockchain_result['transaction_hash'],
+                    "status": blockchain_result.get('status', 'confirmed')
                 }
             }, status=status.HTTP_200_OK)
 
@@ -286,24 +392,27 @@ class AppointmentView(APIView):
 
 
 @api_view(['GET'])
+@permission_classes([IsAuthenticated, IsDoctorRole])
 def getAppointmentDoc(request, id):
-    appointments = Appointment.objects.filter(docID=id)
-    serializer = AppointmentSerializer(appointments, many=True)
-    return Response({"status": "success", "data": serializer.data}, status.HTTP_200_OK)
+    return list_appointments(request, Appointment.objects.filter(doctor__docID=id))
 
 
 @api_view(['GET'])
+@permission_classes([IsAuthenticated, IsPatientRole | IsDoctorRole])
 def getAppointmentPat(request, id=None, pat_id=None):
     # If string ID is provided, use that
     patient_id = pat_id if pat_id is not None else id
     
     # Filter appointments by patID
-    appointments = Appointment.objects.filter(patID=patient_id)
-    serializer = AppointmentSerializer(appointments, many=True)
-    return Response({"status": "success", "data": serializer.data}, status.HTTP_200_OK)
+    queryset = Appointment.objects.filter(patient__patID=patient_id)
+    if token_claim(request, ROLE_CLAIM) == 'patient':
+        # Patients only see their own history
+        queryset = queryset.filter(patient__address__iexact=token_claim(request, ADDRESS_CLAIM))
+    return list_appointments(request, queryset)
 
 
 @api_view(['GET'])
+@cached_response('doctors', 'patients')
 def getCount(request):
     doctor_count = Doctor.objects.count()
     patient_count = Patient.objects.count()
@@ -313,40 +422,111 @@ def getCount(request):
     })
 
 
+@api_view(['GET'])
+def getAvailability(request, doc_id):
+    """Free slots of a doctor from date_from to date_to (the next 7 days by default)"""
+    try:
+        doctor = Doctor.objects.get(docID=doc_id)
+    except Doctor.DoesNotExist:
+        return Response({"error": "Doctor not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        date_from = date.fromisoformat(request.query_params.get('date_from') or date.today().isoformat())
+        date_to = date.fromisoformat(request.query_params.get('date_to') or (date_from + timedelta(days=6)).isoformat())
+    except ValueError:
+        return Response({"error": "Dates must use the YYYY-MM-DD format"}, status=status.HTTP_400_BAD_REQUEST)
+    if date_to < date_from or (date_to - date_from).days >= AVAILABILITY_MAX_DAYS:
+        return Response(
+            {"error": f"date_to must be on or after date_from and within {AVAILABILITY_MAX_DAYS} days of it"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    availability = get_availability_index()
+    days = availability.free_slots(doctor.id, date_from, date_to)
+    return Response({
+        "status": "success",
+        "data": {
+            "docID": doctor.docID,
+            "slot_minutes": availability.slot_minutes,
+            "days": {day.isoformat(): [slot.strftime('%H:%M') for slot in slots] for day, slots in days.items()}
+        }
+    })
+
+
 @api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdminRole])
 def clear(request):
+    Appointment.objects.all().delete()
     Doctor.objects.all().delete()
     Patient.objects.all().delete()
-    Appointment.objects.all().delete()
     return Response({'message': 'All data cleared successfully'})
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminRole])
+def getRpcTrace(request):
+    """Per-call summary and the most recent JSON-RPC calls from the trace ring buffer"""
+    try:
+        limit = int(request.query_params.get('limit', 100))
+    except ValueError:
+        return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        "status": "success",
+        "data": {
+            "summary": rpc_trace.summary(),
+            "calls": rpc_trace.recent(limit)
+        }
+    })
+
+
 class DoctorViewSet(viewsets.ModelViewSet):
     queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
 
+    @cached_response('doctors')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def destroy(self, request, *args, **kwargs):
+        try:
+            return super().destroy(request, *args, **kwargs)
+        except ProtectedError:
+            return Response({"error": "Doctor has appointments and cannot be deleted"}, status=status.HTTP_409_CONFLICT)
+
 class PatientViewSet(viewsets.ModelViewSet):
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
 
+    @cached_response('patients')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def destroy(self, request, *args, **kwargs):
+        try:
+            return super().destroy(request, *args, **kwargs)
+        except ProtectedError:
+            return Response({"error": "Patient has appointments and cannot be deleted"}, status=status.HTTP_409_CONFLICT)
+
 class AppointmentViewSet(viewsets.ModelViewSet):
-    queryset = Appointment.objects.all()
+    queryset = Appointment.objects.select_related('doctor', 'patient')
     serializer_class = AppointmentSerializer
-    blockchain_service = None
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        try:
-            print("\n=== Initializing AppointmentViewSet ===")
-            self.blockchain_service = BlockchainService()
-            print("=== AppointmentViewSet Initialization Complete ===\n")
-        except Exception as e:
-            print(f"\n=== Error Initializing AppointmentViewSet ===")
-            print(f"Error: {str(e)}")
-            print("==========================================\n")
-            raise
+    def get_permissions(self):
+        # Patients book, staff see every appointment, and one appointment is for its patient or staff
+        if self.action in ('create', 'bulk'):
+            extra = [IsPatientRole()]
+        elif self.action in ('list', 'export'):
+            extra = [IsDoctorRole()]
+        else:
+            extra = [PatientOwnsAppointment()]
+        return [IsAuthenticated(), *extra]
+
+    def list(self, request, *args, **kwargs):
+        # Same {"status", "data"} envelope as the other appointment listings, paginated or not
+        return list_appointments(request, self.get_queryset())
 
     def create(self, request, *args, **kwargs):
+        hold = None
         try:
             doctor = Doctor.objects.get(docID=request.data.get('docID'))
             patient = Patient.objects.get(patID=request.data.get('patID'))
@@ -386,6 +566,9 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                 
             timestamp = int(appointment_datetime.timestamp())
 
+            # Claim the slot before paying for a transaction that would double-book it
+            hold = get_availability_index().hold(doctor.id, appointment_datetime.date(), appointment_datetime.time())
+
             print(f"\n=== Creating Blockchain Appointment ===")
             print(f"Patient Address: {patient_address}")
             print(f"Doctor Address: {doctor.address}")
@@ -394,11 +577,13 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             print(f"Appointment Time: {appointment_datetime}")
 
             # Create appointment on blockchain
-            blockchain_result = self.blockchain_service.create_appointment(
-                patient_address=patient_address,
-                doctor_address=doctor.address,
-                timestamp=timestamp
-            )
+            with get_blockchain_pool().borrow() as blockchain_service:
+                blockchain_result = blockchain_service.create_appointment(
+                    patient_address=patient_address,
+                    doctor_address=doctor.address,
+                    timestamp=timestamp,
+                    wait=wait_for_receipts()
+                )
 
             print(f"Blockchain Result: {blockchain_result}")
 
@@ -408,26 +593,46 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
 
-            # Create appointment in database
+            # Create appointment in database; doctor and patient are already loaded,
+            # so hand them to save() instead of letting the serializer look them up again
             appointment_data = request.data.copy()
-            appointment_data['docName'] = doctor.fName + ' ' + doctor.lName
-            appointment_data['patName'] = patient.patName
+            appointment_data.pop('docID', None)
+            appointment_data.pop('patID', None)
             appointment_data['blockchain_id'] = blockchain_result.get('appointment_id')
             appointment_data['blockchain_tx'] = blockchain_result['transaction_hash']
 
+            blockchain_status = blockchain_result.get('status', 'confirmed')
+
             serializer = self.get_serializer(data=appointment_data)
             serializer.is_valid(raise_exception=True)
-            self.perform_create(serializer)
+            save_booking(
+                lambda booking_status: serializer.save(
+                    doctor=doctor,
+                    patient=patient,
+                    blockchain_status=booking_status,
+                    blockchain_action='create'
+                ),
+                blockchain_status, doctor, serializer.validated_data['date'], serializer.validated_data['time'],
+                blockchain_result['transaction_hash']
+            )
             headers = self.get_success_headers(serializer.data)
+
+            if blockchain_status == 'pending':
+                # Row is confirmed (and gets its blockchain_id) once the receipt is mined
+                get_receipt_tracker().track()
+                response_status = status.HTTP_202_ACCEPTED
+            else:
+                response_status = status.HTTP_201_CREATED
             
             return Response({
                 "status": "success",
                 "data": serializer.data,
-                "blockchain": {
+                "blockchain": with_trace({
                     "id": blockchain_result.get('appointment_id'),
-                    "transaction": blockchain_result['transaction_hash']
-                }
-            }, status=status.HTTP_201_CREATED, headers=headers)
+                    "transaction": blockchain_result['transaction_hash'],
+                    "status": blockchain_status
+                }, blockchain_result)
+            }, status=response_status, headers=headers)
 
         except Doctor.DoesNotExist:
             return Response({
@@ -437,6 +642,10 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             return Response({
                 "error": "Patient not found"
             }, status=status.HTTP_404_NOT_FOUND)
+        except SlotUnavailable as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_409_CONFLICT)
         except Exception as e:
             print(f"\n=== Error Creating Appointment ===")
             print(f"Error: {str(e)}")
@@ -444,6 +653,161 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             return Response({
                 "error": str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            if hold:
+                get_availability_index().release(hold)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Book a series of appointments for one patient with a single chain submission round"""
+        items = request.data.get('appointments')
+        patient_address = request.data.get('patient_address')
+        if not isinstance(items, list) or not items:
+            return Response({"error": "appointments must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > BULK_APPOINTMENT_LIMIT:
+            return Response(
+                {"error": f"At most {BULK_APPOINTMENT_LIMIT} appointments can be booked at once"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not patient_address:
+            return Response({"error": "Patient blockchain address is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            patient = Patient.objects.get(patID=request.data.get('patID'))
+        except Patient.DoesNotExist:
+            return Response({"error": "Patient not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        # Items inherit docID from the request unless they name their own doctor
+        default_doc_id = request.data.get('docID')
+        doctors = Doctor.objects.in_bulk(
+            {item.get('docID', default_doc_id) for item in items if isinstance(item, dict)},
+            field_name='docID'
+        )
+
+        results = [None] * len(items)
+        slots = []
+        now = datetime.now()
+        for index, item in enumerate(items):
+            try:
+                doctor = doctors.get(item.get('docID', default_doc_id))
+                appointment_datetime = datetime.combine(
+                    datetime.strptime(item.get('date'), '%Y-%m-%d').date(),
+                    datetime.strptime(item.get('time'), '%H:%M').time()
+                )
+            except (AttributeError, TypeError, ValueError):
+                results[index] = {"index": index, "success": False, "error": "Each appointment needs a date (YYYY-MM-DD) and time (HH:MM)"}
+                continue
+            if doctor is None:
+                results[index] = {"index": index, "success": False, "error": "Doctor not found"}
+            elif not doctor.address:
+                results[index] = {"index": index, "success": False, "error": "Doctor blockchain address is not set"}
+            elif appointment_datetime <= now:
+                results[index] = {"index": index, "success": False, "error": "Appointment must be scheduled for a future date and time"}
+            else:
+                slots.append((index, doctor, appointment_datetime))
+
+        # Hold every slot in the doctors' calendars; overlaps, including ones inside this request, are refused
+        availability = get_availability_index()
+        holds = []
+        free_slots = []
+        held = availability.hold_many([
+            (doctor.id, appointment_datetime.date(), appointment_datetime.time())
+            for _, doctor, appointment_datetime in slots
+        ])
+        for (index, doctor, appointment_datetime), hold in zip(slots, held):
+            if isinstance(hold, SlotUnavailable):
+                results[index] = {"index": index, "success": False, "error": str(hold)}
+                continue
+            holds.append(hold)
+            free_slots.append((index, doctor, appointment_datetime))
+
+        try:
+            if free_slots:
+                try:
+                    with get_blockchain_pool().borrow() as blockchain_service:
+                        submitted = blockchain_service.create_appointments(
+                            patient_address,
+                            [(doctor.address, int(slot.timestamp())) for _, doctor, slot in free_slots],
+                            wait=wait_for_receipts()
+                        )
+                except Exception as e:
+                    logger.error(f"Bulk appointment submission failed: {str(e)}")
+                    return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+                appointments = []
+                for (index, doctor, appointment_datetime), blockchain_result in zip(free_slots, submitted):
+                    if not blockchain_result['success']:
+                        results[index] = {"index": index, "success": False, "error": f"Blockchain error: {blockchain_result['error']}"}
+                        continue
+                    appointment_id = blockchain_result.get('appointment_id')
+                    appointments.append((index, blockchain_result, Appointment(
+                        doctor=doctor,
+                        patient=patient,
+                        date=appointment_datetime.date(),
+                        time=appointment_datetime.time(),
+                        patient_address=patient_address,
+                        blockchain_id=str(appointment_id) if appointment_id is not None else None,
+                        blockchain_tx=blockchain_result['transaction_hash'],
+                        blockchain_status=blockchain_result['status'],
+                        blockchain_action='create'
+                    )))
+
+                try:
+                    with transaction.atomic():
+                        Appointment.objects.bulk_create([appointment for _, _, appointment in appointments])
+                except IntegrityError:
+                    # Another worker booked one of the slots meanwhile; save row by row to find which
+                    saved = []
+                    for index, blockchain_result, appointment in appointments:
+                        def save(booking_status, appointment=appointment):
+                            appointment.blockchain_status = booking_status
+                            appointment.save()
+                        try:
+                            save_booking(save, appointment.blockchain_status, appointment.doctor, appointment.date,
+                                         appointment.time, blockchain_result['transaction_hash'])
+                        except SlotUnavailable as e:
+                            results[index] = {"index": index, "success": False, "error": str(e)}
+                            continue
+                        saved.append((index, blockchain_result, appointment))
+                    appointments = saved
+                for index, blockchain_result, appointment in appointments:
+                    # bulk_create sends no post_save, so record the bookings directly
+                    availability.appointment_saved(appointment)
+                    results[index] = {
+                        "index": index,
+                        "success": True,
+                        "data": self.get_serializer(appointment).data,
+                        "blockchain": {
+                            "id": blockchain_result.get('appointment_id'),
+                            "transaction": blockchain_result['transaction_hash'],
+                            "status": blockchain_result['status']
+                        }
+                    }
+                if any(blockchain_result['status'] == 'pending' for _, blockchain_result, _ in appointments):
+                    get_receipt_tracker().track()
+        finally:
+            for hold in holds:
+                availability.release(hold)
+
+        created = sum(result['success'] for result in results)
+        return Response({
+            "status": "success" if created == len(results) else "partial" if created else "error",
+            "created": created,
+            "data": results
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream every matching appointment as NDJSON (default) or CSV with constant memory"""
+        # 'format' is taken by DRF's renderer selection, hence 'type'
+        export_format = request.query_params.get('type', 'ndjson').lower()
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": f"type must be one of: {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = filter_appointments(Appointment.objects.all(), request.query_params)
+        return export_appointments(queryset, export_format)
 
 class BlockchainAuthView(APIView):
     authentication_classes = []  # No authentication required
@@ -453,33 +817,27 @@ class BlockchainAuthView(APIView):
         try:
             address = request.data.get('address')
             signature = request.data.get('signature')
+            # The signed nonce travels with the request, so any worker can check it
+            nonce = request.data.get('nonce')
             
-            if not address or not signature:
+            if not address or not signature or not nonce:
                 return Response(
-                    {"error": "Address and signature are required"}, 
+                    {"error": "Address, signature and nonce are required"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
             # Normalize the address
             address = Web3.to_checksum_address(address)
-            
-            # Get or create user
-            user, created = BlockchainUser.objects.get_or_create(
-                address=address,
-                defaults={
-                    'username': f'user_{address[:8]}',
-                    'is_active': True
-                }
-            )
-            
-            # Generate a new nonce if needed
-            if not user.nonce:
-                user.generate_nonce()
-            
-            # Verify the signature
+
+            if not login_nonces.verify(address, nonce):
+                return Response(
+                    {"error": "Nonce is invalid or expired, request a new one"},
+                    status=status.HTTP_401_UNAUTHORIZED
+                )
+
+            # Verify the signature (recovered in the signature worker pool, off this thread)
             try:
-                message = encode_defunct(text=f"Sign this message to authenticate with EHR system. Nonce: {user.nonce}")
-                recovered_address = Account.recover_message(message, signature=signature)
+                recovered_address = get_signature_verifier().recover(AUTH_MESSAGE.format(nonce=nonce), signature)
                 
                 if recovered_address.lower() != address.lower():
                     logger.warning(f"Signature verification failed for address {address}")
@@ -487,23 +845,44 @@ class BlockchainAuthView(APIView):
                         {"error": "Invalid signature"}, 
                         status=status.HTTP_401_UNAUTHORIZED
                     )
+            except VerifierBusy as e:
+                logger.warning(f"Login rejected, {str(e)}")
+                return Response(
+                    {"error": "Too many logins in progress, please retry"},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': '1'}
+                )
             except Exception as e:
                 logger.error(f"Signature verification error: {str(e)}")
                 return Response(
                     {"error": "Signature verification failed"}, 
                     status=status.HTTP_401_UNAUTHORIZED
                 )
-            
+
+            # Only spend the nonce once the signature is good, so bad attempts cannot burn it
+            if not login_nonces.consume(address, nonce):
+                return Response(
+                    {"error": "Nonce has already been used"},
+                    status=status.HTTP_401_UNAUTHORIZED
+                )
+
+            # A single write per login: the insert for a new wallet, or the last_login update
+            user, created = BlockchainUser.objects.get_or_create(
+                address=address,
+                defaults={
+                    'username': f'user_{address[:8]}',
+                    'is_active': True
+                }
+            )
+            if not created:
+                user.last_login = timezone.now()
+                BlockchainUser.objects.filter(pk=user.pk).update(last_login=user.last_login)
+                invalidate_user(user.pk)
+
             # Generate JWT tokens
-            refresh = RefreshToken.for_user(user)
+            refresh = tokens_for_user(user)
             access_token = str(refresh.access_token)
-            
-            # Update user's last login
-            user.save()
-            
-            # Generate new nonce for next login
-            user.generate_nonce()
-            
+
             return Response({
                 "token": access_token,
                 "refresh": str(refresh),
@@ -518,7 +897,7 @@ class BlockchainAuthView(APIView):
             )
 
 class SessionVerificationView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
@@ -537,9 +916,8 @@ class SessionVerificationView(APIView):
                     status=status.HTTP_401_UNAUTHORIZED
                 )
             
-            # Update last activity timestamp
-            user.last_login = timezone.now()
-            user.save()
+            # Record activity in memory; it reaches the database in periodic bulk writes
+            get_activity_tracker().touch(user)
             
             return Response({
                 "user": BlockchainUserSerializer(user).data
@@ -561,17 +939,8 @@ class GetNonceView(APIView):
             # Normalize the address
             address = Web3.to_checksum_address(address)
             
-            # Get or create user
-            user, created = BlockchainUser.objects.get_or_create(
-                address=address,
-                defaults={
-                    'username': f'user_{address[:8]}',
-                    'is_active': True
-                }
-            )
-            
-            # Generate a new nonce
-            nonce = user.generate_nonce()
+            # Stateless until spent; the user row is only touched once the wallet signs in
+            nonce = login_nonces.issue(address)
             
             return Response({'nonce': nonce}, status=status.HTTP_200_OK)
             
@@ -581,3 +950,16 @@ class GetNonceView(APIView):
                 {"error": "Failed to generate nonce"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class MetricsView(APIView):
+    """Prometheus scrape endpoint for the METRICS_TOKEN bearer or an admin's access token"""
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [HasMetricsToken | IsAdminRole]
+
+    def perform_authentication(self, request):
+        # Authenticate lazily: a scraper's METRICS_TOKEN is not a JWT, so only decode when it is not that
+        pass
+
+    def get(self, request):
+        return HttpResponse(registry.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
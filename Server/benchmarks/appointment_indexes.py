@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+Appointment index benchmark
+
+Fills a scratch database with synthetic appointments, then times the real lookup
+paths (doctor calendar, patient history, blockchain id/tx, and the cursor paginator's
+own page query at the start, middle and end of the history) and prints their query
+plans with the schema before and after the index migration.
+
+Usage (from the Server directory):
+    python benchmarks/appointment_indexes.py --rows 1000000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+from datetime import date, time as dtime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ehr.settings')
+
+import django
+from django.conf import settings
+
+BEFORE_MIGRATION = '0003_chain_state_checkpoint'
+AFTER_MIGRATION = '0004_appointment_indexes'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help='Synthetic appointments to insert')
+    parser.add_argument('--doctors', type=int, default=200)
+    parser.add_argument('--patients', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=50, help='Timed runs per query')
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_indexes.sqlite3'),
+                        help='Scratch SQLite file (the database is recreated on every run)')
+    return parser.parse_args()
+
+
+def appointment_model(migration):
+    """Appointment as it looked at the given migration, so the benchmark keeps working as the model evolves"""
+    from django.db import connection
+    from django.db.migrations.loader import MigrationLoader
+
+    state = MigrationLoader(connection).project_state(('api', migration))
+    return state.apps.get_model('api', 'Appointment')
+
+
+def seed(rows, doctors, patients):
+    Appointment = appointment_model(BEFORE_MIGRATION)
+
+    random.seed(42)
+    start = date(2020, 1, 1)
+    batch = []
+    for i in range(rows):
+        batch.append(Appointment(
+            docID=f"DOC{random.randrange(doctors):04d}",
+            docName='Doctor',
+            patID=f"PAT{random.randrange(patients):06d}",
+            patName='Patient',
+            date=start + timedelta(days=random.randrange(365 * 5)),
+            time=dtime(8 + random.randrange(10), random.choice((0, 30))),
+            blockchain_id=str(i + 1),
+            blockchain_tx=f"0x{i:064x}",
+        ))
+        if len(batch) == 10000:
+            Appointment.objects.bulk_create(batch)
+            batch = []
+            print(f"\r  inserted {i + 1}/{rows}", end='', flush=True)
+    if batch:
+        Appointment.objects.bulk_create(batch)
+    print()
+
+
+def cursor_positions(Appointment, rows):
+    """Decoded cursors of the first page and of pages halfway and near the end of the ordering"""
+    from api.pagination import AppointmentCursorPagination
+
+    ordered = Appointment.objects.order_by(*AppointmentCursorPagination.ordering).values_list('date', 'time', 'id')
+    return {
+        'keyset page 1': None,
+        'keyset page at 50%': ordered[rows // 2],
+        'keyset page at 99%': ordered[rows * 99 // 100],
+    }
+
+
+def keyset_page(Appointment, position):
+    """The exact queryset AppointmentCursorPagination runs for the page after position"""
+    from api.pagination import AppointmentCursorPagination
+
+    paginator = AppointmentCursorPagination()
+    return paginator.page_queryset(Appointment.objects.all(), position, paginator.page_size)
+
+
+def queries(Appointment, doctors, patients, rows, positions):
+    day = date(2022, 6, 15)
+    runs = {
+        'doctor day (docID, date)': lambda: list(
+            Appointment.objects.filter(docID=f"DOC{random.randrange(doctors):04d}", date=day).order_by('time')),
+        'patient history (patID)': lambda: list(
+            Appointment.objects.filter(patID=f"PAT{random.randrange(patients):06d}").order_by('date')),
+        'by blockchain_id': lambda: list(
+            Appointment.objects.filter(blockchain_id=str(random.randrange(1, rows)))),
+        'by blockchain_tx': lambda: list(
+            Appointment.objects.filter(blockchain_tx=f"0x{random.randrange(rows):064x}")),
+    }
+    for name, position in positions.items():
+        runs[name] = lambda position=position: list(keyset_page(Appointment, position))
+    return runs
+
+
+def explain(Appointment, name, positions):
+    day = date(2022, 6, 15)
+    if name in positions:
+        return keyset_page(Appointment, positions[name]).explain()
+    querysets = {
+        'doctor day (docID, date)': Appointment.objects.filter(docID='DOC0001', date=day).order_by('time'),
+        'patient history (patID)': Appointment.objects.filter(patID='PAT000001').order_by('date'),
+        'by blockchain_id': Appointment.objects.filter(blockchain_id='1'),
+        'by blockchain_tx': Appointment.objects.filter(blockchain_tx=f"0x{1:064x}"),
+    }
+    return querysets[name].explain()
+
+
+def measure(migration, label, args):
+    print(f"\n=== {label} ===")
+    Appointment = appointment_model(migration)
+    positions = cursor_positions(Appointment, args.rows)
+    results = {}
+    for name, run in queries(Appointment, args.doctors, args.patients, args.rows, positions).items():
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = statistics.median(timings)
+        print(f"{name:32s} p50 {results[name]:9.3f} ms   max {max(timings):9.3f} ms")
+        print(f"    plan: {explain(Appointment, name, positions)}")
+    return results
+
+
+def main():
+    args = parse_args()
+    # Always a scratch SQLite file, never the configured database: the run migrates and fills it
+    if os.path.abspath(args.db) == os.path.abspath(str(settings.DATABASES['default']['NAME'])):
+        sys.exit(f"{args.db} is the configured database; pass a scratch file with --db")
+    settings.DATABASES['default'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': args.db}
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command('migrate', 'api', BEFORE_MIGRATION, verbosity=0)
+    print(f"Seeding {args.rows} appointments...")
+    seed(args.rows, args.doctors, args.patients)
+
+    before = measure(BEFORE_MIGRATION, f"Before ({BEFORE_MIGRATION})", args)
+    started = time.perf_counter()
+    call_command('migrate', 'api', AFTER_MIGRATION, verbosity=0)
+    print(f"\nIndex migration took {time.perf_counter() - started:.1f}s")
+    after = measure(AFTER_MIGRATION, f"After ({AFTER_MIGRATION})", args)
+
+    print("\n=== Speedup (p50) ===")
+    for name in before:
+        print(f"{name:32s} {before[name] / max(after[name], 1e-6):8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
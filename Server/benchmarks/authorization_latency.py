@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Authorization latency benchmark
+
+Times an authenticated, role-restricted request three ways on a scratch database:
+  db       JWTAuthentication loads the user row and the role is read from it
+  cached   CachedJWTAuthentication (user from the cache) with the role claim
+  token    stateless JWT user with the role claim, no database or cache lookup
+
+Usage (from the Server directory):
+    python benchmarks/authorization_latency.py --requests 5000
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ehr.settings')
+
+import django
+from django.conf import settings
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000, help='Timed requests per variant')
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_authz.sqlite3'),
+                        help='Scratch SQLite file (the database is recreated on every run)')
+    return parser.parse_args()
+
+
+def build_views():
+    from rest_framework.permissions import BasePermission, IsAuthenticated
+    from rest_framework.response import Response
+    from rest_framework.views import APIView
+    from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+    from api.authentication import CachedJWTAuthentication
+    from api.permissions import IsDoctorRole
+
+    class IsDoctorRow(BasePermission):
+        def has_permission(self, request, view):
+            return request.user.role in ('doctor', 'admin')
+
+    class DoctorOnly(APIView):
+        def get(self, request):
+            return Response({"status": "success"})
+
+    return {
+        'db': DoctorOnly.as_view(authentication_classes=[JWTAuthentication],
+                                 permission_classes=[IsAuthenticated, IsDoctorRow]),
+        'cached': DoctorOnly.as_view(authentication_classes=[CachedJWTAuthentication],
+                                     permission_classes=[IsAuthenticated, IsDoctorRole]),
+        'token': DoctorOnly.as_view(authentication_classes=[JWTStatelessUserAuthentication],
+                                    permission_classes=[IsAuthenticated, IsDoctorRole]),
+    }
+
+
+def main():
+    args = parse_args()
+    # Always a scratch SQLite file, never the configured database: the run migrates and fills it
+    if os.path.abspath(args.db) == os.path.abspath(str(settings.DATABASES['default']['NAME'])):
+        sys.exit(f"{args.db} is the configured database; pass a scratch file with --db")
+    settings.DATABASES['default'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': args.db}
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIRequestFactory
+    from api.authentication import tokens_for_user
+    from api.models import BlockchainUser
+
+    call_command('migrate', verbosity=0)
+    user = BlockchainUser.objects.create(address='0x' + 'd' * 40, username='bench_doctor', role='doctor')
+    header = f"Bearer {tokens_for_user(user).access_token}"
+    factory = APIRequestFactory()
+
+    print(f"{args.requests} requests per variant")
+    for name, view in build_views().items():
+        # Warm up (fills the user cache for the cached variant)
+        assert view(factory.get('/', HTTP_AUTHORIZATION=header)).status_code == 200
+        with CaptureQueriesContext(connection) as queries:
+            view(factory.get('/', HTTP_AUTHORIZATION=header))
+
+        timings = []
+        for _ in range(args.requests):
+            request = factory.get('/', HTTP_AUTHORIZATION=header)
+            started = time.perf_counter()
+            view(request)
+            timings.append((time.perf_counter() - started) * 1_000_000)
+        timings.sort()
+        print(f"{name:8s} p50 {statistics.median(timings):8.1f} us   p99 {timings[int(len(timings) * 0.99) - 1]:8.1f} us   "
+              f"queries/request {len(queries.captured_queries)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+"""
+BlockchainService microbenchmark
+
+Deploys AppointmentContract into an in-process EVM (eth-tester + py-evm, every
+transaction mined on arrival) and times create, confirm, complete, cancel and get
+through BlockchainService, sequentially and from concurrent threads. Reports
+ops/sec and p50/p99 latency per operation and can save them as JSON, or compare a
+run against a saved baseline and exit non-zero on a regression.
+
+Needs the benchmark dependencies: pip install -r requirements-bench.txt
+
+Usage (from the Server directory):
+    python benchmarks/blockchain_service.py --ops 200 --concurrency 8 --output bench_blockchain.json
+    python benchmarks/blockchain_service.py --compare bench_blockchain.json --tolerance 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ehr.settings')
+
+import django
+from django.conf import settings
+import rlp
+from eth_account import Account
+from eth_utils import keccak
+from hexbytes import HexBytes
+from web3 import Web3, EthereumTesterProvider
+
+OPERATIONS = ('create', 'confirm', 'complete', 'cancel', 'get')
+MODES = ('sequential', 'concurrent')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ops', type=int, default=200, help='Appointments created per mode (half completed, half cancelled)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Threads sharing the service in concurrent mode')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--trace', action='store_true', help='Run with RPC_TRACE_ENABLED, so the per-operation RPC traces are measured too')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare this run against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative slowdown of ops/sec and p99 against the baseline')
+    return parser.parse_args()
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    return ordered[max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))]
+
+
+class SerializedTesterProvider(EthereumTesterProvider):
+    """EthereumTesterProvider handling one request at a time, with a node-like mempool
+
+    py-evm is not thread-safe, so concurrent threads queue here rather than inside the EVM.
+    eth-tester mines every transaction on arrival and rejects a nonce ahead of the sender's,
+    while a node would hold it until the gap is filled; threads sending nonces the service
+    allocated in order can reach the chain out of order, so such transactions are held here.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._held = {}
+
+    def make_request(self, method, params):
+        with self._lock:
+            if method == 'eth_sendRawTransaction':
+                return self._send_in_nonce_order(method, params)
+            return super().make_request(method, params)
+
+    def _send_in_nonce_order(self, method, params):
+        raw_transaction = HexBytes(params[0])
+        sender = Account.recover_transaction(raw_transaction)
+        # The service signs legacy transactions: rlp([nonce, gasPrice, gas, to, value, data, v, r, s])
+        nonce = int.from_bytes(rlp.decode(raw_transaction)[0], 'big')
+        held = self._held.setdefault(sender, {})
+        if nonce > self.ethereum_tester.get_nonce(sender):
+            held[nonce] = params
+            return {'jsonrpc': '2.0', 'id': 1, 'result': '0x' + keccak(raw_transaction).hex()}
+
+        response = super().make_request(method, params)
+        while self.ethereum_tester.get_nonce(sender) in held:
+            super().make_request(method, held.pop(self.ethereum_tester.get_nonce(sender)))
+        return response
+
+
+def deploy_contract():
+    """Start an in-process chain, deploy the contract and point the service's settings at it"""
+    from api.services.blockchain import CONTRACT_PATH
+
+    provider = SerializedTesterProvider()
+    w3 = Web3(provider)
+    with open(CONTRACT_PATH) as f:
+        contract_json = json.load(f)
+    contract = w3.eth.contract(abi=contract_json['abi'], bytecode=contract_json['bytecode'])
+    receipt = w3.eth.wait_for_transaction_receipt(contract.constructor().transact({'from': w3.eth.accounts[0]}))
+
+    # Funded test accounts: the first signs as the doctor, the second as the patient
+    doctor_key, patient_key = provider.ethereum_tester.backend.account_keys[:2]
+    os.environ['APPOINTMENT_CONTRACT_ADDRESS'] = receipt.contractAddress
+    os.environ['PRIVATE_KEY'] = doctor_key.to_hex()
+    os.environ['PATIENT_PRIVATE_KEY'] = patient_key.to_hex()
+    return provider, doctor_key.public_key.to_checksum_address(), patient_key.public_key.to_checksum_address()
+
+
+def run_operation(fn, items, concurrency):
+    """Time fn over items, one at a time or from a thread pool; returns the operation's stats"""
+    def timed(item):
+        started = time.perf_counter()
+        result = fn(item)
+        return result, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(timed, items))
+    else:
+        results = [timed(item) for item in items]
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for _, latency in results)
+    failures = sum(not result['success'] for result, _ in results)
+    return {
+        'ops': len(results),
+        'failures': failures,
+        'ops_per_sec': len(results) / elapsed,
+        'mean_ms': statistics.fmean(latencies),
+        'p50_ms': percentile(latencies, 0.50),
+        'p99_ms': percentile(latencies, 0.99),
+    }, [result for result, _ in results]
+
+
+def run_mode(service, doctor, patient, ops, concurrency):
+    """create -> confirm -> complete the first half / cancel the second half -> get, for ops appointments"""
+    # Far enough ahead that every appointment is still in the future when cancelled
+    timestamp = int(time.time()) + 7 * 24 * 3600
+    stats = {}
+
+    stats['create'], created = run_operation(
+        lambda i: service.create_appointment(patient, doctor, timestamp + i * 60),
+        range(ops), concurrency)
+    ids = [result['appointment_id'] for result in created if result['success']]
+    half = len(ids) // 2
+
+    stats['confirm'], _ = run_operation(
+        lambda appointment_id: service.confirm_appointment(doctor, appointment_id),
+        ids[:half], concurrency)
+    stats['complete'], _ = run_operation(
+        lambda appointment_id: service.complete_appointment(doctor, appointment_id),
+        ids[:half], concurrency)
+    stats['cancel'], _ = run_operation(
+        lambda appointment_id: service.cancel_appointment(doctor, appointment_id),
+        ids[half:], concurrency)
+    stats['get'], _ = run_operation(
+        service.get_appointment, ids, concurrency)
+    return stats
+
+
+def compare(results, baseline, tolerance):
+    """Operations slower than the baseline by more than tolerance, as printable lines"""
+    regressions = []
+    for mode, operations in results.items():
+        for name, current in operations.items():
+            previous = baseline.get(mode, {}).get(name)
+            if not previous:
+                continue
+            if current['ops_per_sec'] < previous['ops_per_sec'] * (1 - tolerance):
+                regressions.append(f"{mode} {name}: {previous['ops_per_sec']:.1f} -> {current['ops_per_sec']:.1f} ops/s")
+            if current['p99_ms'] > previous['p99_ms'] * (1 + tolerance):
+                regressions.append(f"{mode} {name}: p99 {previous['p99_ms']:.2f} -> {current['p99_ms']:.2f} ms")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    try:
+        import eth_tester  # noqa: F401
+    except ImportError:
+        sys.exit("eth-tester is not installed; pip install -r requirements-bench.txt")
+    settings.RPC_TRACE_ENABLED = args.trace
+    django.setup()
+
+    from api.services.blockchain import BlockchainService
+    from api.services.nonce import nonce_manager
+
+    results = {}
+    for mode in args.modes:
+        # A fresh chain per mode, so both start from the same state
+        provider, doctor, patient = deploy_contract()
+        service = BlockchainService(provider)
+        # Same accounts on a new chain: drop the nonces counted on the previous one
+        for address in (doctor, patient):
+            nonce_manager.resync(service.w3, address)
+        concurrency = args.concurrency if mode == 'concurrent' else 1
+        results[mode] = run_mode(service, doctor, patient, args.ops, concurrency)
+
+        print(f"{mode} ({concurrency} thread{'s' if concurrency > 1 else ''}, {args.ops} appointments)")
+        for name in OPERATIONS:
+            stat = results[mode][name]
+            print(f"  {name:9s} {stat['ops_per_sec']:8.1f} ops/s   p50 {stat['p50_ms']:7.2f} ms   "
+                  f"p99 {stat['p99_ms']:7.2f} ms   failures {stat['failures']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'ops': args.ops,
+                    'concurrency': args.concurrency,
+                    'trace': args.trace,
+                    'python': platform.python_version(),
+                    'timestamp': int(time.time()),
+                },
+                'results': results,
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+        if regressions:
+            print(f"Regressions against {args.compare} (tolerance {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
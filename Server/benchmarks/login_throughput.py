@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+Wallet login load test
+
+Creates throwaway wallets and has them log in concurrently through the real
+nonce + signature endpoints (in-process Django test client, scratch database),
+then reports login throughput, latency and the database writes each login cost.
+
+Usage (from the Server directory):
+    python benchmarks/login_throughput.py --wallets 200 --concurrency 16 --rounds 3
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ehr.settings')
+
+import django
+from django.conf import settings
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--wallets', type=int, default=200, help='Distinct wallets logging in')
+    parser.add_argument('--concurrency', type=int, default=16, help='Logins in flight at once')
+    parser.add_argument('--rounds', type=int, default=3, help='Logins per wallet (the first one creates the user)')
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_login.sqlite3'),
+                        help='Scratch SQLite file (the database is recreated on every run)')
+    return parser.parse_args()
+
+
+class WriteCounter:
+    """Connection execute wrapper counting the write statements a login issues"""
+
+    def __init__(self):
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith(WRITE_STATEMENTS):
+            with self._lock:
+                self.writes += 1
+        return execute(sql, params, many, context)
+
+
+def login(client, account):
+    from eth_account import Account
+    from eth_account.messages import encode_defunct
+    from api.services.auth_nonce import AUTH_MESSAGE
+
+    started = time.perf_counter()
+    nonce = client.get(f'/api/auth/nonce/{account.address}/').json()['nonce']
+    signature = Account.sign_message(encode_defunct(text=AUTH_MESSAGE.format(nonce=nonce)), account.key).signature.hex()
+    response = client.post('/api/auth/authenticate/', {'address': account.address, 'signature': signature, 'nonce': nonce},
+                           content_type='application/json')
+    return response.status_code, (time.perf_counter() - started) * 1000
+
+
+def run_round(label, accounts, concurrency, counter):
+    from django.db import connection
+    from django.test import Client
+
+    local = threading.local()
+
+    def worker(account):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+            # Each thread has its own connection, so hook the counter per thread
+            connection.execute_wrappers.append(counter)
+        return login(local.client, account)
+
+    counter.writes = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, accounts))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for _, latency in results)
+    failures = sum(code != 200 for code, _ in results)
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+    print(f"{label:14s} {len(results) / elapsed:8.1f} logins/s   p50 {statistics.median(latencies):7.1f} ms   "
+          f"p95 {p95:7.1f} ms   writes/login {counter.writes / len(results):4.2f}   failures {failures}")
+
+
+def main():
+    args = parse_args()
+    # Always a scratch SQLite file, never the configured database: the run migrates and fills it
+    if os.path.abspath(args.db) == os.path.abspath(str(settings.DATABASES['default']['NAME'])):
+        sys.exit(f"{args.db} is the configured database; pass a scratch file with --db")
+    settings.DATABASES['default'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': args.db}
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    django.setup()
+
+    from django.core.management import call_command
+    from eth_account import Account
+
+    call_command('migrate', verbosity=0)
+    accounts = [Account.create() for _ in range(args.wallets)]
+    counter = WriteCounter()
+
+    print(f"{args.wallets} wallets, {args.concurrency} concurrent logins")
+    for round_number in range(args.rounds):
+        label = 'first login' if round_number == 0 else f"repeat #{round_number}"
+        run_round(label, accounts, args.concurrency, counter)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+SQLite read/write concurrency benchmark
+
+Runs reader threads listing doctors while writer threads update user rows in
+bursts (the write pattern of logins and session activity), once with SQLite's
+defaults (rollback journal) and once with the SQLITE_TUNING pragmas (WAL,
+synchronous=NORMAL, busy timeout, mmap and cache size), and reports how long
+reads stall behind the writes.
+
+Usage (from the Server directory):
+    python benchmarks/sqlite_concurrency.py --seconds 10 --readers 8 --writers 2
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ehr.settings')
+# Build the tuned pragmas from settings even when the tuning is not enabled in .env
+os.environ.setdefault('SQLITE_TUNING', 'true')
+
+import django
+from django.conf import settings
+
+STALL_MS = 50
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=10, help='Duration of each run')
+    parser.add_argument('--readers', type=int, default=8, help='Reader threads')
+    parser.add_argument('--writers', type=int, default=2, help='Writer threads')
+    parser.add_argument('--burst', type=int, default=50, help='Writes per burst')
+    parser.add_argument('--pause', type=float, default=0.05, help='Seconds between write bursts')
+    parser.add_argument('--rows', type=int, default=500, help='Doctors and users seeded')
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_sqlite.sqlite3'),
+                        help='Scratch SQLite file (the database is recreated for every run)')
+    return parser.parse_args()
+
+
+def reset_database(path, pragmas, rows):
+    from django.core.management import call_command
+    from django.db import connections
+    from api.models import BlockchainUser, Doctor
+
+    connections.close_all()
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    settings.SQLITE_PRAGMAS = pragmas
+    call_command('migrate', verbosity=0)
+    Doctor.objects.bulk_create(
+        Doctor(docID=f"D{i}", fName='Bench', lName=str(i), department='General') for i in range(rows)
+    )
+    BlockchainUser.objects.bulk_create(
+        BlockchainUser(address=f"0x{i:040x}", username=f"bench{i}") for i in range(rows)
+    )
+    connections.close_all()
+
+
+def run(args):
+    from django.db import connections, OperationalError
+    from django.utils import timezone
+    from api.models import BlockchainUser, Doctor
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    reads, writes = [], []
+    errors = {'read': 0, 'write': 0}
+
+    def reader():
+        try:
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    list(Doctor.objects.order_by('fName', 'lName')[:50])
+                except OperationalError:
+                    with lock:
+                        errors['read'] += 1
+                    continue
+                with lock:
+                    reads.append((time.perf_counter() - started) * 1000)
+        finally:
+            connections.close_all()
+
+    def writer():
+        try:
+            while not stop.is_set():
+                for _ in range(args.burst):
+                    started = time.perf_counter()
+                    try:
+                        BlockchainUser.objects.filter(pk=random.randint(1, args.rows)).update(last_login=timezone.now())
+                    except OperationalError:
+                        with lock:
+                            errors['write'] += 1
+                        continue
+                    with lock:
+                        writes.append((time.perf_counter() - started) * 1000)
+                time.sleep(args.pause)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer) for _ in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sorted(reads), sorted(writes), errors
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def main():
+    args = parse_args()
+    if settings.DATABASES['default']['ENGINE'] != 'django.db.backends.sqlite3':
+        sys.exit("This benchmark only applies to the SQLite backend")
+    settings.DATABASES['default']['NAME'] = args.db
+    tuned = dict(settings.SQLITE_PRAGMAS)
+    django.setup()
+
+    print(f"{args.readers} readers, {args.writers} writers x {args.burst}-write bursts, {args.seconds:g}s per run")
+    for label, pragmas in (('default', {}), ('tuned', tuned)):
+        reset_database(args.db, pragmas, args.rows)
+        reads, writes, errors = run(args)
+        stalled = sum(latency > STALL_MS for latency in reads) / len(reads) * 100
+        print(f"{label:8s} reads/s {len(reads) / args.seconds:8.0f}   read p50 {statistics.median(reads):6.2f} ms   "
+              f"p99 {percentile(reads, 0.99):7.2f} ms   max {reads[-1]:8.2f} ms   stalled >{STALL_MS}ms {stalled:5.1f}%   "
+              f"read errors {errors['read']}   writes/s {len(writes) / args.seconds:7.0f}   "
+              f"write p99 {percentile(writes, 0.99):7.2f} ms   write errors {errors['write']}")
+
+
+if __name__ == '__main__':
+    main()
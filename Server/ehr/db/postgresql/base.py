@@ -0,0 +1,141 @@
+"""
+PostgreSQL backend with per-request health checks and an optional in-process connection pool
+
+Selected by settings.py when DB_ENGINE=postgres. Extra keys read from the DATABASES entry:
+    HEALTH_CHECKS   ping a reused connection once per request before using it
+    POOL_SIZE       keep up to this many connections per process (0 disables the pool)
+    POOL_TIMEOUT    seconds to wait for a free pooled connection
+"""
+
+import time
+import queue
+import logging
+import threading
+
+from django.db.backends.postgresql import base
+
+logger = logging.getLogger('api')
+
+# Pooled connections idle longer than this are pinged before being handed out
+IDLE_CHECK_AFTER = 30
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Bounded LIFO pool of psycopg2 connections shared by every thread of the process"""
+
+    def __init__(self, connect, size, timeout):
+        self.connect = connect
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def get(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise base.Database.OperationalError(f"No database connection free after {self.timeout}s")
+        try:
+            while True:
+                try:
+                    connection, returned_at = self._idle.get_nowait()
+                except queue.Empty:
+                    return self.connect(), False
+                if connection.closed:
+                    continue
+                if time.monotonic() - returned_at > IDLE_CHECK_AFTER and not self._ping(connection):
+                    continue
+                return connection, True
+        except Exception:
+            self._slots.release()
+            raise
+
+    def put(self, connection):
+        try:
+            if not connection.closed:
+                if connection.get_transaction_status() != base.Database.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+                self._idle.put((connection, time.monotonic()))
+        except base.Database.Error:
+            logger.warning("Discarding a broken pooled database connection")
+            connection.close()
+        finally:
+            self._slots.release()
+
+    def _ping(self, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except base.Database.Error:
+            connection.close()
+            return False
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    @property
+    def pool(self):
+        size = int(self.settings_dict.get('POOL_SIZE') or 0)
+        if not size:
+            return None
+        if self.alias not in _pools:
+            with _pools_lock:
+                if self.alias not in _pools:
+                    conn_params = self.get_connection_params()
+                    _pools[self.alias] = ConnectionPool(
+                        lambda: base.Database.connect(**conn_params),
+                        size,
+                        float(self.settings_dict.get('POOL_TIMEOUT') or 10)
+                    )
+        return _pools[self.alias]
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        connection, reused = pool.get()
+        if not reused:
+            base.psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get('isolation_level', connection.isolation_level)
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def connect(self):
+        # A connection just opened (or handed out by the pool) needs no ping this request;
+        # set first, as connect() itself calls ensure_connection() before autocommit is on
+        self.health_check_done = True
+        super().connect()
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            pool.put(self.connection)
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None and
+            self.settings_dict.get('HEALTH_CHECKS') and
+            not self.health_check_done and
+            not self.in_atomic_block
+        ):
+            # Same idea as Django 4.1's CONN_HEALTH_CHECKS: drop a dead persistent connection
+            # before the request's first query instead of failing it
+            if not self.is_usable():
+                logger.warning(f"Database connection '{self.alias}' went away, reconnecting")
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        # Runs at the start and end of every request
+        self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 from datetime import timedelta
 
@@ -33,6 +34,7 @@ INSTALLED_APPS = [
     ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,6 +76,66 @@ DATABASES = {
     }
 }
 
+# SQLITE_TUNING=true applies these pragmas to every new SQLite connection (see api.signals).
+# WAL lets readers carry on while a write commits, and synchronous=NORMAL is still
+# crash-safe in WAL mode; only the last commits can be lost on power failure
+SQLITE_PRAGMAS = {}
+if os.getenv('SQLITE_TUNING', 'false').lower() in ('1', 'true', 'yes'):
+    SQLITE_PRAGMAS = {
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000')),  # ms
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),  # bytes
+        'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-65536')),  # negative means KiB
+    }
+
+# DB_ENGINE=postgres switches to PostgreSQL (needs psycopg2, see requirements-postgres.txt)
+if os.getenv('DB_ENGINE', 'sqlite') == 'postgres':
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '0'))
+    DATABASES['default'] = {
+        'ENGINE': 'ehr.db.postgresql',
+        'NAME': os.getenv('POSTGRES_DB', 'ehr'),
+        'USER': os.getenv('POSTGRES_USER', 'ehr'),
+        'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+        'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+        'PORT': os.getenv('POSTGRES_PORT', '5432'),
+        # Pooled connections go back to the pool after each request instead of being kept open
+        'CONN_MAX_AGE': 0 if DB_POOL_SIZE else int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'HEALTH_CHECKS': os.getenv('DB_HEALTH_CHECKS', 'true').lower() in ('1', 'true', 'yes'),
+        'POOL_SIZE': DB_POOL_SIZE,
+        'POOL_TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        'OPTIONS': {
+            'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5')),
+        },
+    }
+
+# Cache
+# Local memory by default, which is per process; point CACHE_REDIS_URL at any Redis-compatible
+# server to share cached responses and invalidations between workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ehr',
+    },
+    # Cache version counters (see api.cache) and spent login nonces. Culling a counter would
+    # restart it at 1 and bring back entries built on the old value, and culling a nonce
+    # would let it be replayed, so this cache is never culled
+    'state': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ehr-state',
+        'OPTIONS': {'MAX_ENTRIES': sys.maxsize},
+    },
+}
+if os.getenv('CACHE_REDIS_URL'):
+    # Version counters have no timeout, so Redis only evicts them under an allkeys-* maxmemory-policy
+    CACHES['default'] = CACHES['state'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_REDIS_URL'),
+    }
+
+# Seconds a cached API response stays valid when no write invalidates it first
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', '300'))
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -90,12 +152,25 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# Seconds an authenticated user stays cached between requests (see api.authentication)
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv('AUTH_USER_CACHE_TIMEOUT', '60'))
+
+# Bearer token Prometheus sends to scrape /metrics; when unset only admin access tokens can
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Blockchain settings
+# 'sync' waits for each transaction receipt inside the request, 'async' returns the
+# transaction hash right away and lets the receipt tracker confirm the row later
+BLOCKCHAIN_SUBMIT_MODE = os.getenv('BLOCKCHAIN_SUBMIT_MODE', 'sync')
+# Attach a per-RPC timing breakdown to create/complete results and responses; off unless asked for
+RPC_TRACE_ENABLED = os.getenv('RPC_TRACE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
 # Authentication settings
 AUTH_USER_MODEL = 'api.BlockchainUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
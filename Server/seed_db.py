@@ -4,9 +4,9 @@ from api.models import Doctor, Patient, Appointment
 
 # Clear existing data
 print("Clearing existing data...")
+Appointment.objects.all().delete()
 Doctor.objects.all().delete()
 Patient.objects.all().delete()
-Appointment.objects.all().delete()
 
 # Create doctors
 print("Creating doctors...")
@@ -131,21 +131,30 @@ display_time_slots = [
 
 appointments = []
 
+# The specific test appointments below take these slots
+fixed_slots = {
+    (doctor.id, (today + timedelta(days=i+1)).strftime('%Y-%m-%d'), '10:00')
+    for i, doctor in enumerate(doctor_objects[:3])
+}
+
+# A doctor has one appointment per slot, so draw 20 distinct (doctor, date, time) combinations
+free_slots = [
+    (doctor, appointment_date, appointment_time)
+    for doctor in doctor_objects
+    for appointment_date in appointment_dates
+    for appointment_time in time_slots
+    if (doctor.id, appointment_date, appointment_time) not in fixed_slots
+]
+
 # Create 20 random appointments
-for i in range(1, 21):
-    doctor = random.choice(doctor_objects)
+for doctor, appointment_date, appointment_time in random.sample(free_slots, 20):
     patient = random.choice(patient_objects)
-    appointment_date = random.choice(appointment_dates)
-    time_index = random.randint(0, len(time_slots) - 1)
     
     appointment = Appointment.objects.create(
         date=appointment_date,
-        department=doctor.department,
-        docID=doctor.docID,
-        docName=f"{doctor.fName} {doctor.lName}",
-        patID=patient.patID,
-        patName=patient.patName,
-        time=time_slots[time_index],  # Use 24-hour format for database
+        doctor=doctor,
+        patient=patient,
+        time=appointment_time,  # Use 24-hour format for database
         status=random.choice([True, True, True, False])  # 75% chance of active appointments
     )
     appointments.append(appointment)
@@ -157,11 +166,8 @@ for i, doctor in enumerate(doctor_objects[:3]):
     
     appointment = Appointment.objects.create(
         date=appointment_date,
-        department=doctor.department,
-        docID=doctor.docID,
-        docName=f"{doctor.fName} {doctor.lName}",
-        patID=patient.patID,
-        patName=patient.patName,
+        doctor=doctor,
+        patient=patient,
         time='10:00',  # Use 24-hour format for database
         status=True
     )